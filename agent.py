@@ -1,37 +1,69 @@
-import os
-import openai
 import streamlit
-from dotenv import find_dotenv, load_dotenv
 from langchain.agents import AgentExecutor, ZeroShotAgent
 from langchain.chains import LLMChain
 
-from prompts import PREFIX, SUFFIX
+import settings
+from chains import ChainSet
+from prompts import PREFIX, SUFFIX, budgeted_prompt
+from router import IntentRouter
 from tools import get_tools
+from tracing import log_info
 
-_ = load_dotenv(find_dotenv())  # read local .env file
-openai.api_key = os.environ["OPENAI_API_KEY"]
 
+class AgentRegistry:
+    """
+    The AgentRegistry class builds the chains, the tools, the agent and the intent router of one session once.
+    It is kept in session state, so Streamlit reruns reuse the same objects.
+
+    :doc-author: Yusuf
+    """
+
+    def __init__(self, llm, memory, config_prompt):
+        self.llm = llm
+        self.memory = memory
+        self.chains = ChainSet(llm, memory, config_prompt)
+        self.tools = get_tools(self.chains)
+        input_variables = ["input", "chat_history", "agent_scratchpad"]
+        # The conversation summary is sent on every ReAct step, so it is kept within PROMPT_HISTORY_TOKENS
+        agent_prompt = budgeted_prompt(
+            "agent",
+            ZeroShotAgent.create_prompt(
+                tools=self.tools,
+                prefix=PREFIX,
+                suffix=SUFFIX,
+                input_variables=input_variables,
+            ).template,
+            input_variables,
+        )
+        llm_chain = LLMChain(llm=llm, prompt=agent_prompt)
+        agent = ZeroShotAgent(llm_chain=llm_chain, tools=self.tools)
+        self.agent_chain = AgentExecutor.from_agent_and_tools(
+            agent=agent,
+            tools=self.tools,
+            memory=memory,
+            verbose=settings.VERBOSE,
+        )
+        self.router = IntentRouter(self.tools, self.agent_chain, memory)
 
 
 def get_agent():
     """
-    The get_agent function is a helper function that creates an AgentExecutor object.
-    
-    :return: The agent_chain
+    The get_agent function is a helper function that returns the IntentRouter of the session.
+    The router runs structured requests directly with their tool and hands everything else to the AgentExecutor.
+    The agent is built on the first call only. Later calls reuse it, and a config change only rebuilds
+    the prompts that contain the config prompt. The agent prompt itself does not depend on the config.
+
+    :return: The IntentRouter object
     :doc-author: Yusuf
     """
-    agent_prompt = ZeroShotAgent.create_prompt(
-        tools=get_tools(),
-        prefix=PREFIX,
-        suffix=SUFFIX,
-        input_variables=["input", "chat_history", "agent_scratchpad"],
-    )
-    llm_chain = LLMChain(llm=streamlit.session_state["llm"], prompt=agent_prompt)
-    agent = ZeroShotAgent(llm_chain=llm_chain, tools=get_tools())
-    agent_chain = AgentExecutor.from_agent_and_tools(
-        agent=agent,
-        tools=get_tools(),
-        memory=streamlit.session_state["memory"],
-        verbose=True,
-    )
-    return agent_chain
+    llm = streamlit.session_state["llm"]
+    memory = streamlit.session_state["memory"]
+    config_prompt = streamlit.session_state.get("config_prompt", "")
+    registry = streamlit.session_state.get("agent_registry")
+    if registry is None or registry.llm is not llm or registry.memory is not memory:
+        log_info("Building agent")
+        registry = AgentRegistry(llm, memory, config_prompt)
+        streamlit.session_state["agent_registry"] = registry
+    elif registry.chains.update_config(config_prompt):
+        log_info("Config prompt changed, prompts are rebuilt")
+    return registry.router
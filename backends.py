@@ -0,0 +1,300 @@
+import hashlib
+import io
+import json
+import re
+import time
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from PIL import Image
+
+import settings
+from tokens import count_tokens
+
+
+def _seed(text):
+    return int(hashlib.sha256(text.encode("utf-8")).hexdigest(), 16)
+
+
+def fake_curriculum(topic, prompt):
+    """
+    The fake_curriculum function returns a well-formed curriculum: modules separated by '$$$',
+    with two submodules each. The number of modules follows the time preference of the config prompt.
+
+    :param topic: The topic that user wants to learn
+    :param prompt: The rendered curriculum prompt
+    :return: The curriculum string
+    :doc-author: Yusuf
+    """
+    module_count = 2 if "a Short time" in prompt else 4 if "a Long time" in prompt else 3
+    modules = []
+    for number in range(1, module_count + 1):
+        modules.append(
+            f"""# Module {number}: **{topic.capitalize()}** part {number}
+###### Directions: Learn step {number} of {topic}.
+## :pushpin: Submodule {number}.a: Ingredients for step {number}
+###### Directions: Prepare what step {number} needs.
+## :pushpin: Submodule {number}.b: Technique of step {number}
+###### Directions: Practise the technique of step {number}."""
+        )
+    return "\n\n$$$\n\n".join(modules)
+
+
+def fake_quiz(module_content, question_count=3):
+    """
+    The fake_quiz function returns a well-formed quiz: questions separated by '####', each with
+    a question, a list of four options, the answer and an explanation.
+
+    :param module_content: The module content the quiz is about
+    :param question_count: Number of questions
+    :return: The quiz string
+    :doc-author: Yusuf
+    """
+    seed = _seed(module_content)
+    questions = []
+    for number in range(1, question_count + 1):
+        options = [f"Option {number}{letter}" for letter in "ABCD"]
+        answer = options[(seed >> number) % 4]
+        questions.append(
+            f"""- "Question {number}: which option is right about this module?"
+- {json.dumps(options)}
+- "Answer: {answer}"
+- "{answer} is right because the module says so." """
+        )
+    return "\n####\n".join(questions)
+
+
+def fake_flashcards(module_content, card_count=5):
+    words = re.findall(r"[A-Za-z]{5,}", module_content) or ["Cooking"]
+    seed = _seed(module_content)
+    return " #### ".join(
+        words[(seed >> index) % len(words)].capitalize() for index in range(card_count)
+    )
+
+
+def fake_module_content(prompt):
+    titles = re.findall(r"(?:Module|Submodule) [\w.]+: [^\n]+", prompt)
+    body = "\n\n".join(
+        f"### {title}\nThis part explains {title.split(':', 1)[1].strip()} step by step. "
+        "Heat the pan, season well and rest the meat before serving."
+        for title in titles
+    )
+    return body or "This module explains the topic step by step."
+
+
+def fake_bundle(prompt, question_count=3):
+    """
+    The fake_bundle function returns a well-formed module bundle (see bundle.BUNDLE_SCHEMA) as JSON.
+
+    :param prompt: The rendered bundle prompt
+    :param question_count: Number of quiz questions
+    :return: The bundle string
+    :doc-author: Yusuf
+    """
+    module_content = fake_module_content(prompt)
+    seed = _seed(module_content)
+    quiz = []
+    for number in range(1, question_count + 1):
+        options = [f"Option {number}{letter}" for letter in "ABCD"]
+        answer = options[(seed >> number) % 4]
+        quiz.append(
+            {
+                "question": f"Question {number}: which option is right about this module?",
+                "options": options,
+                "answer": answer,
+                "explanation": f"{answer} is right because the module says so.",
+            }
+        )
+    return json.dumps(
+        {
+            "module_content": module_content,
+            "flashcards": fake_flashcards(module_content).split(" #### "),
+            "quiz": quiz,
+            "key_content": "Key elements: "
+            + " ".join(re.findall(r"[A-Za-z]{6,}", module_content)[-8:]),
+        }
+    )
+
+
+def fake_agent_step(question):
+    """
+    The fake_agent_step function answers a ZeroShotAgent prompt with the tool a reasonable agent would pick.
+
+    :param question: The user input of the agent prompt
+    :return: The Thought/Action/Action Input text of the agent step
+    :doc-author: Yusuf
+    """
+    module = re.search(r"module\s*(\d+)", question, re.IGNORECASE)
+    lowered = question.lower()
+    if module and ("proceed" in lowered or "teach" in lowered):
+        action, action_input = "module_content", f"{module.group(1)}##"
+    elif module and ("evaluate" in lowered or "quiz" in lowered):
+        action, action_input = "evaluation", module.group(1)
+    elif "analy" in lowered:
+        action, action_input = "analyze", ""
+    elif "cook" in lowered or "learn" in lowered:
+        action, action_input = "generate_curriculum", question.strip()
+    elif question.strip().endswith("?"):
+        action, action_input = "answer_user_question", question.strip()
+    else:
+        action, action_input = "chat", question.strip()
+    return f"Thought: The user input fits {action}.\nAction: {action}\nAction Input: {action_input}"
+
+
+def fake_completion(prompt):
+    """
+    The fake_completion function returns a deterministic answer for every prompt of the app.
+    The kind of prompt is recognized by the instructions it contains.
+
+    :param prompt: The rendered prompt
+    :return: The answer
+    :doc-author: Yusuf
+    """
+    if "Action Input:" in prompt and "Question:" in prompt:
+        question = prompt.rsplit("Question:", 1)[1].split("\n", 1)[0]
+        scratchpad = prompt.rsplit("Question:", 1)[1]
+        if "Observation:" in scratchpad:
+            return "Thought: I now know the final answer\nFinal Answer: Done."
+        return fake_agent_step(question)
+    if "Return one JSON object" in prompt:
+        return fake_bundle(prompt)
+    if "Create a curriculum for" in prompt:
+        topic = re.search(r"learn how to cook (.+?), your", prompt)
+        return fake_curriculum(topic.group(1) if topic else "the dish", prompt)
+    if "Single-Choice-Questions" in prompt:
+        return fake_quiz(prompt)
+    if "flashcard creator" in prompt:
+        content = prompt.split("Module content:", 1)[-1]
+        return fake_flashcards(content)
+    if "extract the key elements" in prompt:
+        return "Key elements: " + " ".join(re.findall(r"[A-Za-z]{6,}", prompt)[-8:])
+    if "Act as a reviewer" in prompt:
+        return "## Report for User\nUser did well overall. Review the wrong answers below and try the quiz again."
+    if "Generate content for the following curriculum" in prompt:
+        return fake_module_content(prompt)
+    if "Progressively summarize" in prompt:
+        return "The user is learning to cook with the assistant."
+    if "answer the user's question" in prompt:
+        question = prompt.split("User question:", 1)[-1].split("\n", 1)[0].strip()
+        return f"Here is a detailed answer to '{question}': take your time and follow the module steps."
+    return "I am a fake model and this is my deterministic answer."
+
+
+class FakeTeacherChatModel(BaseChatModel):
+    """
+    The FakeTeacherChatModel class is an offline chat model that returns deterministic, well-formed answers
+    for every prompt of the app, after a configurable artificial latency.
+
+    :doc-author: Yusuf
+    """
+
+    latency: float = 0.0
+    token_latency: float = 0.0
+    streaming: bool = False
+    # Object with an acquire() function, called where GatewayChatModel would send a request
+    request_limiter: Any = None
+
+    @property
+    def _llm_type(self):
+        return "fake-teacher-chat"
+
+    @property
+    def _identifying_params(self):
+        return {"model_name": "fake-teacher"}
+
+    def get_num_tokens(self, text):
+        return count_tokens(text)
+
+    def _answer(self, messages):
+        return fake_completion("\n".join(str(message.content) for message in messages))
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ):
+        if self.streaming:
+            text = "".join(
+                chunk.message.content
+                for chunk in self._stream(messages, stop, run_manager, **kwargs)
+            )
+        else:
+            if self.request_limiter is not None:
+                self.request_limiter.acquire()
+            time.sleep(self.latency)
+            text = self._answer(messages)
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=text))],
+            llm_output={"token_usage": {}, "model_name": "fake-teacher"},
+        )
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.request_limiter is not None:
+            self.request_limiter.acquire()
+        time.sleep(self.latency)
+        for token in re.split(r"(\s+)", self._answer(messages)):
+            time.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+class FakeImageModel:
+    """
+    The FakeImageModel class returns a deterministic single-color PNG instead of calling DALL-E.
+
+    :doc-author: Yusuf
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def generate_image(self, prompt, size="1024x1024", quality="standard"):
+        time.sleep(self.latency)
+        width, height = (int(side) for side in size.split("x"))
+        color = f"#{_seed(prompt) % 0xFFFFFF:06x}"
+        buffer = io.BytesIO()
+        Image.new("RGB", (width, height), color).save(buffer, format="PNG")
+        return buffer.getvalue()
+
+
+def get_chat_model(model_name, temperature, streaming):
+    """
+    The get_chat_model function returns the chat model of the backend selected with TEACHER_BACKEND.
+
+    :param model_name: Name of the OpenAI model
+    :param temperature: Sampling temperature
+    :param streaming: Stream tokens to the callbacks
+    :return: A LangChain chat model
+    :doc-author: Yusuf
+    """
+    if settings.MODEL_BACKEND == "fake":
+        return FakeTeacherChatModel(
+            latency=settings.FAKE_LLM_LATENCY_SECONDS,
+            token_latency=settings.FAKE_LLM_TOKEN_LATENCY_SECONDS,
+            streaming=streaming,
+        )
+    from model_client import GatewayChatModel
+
+    return GatewayChatModel(
+        model_name=model_name, temperature=temperature, streaming=streaming
+    )
+
+
+def get_image_model():
+    """
+    The get_image_model function returns the image model of the backend selected with TEACHER_BACKEND.
+
+    :return: An object with a generate_image(prompt, size, quality) function that returns the image bytes
+    :doc-author: Yusuf
+    """
+    if settings.MODEL_BACKEND == "fake":
+        return FakeImageModel(latency=settings.FAKE_IMAGE_LATENCY_SECONDS)
+    from model_client import get_gateway
+
+    return get_gateway()
@@ -0,0 +1,78 @@
+"""
+Compare the model calls of one module with separate chains and with a single bundle call.
+
+Separate chains: teach, flashcards, image key content and quiz, three of them re-sending the module content.
+Bundle: one JSON call that is validated and fanned out locally. Input tokens are counted on the rendered
+prompts with tokens.count_tokens, the model latency is simulated with FAKE_LLM_LATENCY_SECONDS.
+
+    python benchmarks/bench_bundle.py --latency 0.5
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+os.chdir(ROOT)
+os.environ["TEACHER_BACKEND"] = "fake"
+os.environ.setdefault("TEACHER_VERBOSE", "0")
+os.environ.setdefault("TEACHER_CACHE_DIR", tempfile.mkdtemp(prefix="teacher-bench-"))
+
+from langchain.chains import LLMChain
+from langchain_core.callbacks import BaseCallbackHandler
+
+import settings
+from backends import FakeTeacherChatModel, fake_curriculum
+from bundle import parse_bundle
+from prompts import build_config_prompt, get_config_prompts, get_static_prompts
+from tokens import count_tokens
+from tools import create_bundle, create_flashcards, create_quiz, teach_module
+
+
+class CallCounter(BaseCallbackHandler):
+    def __init__(self):
+        self.calls = 0
+        self.input_tokens = 0
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.calls += 1
+        self.input_tokens += sum(
+            count_tokens(str(message.content)) for batch in messages for message in batch
+        )
+
+
+def separate(llm, prompts, module):
+    _, _, module_prompt, evaluation_prompt, flashcard_prompt, _ = prompts
+    _, extract_prompt = get_static_prompts()
+    content = teach_module(llm, module_prompt, module, "")
+    create_flashcards(llm, flashcard_prompt, content)
+    LLMChain(llm=llm, prompt=extract_prompt).run({"module_content": content})
+    create_quiz(llm, evaluation_prompt, content)
+
+
+def bundled(llm, prompts, module):
+    parse_bundle(1, create_bundle(llm, prompts[-1], module, ""))
+
+
+def measure(mode, latency):
+    counter = CallCounter()
+    llm = FakeTeacherChatModel(latency=latency, callbacks=[counter])
+    config = build_config_prompt(("Beginner", "All World", "Medium", "Image-Containing", "English"))
+    prompts = get_config_prompts(config)
+    module = fake_curriculum("steak", config).split("$$$")[0].strip()
+    started = time.perf_counter()
+    mode(llm, prompts, module)
+    return counter.calls, counter.input_tokens, time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--latency", type=float, default=0.5)
+    args = parser.parse_args()
+    settings.BUNDLE_MODE = "json"
+    print(f"{'mode':>10}{'calls':>7}{'input tokens':>14}{'seconds':>9}")
+    for name, mode in (("separate", separate), ("bundle", bundled)):
+        calls, tokens, seconds = measure(mode, args.latency)
+        print(f"{name:>10}{calls:>7}{tokens:>14}{seconds:>9.2f}")
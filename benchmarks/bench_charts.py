@@ -0,0 +1,97 @@
+"""
+Measure rerun time and memory while quiz analyses accumulate in the chat history.
+
+Every analysis message in history shows the quiz result charts. The app is rerun headless after
+each new analysis, once with the memoized charts and once with the chart cache cleared before every
+rerun (every chart is drawn again, as before memoization). Rerun time and RSS are reported.
+
+    python benchmarks/bench_charts.py --analyses 40 --step 10
+"""
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+os.chdir(ROOT)
+os.environ["TEACHER_BACKEND"] = "fake"
+os.environ.setdefault("TEACHER_VERBOSE", "0")
+# Render the whole seeded history, the benchmark is about the cost per rendered message
+os.environ.setdefault("HISTORY_FULL_MESSAGES", "100000")
+os.environ.setdefault("TEACHER_CACHE_DIR", tempfile.mkdtemp(prefix="teacher-bench-"))
+
+from streamlit.testing.v1 import AppTest
+
+from utils import render_quiz_chart
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def analysis_message(number):
+    scores = [
+        {
+            "correct_answer_count": (number + module) % 4,
+            "total_questions": 3,
+            "module_title": f"Module {module + 1}: **Steak** attempt {number}",
+        }
+        for module in range(3)
+    ]
+    total = {
+        "correct_answer_count": sum(score["correct_answer_count"] for score in scores),
+        "total_questions": 9,
+    }
+    return {"role": "assistant", "analysis": f"Report {number}", "scores": scores, "total": total}
+
+
+def run(analyses, step, memoized):
+    """
+    The run function adds analyses to the history one by one and reruns the app after each of them.
+
+    :param analyses: Number of analyses at the end
+    :param step: Report every step analyses
+    :param memoized: Keep the chart cache between reruns
+    :return: A list of (analyses, rerun seconds, RSS MB) tuples
+    :doc-author: Yusuf
+    """
+    render_quiz_chart.clear()
+    app = AppTest.from_file("main.py", default_timeout=300)
+    app.run()
+    rows = []
+    for number in range(1, analyses + 1):
+        app.session_state["messages"] = app.session_state["messages"] + [
+            analysis_message(number)
+        ]
+        if not memoized:
+            render_quiz_chart.clear()
+        started = time.perf_counter()
+        app.run()
+        duration = time.perf_counter() - started
+        if app.exception:
+            raise RuntimeError(app.exception[0].message)
+        if number % step == 0:
+            rows.append((number, duration, rss_mb()))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--analyses", type=int, default=40)
+    parser.add_argument("--step", type=int, default=10)
+    args = parser.parse_args()
+    for memoized in (True, False):
+        print("\nmemoized charts" if memoized else "\ncharts drawn on every rerun")
+        print(f"{'analyses':>9}{'rerun ms':>10}{'RSS MB':>9}")
+        for number, duration, rss in run(args.analyses, args.step, memoized):
+            print(f"{number:>9}{duration * 1000:>10.1f}{rss:>9.1f}")
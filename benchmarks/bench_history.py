@@ -0,0 +1,66 @@
+"""
+Measure rerun time while the chat history grows, with windowed rendering and with every message rendered.
+
+The history is seeded with module requests and long module texts, as in a long learning session.
+Windowed rendering shows the last HISTORY_FULL_MESSAGES messages fully and older ones as stubs.
+
+    python benchmarks/bench_history.py --messages 25 50 100 200
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+os.chdir(ROOT)
+os.environ["TEACHER_BACKEND"] = "fake"
+os.environ.setdefault("TEACHER_VERBOSE", "0")
+os.environ.setdefault("TEACHER_CACHE_DIR", tempfile.mkdtemp(prefix="teacher-bench-"))
+
+from streamlit.testing.v1 import AppTest
+
+import settings
+
+MODULE_TEXT = "\n\n".join(
+    f"### Submodule {number}\n" + "Heat the pan, season well and rest the meat before serving. " * 20
+    for number in range(1, 6)
+)
+
+
+def history(count):
+    messages = []
+    for number in range(count // 2):
+        messages.append({"role": "user", "content": f"Proceed to module {number + 1}"})
+        messages.append({"role": "assistant", "content": f"# Module {number + 1}\n{MODULE_TEXT}"})
+    return messages
+
+
+def rerun_time(count, repeats=5):
+    app = AppTest.from_file("main.py", default_timeout=120)
+    app.session_state["messages"] = history(count)
+    app.run()
+    durations = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        app.run()
+        durations.append(time.perf_counter() - started)
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+    return sorted(durations)[len(durations) // 2]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, nargs="+", default=[25, 50, 100, 200])
+    args = parser.parse_args()
+    windowed_full = settings.HISTORY_FULL_MESSAGES
+    print(f"{'messages':>9}{'windowed ms':>13}{'all full ms':>13}")
+    for count in args.messages:
+        # render_history reads the settings on every rerun
+        settings.HISTORY_FULL_MESSAGES = windowed_full
+        windowed = rerun_time(count)
+        settings.HISTORY_FULL_MESSAGES = count
+        full = rerun_time(count)
+        print(f"{count:>9}{windowed * 1000:>13.1f}{full * 1000:>13.1f}")
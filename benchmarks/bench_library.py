@@ -0,0 +1,54 @@
+"""
+Measure a learning session served from the pre-warmed shared library against one generated from scratch.
+
+Requests for two popular topics are recorded, then prewarm.py generates their curricula, modules, flashcards
+and quizzes. The response cache is cleared afterwards, so the warm session is served by the library alone.
+The cold session asks for a topic nobody asked for before. Model calls take FAKE_LLM_LATENCY_SECONDS.
+
+    python benchmarks/bench_library.py --latency 0.3
+"""
+import argparse
+import os
+import sys
+import tempfile
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+os.environ["TEACHER_BACKEND"] = "fake"
+os.environ.setdefault("TEACHER_VERBOSE", "0")
+os.environ.setdefault("TEACHER_CACHE_DIR", tempfile.mkdtemp(prefix="teacher-bench-"))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--latency", type=float, default=0.3)
+    args = parser.parse_args()
+    os.environ["FAKE_LLM_LATENCY_SECONDS"] = str(args.latency)
+
+    import settings
+    from bench_sessions import replay_session, report
+    from cache import get_response_cache
+    from curriculum_store import get_curriculum_store
+    from prewarm import prewarm
+
+    # The first option of every config box, as selected when the app starts
+    default_configs = [options[0] for options in settings.CONFIG_OPTIONS.values()]
+    store = get_curriculum_store()
+    for topic, requests in (("how to cook a steak?", 50), ("how to cook ramen?", 20)):
+        for _ in range(requests):
+            store.record_request(topic, default_configs)
+
+    cold, cold_tools = defaultdict(list), defaultdict(list)
+    replay_session("how to cook pasta?", cold, cold_tools)
+    for topic, configs, requests, generated, seconds in prewarm(2, 2):
+        print(f"prewarmed {topic} ({requests} requests): {generated} parts in {seconds:.1f}s")
+    get_response_cache().clear()
+    warm, warm_tools = defaultdict(list), defaultdict(list)
+    replay_session("How to cook a steak?", warm, warm_tools)
+
+    report("cold rerun", cold)
+    report("warm rerun", warm)
+    report("cold tool", cold_tools)
+    report("warm tool", warm_tools)
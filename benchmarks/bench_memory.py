@@ -0,0 +1,83 @@
+"""
+Measure the latency conversation memory adds to every turn of a learning session.
+
+The session saves a curriculum, module contents, quizzes and short answers, as the tools do.
+ConversationSummaryBufferMemory summarizes inside save_context once its buffer overflows, the
+BackgroundSummaryMemory summarizes on a worker and keeps long texts out of the buffer as artifacts.
+The summarization call takes FAKE_LLM_LATENCY_SECONDS (--latency).
+
+    python benchmarks/bench_memory.py --turns 30 --latency 1.0
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+os.chdir(ROOT)
+os.environ["TEACHER_BACKEND"] = "fake"
+os.environ.setdefault("TEACHER_VERBOSE", "0")
+os.environ.setdefault("TEACHER_CACHE_DIR", tempfile.mkdtemp(prefix="teacher-bench-"))
+
+from langchain.memory import ConversationSummaryBufferMemory
+
+from backends import FakeTeacherChatModel, fake_curriculum, fake_quiz
+from memory import BackgroundSummaryMemory
+from tokens import count_tokens
+
+MODULE_TEXT = "\n\n".join(
+    f"### Submodule {number}\n" + "Heat the pan, season well and rest the meat before serving. " * 12
+    for number in range(1, 5)
+)
+
+
+def turns(count):
+    yield "how to cook a steak?", fake_curriculum("steak", "")
+    for number in range(1, count):
+        if number % 3 == 1:
+            yield f"Proceed to module {number // 3 + 1}", f"# Module {number // 3 + 1}\n{MODULE_TEXT}"
+        elif number % 3 == 2:
+            yield f"Evaluate me on module {number // 3 + 1}", fake_quiz(f"module {number}")
+        else:
+            yield "Why should the meat rest?", "Resting lets the juices settle, so they stay in the meat."
+
+
+def run(memory, count):
+    saves, loads = [], []
+    for user_input, output in turns(count):
+        started = time.perf_counter()
+        memory.load_memory_variables({})
+        loads.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        memory.save_context({"input": user_input}, {"output": output})
+        saves.append(time.perf_counter() - started)
+    if isinstance(memory, BackgroundSummaryMemory):
+        memory.wait_for_summary()
+    history = memory.load_memory_variables({})["chat_history"]
+    return sorted(saves), sorted(loads), count_tokens(history)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--buffer-tokens", type=int, default=2000)
+    args = parser.parse_args()
+    llm = FakeTeacherChatModel(latency=args.latency)
+    memories = {
+        "summary buffer": ConversationSummaryBufferMemory(
+            llm=llm, memory_key="chat_history", max_token_limit=args.buffer_tokens
+        ),
+        "background": BackgroundSummaryMemory(
+            llm=llm, memory_key="chat_history", max_token_limit=args.buffer_tokens
+        ),
+    }
+    print(f"{'memory':>15}{'save p50 ms':>13}{'save max ms':>13}{'save total s':>14}{'load max ms':>13}{'history tokens':>16}")
+    for name, memory in memories.items():
+        saves, loads, tokens = run(memory, args.turns)
+        print(
+            f"{name:>15}{saves[len(saves) // 2] * 1000:>13.2f}{saves[-1] * 1000:>13.2f}"
+            f"{sum(saves):>14.2f}{loads[-1] * 1000:>13.2f}{tokens:>16}"
+        )
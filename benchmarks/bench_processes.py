@@ -0,0 +1,197 @@
+"""
+Measure session throughput of one server process against several that share the state backend.
+
+Every worker process runs main.py headless with streamlit.testing, like one Streamlit server process.
+Scripted sessions (topic -> every module -> its quiz -> answers -> analysis) are spread over the workers:
+with --routing sticky a session stays on its worker, with --routing any every user action is sent to the
+next worker round-robin and opens a new Streamlit session there, as after a reconnect through a load balancer
+without session affinity. The session continues from the state backend (--backend sqlite or resp, the resp
+backend runs against the stand-in of state_server.py). Model calls take FAKE_LLM_LATENCY_SECONDS (--latency).
+
+    python benchmarks/bench_processes.py --processes 1 4 --sessions 8 --backend sqlite --routing any
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+
+DISHES = ["steak", "ramen", "pasta", "risotto", "paella", "curry", "tacos", "dumplings"]
+
+
+def perform(app, action):
+    kind, index = action
+    if kind == "topic":
+        app.chat_input[0].set_value(index)
+    elif kind == "module":
+        app.button(key=f"module_button_{index}").click()
+    elif kind == "quiz":
+        app.button(key=f"quiz_button_{index}").click()
+    elif kind == "answers":
+        from quiz import make_quiz_id
+
+        app.button(key=f"submit_{make_quiz_id(app.session_state['curriculum_id'], index + 1)}").click()
+    elif kind == "analyse":
+        app.button(key="green_button").click()
+    app.run()
+    if app.exception:
+        raise RuntimeError(f"{kind} {index}: {app.exception[0].message}")
+
+
+def worker(number, jobs, results):
+    """
+    The worker function is one server process: it runs the actions it is sent and reports their duration.
+
+    :param number: Number of the worker
+    :param jobs: Queue of (session id, action, keep session) tuples, None stops the worker
+    :param results: Queue the results are put into
+    :doc-author: Yusuf
+    """
+    # Errors come back through the result queue, the log lines of the app are not needed
+    sys.stdout = sys.stderr = open(os.devnull, "w")
+    from streamlit.testing.v1 import AppTest
+
+    def open_session(state_id):
+        app = AppTest.from_file("main.py", default_timeout=120)
+        app.query_params["sid"] = state_id
+        app.run()
+        return app
+
+    # The first script run imports the app, it is not part of the measurement
+    open_session(f"warmup-{number}")
+    results.put(("ready", number))
+    apps = {}
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        state_id, action, keep = job
+        started = time.perf_counter()
+        try:
+            app = apps.pop(state_id, None) or open_session(state_id)
+            perform(app, action)
+            modules = len(app.session_state["curriculum"]) if action[0] == "topic" else None
+            done = len(app.session_state["quiz_results"]) if action[0] == "analyse" else None
+        except Exception as e:
+            results.put(("error", number, state_id, action, repr(e)))
+            continue
+        if keep:
+            apps[state_id] = app
+        results.put(("done", number, state_id, action, time.perf_counter() - started, modules, done))
+
+
+def run(processes, sessions, routing):
+    """
+    The run function plays the sessions on a number of worker processes.
+
+    :param processes: Number of worker processes
+    :param sessions: Number of sessions, all of them run at the same time
+    :param routing: "sticky" or "any"
+    :return: A tuple of seconds, action durations by kind and the list of errors
+    :doc-author: Yusuf
+    """
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    queues = [context.Queue() for _ in range(processes)]
+    workers = [
+        context.Process(target=worker, args=(number, queues[number], results), daemon=True)
+        for number in range(processes)
+    ]
+    for process in workers:
+        process.start()
+    for _ in workers:
+        results.get()
+
+    run_id = f"{processes}{routing}{time.time_ns()}"
+    plans, module_counts = {}, {}
+    next_worker = [0]
+
+    def send(state_id):
+        action = plans[state_id].pop(0)
+        if routing == "sticky":
+            target = int(state_id.rsplit("-", 1)[1]) % processes
+        else:
+            target = next_worker[0] % processes
+            next_worker[0] += 1
+        queues[target].put((state_id, action, routing == "sticky"))
+
+    durations, errors = defaultdict(list), []
+    started = time.perf_counter()
+    for number in range(sessions):
+        state_id = f"{run_id}-{number}"
+        topic = f"how to cook {DISHES[number % len(DISHES)]} for {number + 2} people?"
+        plans[state_id] = [("topic", topic)]
+        send(state_id)
+    running = sessions
+    while running:
+        message = results.get()
+        if message[0] == "error":
+            errors.append(message[1:])
+            running -= 1
+            continue
+        _, _, state_id, action, seconds, modules, done = message
+        durations[action[0]].append(seconds)
+        if modules is not None:
+            module_counts[state_id] = modules
+            for index in range(modules):
+                plans[state_id] += [("module", index), ("quiz", index), ("answers", index)]
+            plans[state_id].append(("analyse", None))
+        # Every quiz must be in the results, whichever process took the answers
+        if done is not None and done != module_counts[state_id]:
+            errors.append((state_id, f"{done} of {module_counts[state_id]} quiz results"))
+        if plans[state_id]:
+            send(state_id)
+        else:
+            running -= 1
+    seconds = time.perf_counter() - started
+    for queue in queues:
+        queue.put(None)
+    for process in workers:
+        process.join()
+    return seconds, durations, errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--backend", choices=["sqlite", "resp"], default="sqlite")
+    parser.add_argument("--routing", choices=["sticky", "any"], default="any")
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    os.environ["TEACHER_BACKEND"] = "fake"
+    os.environ["TEACHER_VERBOSE"] = "0"
+    os.environ["TEACHER_CACHE_DIR"] = tempfile.mkdtemp(prefix="teacher-bench-")
+    os.environ["FAKE_LLM_LATENCY_SECONDS"] = str(args.latency)
+    os.environ["STATE_BACKEND"] = args.backend
+    # Every session asks for its own topic, the library must not serve one from another
+    os.environ["SEMANTIC_THRESHOLD"] = "1.1"
+    if args.backend == "resp":
+        from state_server import RespHandler, RespServer
+
+        server = RespServer(("127.0.0.1", 0), RespHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        os.environ["STATE_URL"] = f"redis://127.0.0.1:{server.server_address[1]}"
+
+    from bench_sessions import percentile
+
+    print(f"backend {args.backend}, routing {args.routing}, {args.sessions} sessions, latency {args.latency}s")
+    print(f"{'processes':>10}{'seconds':>9}{'sessions/s':>12}{'action p50 ms':>15}{'action p95 ms':>15}{'errors':>8}")
+    for processes in args.processes:
+        seconds, durations, errors = run(processes, args.sessions, args.routing)
+        actions = [value for values in durations.values() for value in values]
+        print(
+            f"{processes:>10}{seconds:>9.1f}{args.sessions / seconds:>12.2f}"
+            f"{percentile(actions, 0.5) * 1000:>15.1f}{percentile(actions, 0.95) * 1000:>15.1f}{len(errors):>8}"
+        )
+        for error in errors[:3]:
+            print(f"  error: {error}")
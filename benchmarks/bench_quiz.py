@@ -0,0 +1,116 @@
+"""
+Measure what quizzes in the chat history cost on every rerun.
+
+The micro benchmark compares the old display path (scan the history for the quiz message and parse
+its raw text on every rerun) with the quiz index (parsed once, looked up by id). The app benchmark
+reruns main.py headless with the given number of quizzes in history, as after a radio button click.
+
+    python benchmarks/bench_quiz.py --quizzes 50 100
+"""
+import argparse
+import ast
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+os.chdir(ROOT)
+os.environ["TEACHER_BACKEND"] = "fake"
+os.environ.setdefault("TEACHER_VERBOSE", "0")
+# Render the whole seeded history, the benchmark is about the cost per rendered message
+os.environ.setdefault("HISTORY_FULL_MESSAGES", "100000")
+os.environ.setdefault("TEACHER_CACHE_DIR", tempfile.mkdtemp(prefix="teacher-bench-"))
+
+from streamlit.testing.v1 import AppTest
+
+from backends import fake_quiz
+from quiz import parse_quiz
+
+
+def legacy_parse(quiz_output):
+    # The parser display_quiz used to run on every rerun, with literal_eval in place of eval
+    parsed = []
+    for raw_question in quiz_output.split("####"):
+        if raw_question.strip():
+            parts = raw_question.strip().split("\n")
+            parsed.append(
+                (
+                    parts[0].strip('" ').lstrip("- "),
+                    ast.literal_eval(parts[1].lstrip("- ").strip()),
+                    parts[2].lstrip("- ").strip().replace("Answer: ", "").replace('"', ""),
+                    parts[3].lstrip("- ").strip('" '),
+                )
+            )
+    return parsed
+
+
+def history(count):
+    messages, quizzes = [], {}
+    for number in range(1, count + 1):
+        raw = fake_quiz(f"module {number}", question_count=5)
+        quiz_id = f"quiz_{number}"
+        messages.append({"role": "user", "content": f"Evaluate me on Module {number}"})
+        messages.append({"role": "assistant", "content_quiz": raw, "id": quiz_id, "quiz_id": quiz_id})
+        quizzes[quiz_id] = parse_quiz(quiz_id, number, raw)
+    return messages, quizzes
+
+
+def micro(count, repeats=20):
+    """
+    The micro function times the quiz lookups of one rerun with count quizzes in history.
+
+    :param count: Number of quizzes in history
+    :param repeats: Number of simulated reruns
+    :return: A tuple of the legacy and the indexed time per rerun in seconds
+    :doc-author: Yusuf
+    """
+    messages, quizzes = history(count)
+    started = time.perf_counter()
+    for _ in range(repeats):
+        for message in messages:
+            if "content_quiz" in message:
+                quiz = next(
+                    msg for msg in messages if msg.get("id") == message["id"] and msg.get("content_quiz")
+                )
+                legacy_parse(quiz["content_quiz"])
+    legacy = (time.perf_counter() - started) / repeats
+    started = time.perf_counter()
+    for _ in range(repeats):
+        for message in messages:
+            if "quiz_id" in message:
+                quizzes[message["quiz_id"]].questions
+    indexed = (time.perf_counter() - started) / repeats
+    return legacy, indexed
+
+
+def app_rerun(count, repeats=5):
+    messages, quizzes = history(count)
+    app = AppTest.from_file("main.py", default_timeout=120)
+    app.session_state["messages"] = [
+        {key: value for key, value in message.items() if key not in ("content_quiz", "id")}
+        for message in messages
+    ]
+    app.session_state["quizzes"] = quizzes
+    app.run()
+    durations = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        app.run()
+        durations.append(time.perf_counter() - started)
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+    return sorted(durations)[len(durations) // 2]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--quizzes", type=int, nargs="+", default=[50, 100])
+    args = parser.parse_args()
+    print(f"{'quizzes':>8}{'legacy ms':>12}{'index ms':>12}{'app rerun ms':>15}")
+    for count in args.quizzes:
+        legacy, indexed = micro(count)
+        print(
+            f"{count:>8}{legacy * 1000:>12.2f}{indexed * 1000:>12.3f}{app_rerun(count) * 1000:>15.1f}"
+        )
@@ -0,0 +1,74 @@
+"""
+Measure the wall time of a Streamlit rerun of main.py that handles a chat message.
+
+The app is run headless with streamlit.testing against the offline fake backend. The agent is loaded on the
+first request only, so every measured rerun sends a chat message: a first one builds the agent, and the
+same short message is sent on every rerun after it, answered by the response cache. The "rebuild" mode
+drops the agent registry before every rerun, which is what every rerun did before the agent was built
+once per session; the "registry" mode keeps it.
+
+    python benchmarks/bench_rerun.py --reruns 30
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+os.chdir(ROOT)
+os.environ["TEACHER_BACKEND"] = "fake"
+os.environ.setdefault("TEACHER_CACHE_DIR", tempfile.mkdtemp(prefix="teacher-bench-"))
+
+from streamlit.testing.v1 import AppTest
+
+# Answered by the chat tool, so a rerun costs the agent and not a long generation
+MESSAGE = "hello there"
+
+
+def measure(reruns, rebuild):
+    """
+    The measure function reruns main.py with a chat message and returns the wall time of every rerun.
+
+    :param reruns: Number of reruns to measure
+    :param rebuild: Drop the agent registry before every rerun
+    :return: A list of durations in seconds
+    :doc-author: Yusuf
+    """
+    app = AppTest.from_file("main.py", default_timeout=60)
+    app.run()
+    # The first request loads the agent, the reruns after it find it in the registry unless it is dropped
+    app.chat_input[0].set_value(MESSAGE)
+    app.run()
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+    durations = []
+    for _ in range(reruns):
+        if rebuild:
+            del app.session_state["agent_registry"]
+        app.chat_input[0].set_value(MESSAGE)
+        started = time.perf_counter()
+        app.run()
+        durations.append(time.perf_counter() - started)
+        if app.exception:
+            raise RuntimeError(app.exception[0].message)
+    return durations
+
+
+def report(name, durations):
+    durations = sorted(durations)
+    print(
+        f"{name:>10}: mean {statistics.mean(durations) * 1000:7.1f} ms  "
+        f"p50 {durations[len(durations) // 2] * 1000:7.1f} ms  "
+        f"max {durations[-1] * 1000:7.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--reruns", type=int, default=20)
+    args = parser.parse_args()
+    report("rebuild", measure(args.reruns, rebuild=True))
+    report("registry", measure(args.reruns, rebuild=False))
@@ -0,0 +1,117 @@
+"""
+Measure what the score report of the analysis costs against the length of the curriculum.
+
+The old calculate_score re-split the markdown of every module for its title and recounted every quiz
+result, once for the analysis prompt and once more for the chart. The ScoreBoard is updated when answers
+are submitted and the titles come from the module tree parsed once per curriculum. Both must produce the same report.
+
+    python benchmarks/bench_scores.py --modules 10 50 200
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+os.chdir(ROOT)
+
+from curriculum import build_curriculum_tree
+from scores import ScoreBoard
+
+
+def legacy_score(curriculum, results, return_string):
+    # calculate_score before the ScoreBoard, with session state passed in
+    total_questions = 0
+    total_correct_answers = 0
+    if return_string:
+        scores, user_wrong_content = "", ""
+        for c in range(len(curriculum)):
+            if results.get(f"quiz_{c + 1}") is not None:
+                module_parts = curriculum[c].split("##")
+                title = ":".join(module_parts[0].split(":")[:2]).replace("#", "").strip()
+                correct_answer_count = len([r for r in results[f"quiz_{c + 1}"] if r["is_correct"]])
+                total_questions += len(results[f"quiz_{c + 1}"])
+                if correct_answer_count != len(results[f"quiz_{c + 1}"]):
+                    user_wrong_content += f"{title}"
+                    for r in results[f"quiz_{c + 1}"]:
+                        if not r["is_correct"]:
+                            user_wrong_content += f"\nQuestion: {r['question']}\nUser Answer: {r['user_answer']}\nCorrect Answer: {r['correct_answer']}\n"
+                scores += f"Module {title}: User correct answer accuracy {correct_answer_count}/{len(results[f'quiz_{c + 1}'])}\n"
+                total_correct_answers += correct_answer_count
+        scores += f"\n\nTotal All modules user correct answer accuracy: {total_correct_answers}/{total_questions}"
+        return scores, user_wrong_content
+    scores = [None] * len(curriculum)
+    for c in range(len(curriculum)):
+        if results.get(f"quiz_{c + 1}") is not None:
+            module_parts = curriculum[c].split("##")
+            title = ":".join(module_parts[0].split(":")[:2]).replace("#", "").strip()
+            correct_answer_count = len([r for r in results[f"quiz_{c + 1}"] if r["is_correct"]])
+            total_questions += len(results[f"quiz_{c + 1}"])
+            scores[c] = {
+                "correct_answer_count": correct_answer_count,
+                "total_questions": len(results[f"quiz_{c + 1}"]),
+                "module_title": title,
+            }
+            total_correct_answers += correct_answer_count
+    return scores, {"correct_answer_count": total_correct_answers, "total_questions": total_questions}
+
+
+def session(module_count, questions=5):
+    rng = random.Random(module_count)
+    curriculum = [
+        f"# Module {number}: Topic {number}\n" + "".join(
+            f"## Submodule {number}.{sub}: Part\n" + "Explanation of the step. " * 40 + "\n" for sub in range(1, 5)
+        )
+        for number in range(1, module_count + 1)
+    ]
+    results = {}
+    for number in range(1, module_count + 1):
+        if rng.random() < 0.8:
+            results[f"quiz_{number}"] = [
+                {
+                    "question": f"Question {q} of module {number}?",
+                    "user_answer": "A",
+                    "correct_answer": "A" if rng.random() < 0.7 else "B",
+                    "is_correct": None,
+                }
+                for q in range(questions)
+            ]
+            for result in results[f"quiz_{number}"]:
+                result["is_correct"] = result["user_answer"] == result["correct_answer"]
+    return curriculum, results
+
+
+def timed(func, repeats):
+    started = time.perf_counter()
+    for _ in range(repeats):
+        func()
+    return (time.perf_counter() - started) / repeats * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--modules", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+    print(f"{'modules':>8}{'legacy ms':>11}{'scoreboard ms':>15}{'submit us':>11}  same report")
+    for module_count in args.modules:
+        curriculum, results = session(module_count)
+        titles = [module.title for module in build_curriculum_tree(curriculum)]
+        board = ScoreBoard()
+        started = time.perf_counter()
+        for quiz_id, quiz_results in results.items():
+            board.record(int(quiz_id.split("_")[1]) - 1, quiz_results)
+        submit = (time.perf_counter() - started) / max(len(results), 1) * 1e6
+        same = (
+            board.report(titles) == legacy_score(curriculum, results, True)
+            and board.chart_data(titles) == legacy_score(curriculum, results, False)
+        )
+        # The analysis asks for the text, main.py for the chart data
+        legacy = timed(
+            lambda: (legacy_score(curriculum, results, True), legacy_score(curriculum, results, False)),
+            args.repeats,
+        )
+        new = timed(lambda: (board.report(titles), board.chart_data(titles)), args.repeats)
+        print(f"{module_count:>8}{legacy:>11.3f}{new:>15.3f}{submit:>11.2f}  {same}")
@@ -0,0 +1,88 @@
+"""
+Measure the semantic topic lookup: hit rate on paraphrased requests, lookup latency and index load time.
+
+Paraphrases of the stored topics must find their topic (hits), requests for other dishes must not
+(false hits). Lookup and load times are measured with --topics filler topics in the config bucket.
+
+    python benchmarks/bench_semantic.py --topics 10000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+os.chdir(ROOT)
+os.environ.setdefault("TEACHER_VERBOSE", "0")
+os.environ.setdefault("TEACHER_CACHE_DIR", tempfile.mkdtemp(prefix="teacher-bench-"))
+
+import settings
+from curriculum_store import normalize_topic
+from semantic import TopicIndex, get_embedder
+
+CONFIGS = ["Beginner", "All World", "Short", "Image-Containing", "English"]
+PARAPHRASES = {
+    "how to cook a steak?": ["cook steak", "Steak cooking", "How do I cook steaks", "steak recipe", "teach me to make a steak"],
+    "how to cook ramen?": ["ramen", "Ramen cooking please", "how to make ramen", "homemade ramen recipe"],
+    "how to bake sourdough bread?": ["sourdough bread", "Sourdough bread baking", "bake a sourdough bread"],
+    "how to make pad thai?": ["pad thai", "Pad Thai recipe", "how do you cook pad thai"],
+    "how to cook risotto?": ["risotto", "Risotto cooking", "mushroom risotto"],
+}
+OTHER_DISHES = ["beef stew", "tomato soup", "chicken curry", "apple pie", "fried rice", "pancakes", "lasagna"]
+# Filler dishes do not use the words of the other dishes, so a false hit is a real one
+WORDS = "pork tofu noodle salad cake grill roast spicy sweet sour garlic lemon honey lamb duck tuna bean corn".split()
+
+
+def filler_topics(count):
+    rng = random.Random(0)
+    return [f"{rng.choice(WORDS)} {rng.choice(WORDS)} {rng.choice(WORDS)} {number}" for number in range(count)]
+
+
+def quality(index):
+    exact = hits = 0
+    paraphrases = [(topic, request) for topic, requests in PARAPHRASES.items() for request in requests]
+    for topic, request in paraphrases:
+        exact += normalize_topic(request) == normalize_topic(topic)
+        match = index.find(request, CONFIGS)
+        hits += match is not None and match[0] == normalize_topic(topic) and match[1] >= settings.SEMANTIC_THRESHOLD
+    false_hits = sum(
+        (match := index.find(dish, CONFIGS)) is not None and match[1] >= settings.SEMANTIC_THRESHOLD
+        for dish in OTHER_DISHES
+    )
+    return len(paraphrases), exact, hits, false_hits
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--topics", type=int, default=10000)
+    args = parser.parse_args()
+    path = os.path.join(settings.CACHE_DIR, "bench_topics.npz")
+    index = TopicIndex(path, get_embedder())
+    index.add([(topic, CONFIGS) for topic in PARAPHRASES])
+    total, exact, hits, false_hits = quality(index)
+    print(f"paraphrases: {total}, exact key hits: {exact}, semantic hits: {hits}, false hits on {len(OTHER_DISHES)} other dishes: {false_hits}")
+
+    started = time.perf_counter()
+    index.add([(topic, CONFIGS) for topic in filler_topics(args.topics)])
+    print(f"index {len(index)} topics: built in {time.perf_counter() - started:.2f}s")
+    # A new topic of a request is only added in memory, the file is written by the background flush
+    started = time.perf_counter()
+    for number in range(20):
+        index.add([(f"new dish {number}", CONFIGS)])
+    print(f"add one topic: {(time.perf_counter() - started) / 20 * 1000:.2f} ms per request")
+    started = time.perf_counter()
+    index.flush()
+    print(f"flushed in {(time.perf_counter() - started) * 1000:.1f} ms, {os.path.getsize(path) / 1e6:.1f} MB")
+    started = time.perf_counter()
+    loaded = TopicIndex(path, get_embedder())
+    print(f"loaded in {(time.perf_counter() - started) * 1000:.1f} ms")
+    requests = [request for requests in PARAPHRASES.values() for request in requests] * 20
+    started = time.perf_counter()
+    for request in requests:
+        loaded.find(request, CONFIGS)
+    print(f"lookup: {(time.perf_counter() - started) / len(requests) * 1e6:.0f} us per request")
+    total, exact, hits, false_hits = quality(loaded)
+    print(f"with filler topics: semantic hits: {hits}/{total}, false hits: {false_hits}")
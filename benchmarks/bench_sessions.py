@@ -0,0 +1,87 @@
+"""
+Replay scripted learning sessions against the offline fake backend and report latency percentiles.
+
+Every session runs main.py headless with streamlit.testing and goes through
+topic -> every module -> its quiz -> analysis. Per rerun (one user action) and per tool
+the p50 and p95 latencies are reported. The fake model latency is set with the FAKE_* variables.
+
+    FAKE_LLM_LATENCY_SECONDS=0.05 python benchmarks/bench_sessions.py --sessions 5
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+os.chdir(ROOT)
+os.environ["TEACHER_BACKEND"] = "fake"
+os.environ.setdefault("TEACHER_CACHE_DIR", tempfile.mkdtemp(prefix="teacher-bench-"))
+
+from streamlit.testing.v1 import AppTest
+
+from memory import memory_stats
+from quiz import make_quiz_id
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def timed_run(app, step, timings):
+    started = time.perf_counter()
+    app.run()
+    timings[step].append(time.perf_counter() - started)
+    if app.exception:
+        raise RuntimeError(f"{step}: {app.exception[0].message}")
+
+
+def replay_session(topic, timings, tool_timings):
+    """
+    The replay_session function plays one scripted session: topic, every module with its quiz, analysis.
+
+    :param topic: The topic the user asks for
+    :param timings: Dictionary of step name to rerun durations, filled in place
+    :param tool_timings: Dictionary of tool name to tool durations, filled in place
+    :doc-author: Yusuf
+    """
+    app = AppTest.from_file("main.py", default_timeout=120)
+    timed_run(app, "first_load", timings)
+    app.chat_input[0].set_value(topic)
+    timed_run(app, "topic", timings)
+    for index in range(len(app.session_state["curriculum"])):
+        app.button(key=f"module_button_{index}").click()
+        timed_run(app, "module", timings)
+        app.button(key=f"quiz_button_{index}").click()
+        timed_run(app, "quiz", timings)
+        app.button(key=f"submit_{make_quiz_id(app.session_state['curriculum_id'], index + 1)}").click()
+        timed_run(app, "submit_answers", timings)
+    app.button(key="green_button").click()
+    timed_run(app, "analyse", timings)
+    timed_run(app, "idle_rerun", timings)
+    for metric in app.session_state["tool_metrics"]:
+        tool_timings[metric["tool"]].append(metric["duration"])
+
+
+def report(title, timings):
+    print(f"\n{title:<22}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, values in timings.items():
+        print(
+            f"{name:<22}{len(values):>7}{percentile(values, 0.5) * 1000:>10.1f}{percentile(values, 0.95) * 1000:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=3)
+    parser.add_argument("--topics", nargs="+", default=["how to cook a steak?", "how to cook ramen?"])
+    args = parser.parse_args()
+    timings, tool_timings = defaultdict(list), defaultdict(list)
+    for number in range(args.sessions):
+        replay_session(args.topics[number % len(args.topics)], timings, tool_timings)
+    report("rerun", timings)
+    report("tool", tool_timings)
+    print(f"\nmemory: {memory_stats()}")
@@ -0,0 +1,79 @@
+"""
+Measure the wall time of an idle rerun of main.py against the length of the curriculum in the sidebar.
+
+Sessions are seeded with a curriculum of a number of modules, every one with five flashcards, and rerun
+without user input. The sidebar used to split every module again and draw every flashcard as its own element
+on each rerun. The module tree is now parsed once and the flashcard HTML of a module is rendered once.
+
+    python benchmarks/bench_sidebar.py --modules 5 20 50 --reruns 20
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+os.chdir(ROOT)
+os.environ["TEACHER_BACKEND"] = "fake"
+os.environ.setdefault("TEACHER_CACHE_DIR", tempfile.mkdtemp(prefix="teacher-bench-"))
+
+from streamlit.testing.v1 import AppTest
+
+from bench_sessions import percentile
+
+
+def curriculum(module_count):
+    modules = [
+        f"# Module {number}: Topic {number}\n###### Directions: Learn topic {number}.\n" + "".join(
+            f"## :pushpin: Submodule {number}.{sub}: Part\n###### Directions: Explain part {sub}.\n"
+            + "Explanation of the step. " * 40 + "\n"
+            for sub in range(1, 5)
+        )
+        for number in range(1, module_count + 1)
+    ]
+    flashcards = [
+        "####".join(f"Card {card} of module {number}: a short fact." for card in range(1, 6))
+        for number in range(1, module_count + 1)
+    ]
+    return modules, flashcards
+
+
+def measure(module_count, reruns):
+    """
+    The measure function reruns main.py with a seeded curriculum and returns the wall time of every rerun.
+
+    :param module_count: Number of modules of the curriculum
+    :param reruns: Number of reruns to measure
+    :return: A tuple of the list of durations in seconds and the number of sidebar elements
+    :doc-author: Yusuf
+    """
+    app = AppTest.from_file("main.py", default_timeout=60)
+    app.run()
+    modules, flashcards = curriculum(module_count)
+    app.session_state["curriculum"] = modules
+    app.session_state["flashcard"] = flashcards
+    app.run()
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+    durations = []
+    for _ in range(reruns):
+        started = time.perf_counter()
+        app.run()
+        durations.append(time.perf_counter() - started)
+    return durations, len(app.sidebar.markdown)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--modules", type=int, nargs="+", default=[5, 20, 50])
+    parser.add_argument("--reruns", type=int, default=20)
+    args = parser.parse_args()
+    print(f"{'modules':>8}{'rerun p50 ms':>14}{'rerun p95 ms':>14}{'sidebar markdown':>18}")
+    for module_count in args.modules:
+        durations, elements = measure(module_count, args.reruns)
+        print(
+            f"{module_count:>8}{percentile(durations, 0.5) * 1000:>14.1f}"
+            f"{percentile(durations, 0.95) * 1000:>14.1f}{elements:>18}"
+        )
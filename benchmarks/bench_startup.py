@@ -0,0 +1,99 @@
+"""
+Measure the cold start of a server process: time to first paint and the latency of the first reruns.
+
+Every sample is a fresh interpreter that imports streamlit (the server has done so before a session connects)
+and then runs main.py headless with streamlit.testing, against the offline fake backend:
+
+    first paint   from the start of the first script run until the header is sent to the browser
+    first run     the whole first script run of the first session
+    rerun         the next script run of the same session, without user input
+    first topic   the first user action, a topic that generates a curriculum
+
+The rerun and the first topic follow after --think seconds, the time a user reads the page before acting;
+the background warm-up (TEACHER_WARMUP) runs in this time. --think 0 acts at once.
+
+    python benchmarks/bench_startup.py --samples 5 --think 3
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+os.chdir(ROOT)
+
+STEPS = ["first_paint", "first_run", "rerun", "first_topic"]
+
+
+def sample(think):
+    """
+    The sample function measures one cold start in this process and returns the durations in seconds.
+
+    :param think: Seconds between the first run and the next user action
+    :return: A dictionary of step name to seconds
+    :doc-author: Yusuf
+    """
+    from streamlit.runtime.scriptrunner.script_run_context import ScriptRunContext
+    from streamlit.testing.v1 import AppTest
+
+    painted = []
+    enqueue = ScriptRunContext.enqueue
+
+    def timed_enqueue(self, msg):
+        if not painted and msg.HasField("delta") and msg.delta.new_element.WhichOneof("type") == "heading":
+            painted.append(time.perf_counter())
+        enqueue(self, msg)
+
+    ScriptRunContext.enqueue = timed_enqueue
+    timings = {}
+    app = AppTest.from_file("main.py", default_timeout=120)
+    started = time.perf_counter()
+    app.run()
+    timings["first_run"] = time.perf_counter() - started
+    timings["first_paint"] = painted[0] - started
+    time.sleep(think)
+    for step, action in (("rerun", None), ("first_topic", "how to cook a steak?")):
+        if action is not None:
+            app.chat_input[0].set_value(action)
+        started = time.perf_counter()
+        app.run()
+        timings[step] = time.perf_counter() - started
+        if app.exception:
+            raise RuntimeError(f"{step}: {app.exception[0].message}")
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--samples", type=int, default=5)
+    parser.add_argument("--think", type=float, default=3.0)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        sys.stdout = open(os.devnull, "w")
+        result = sample(args.think)
+        sys.__stdout__.write(json.dumps(result) + "\n")
+        sys.exit(0)
+
+    env = dict(os.environ, TEACHER_BACKEND="fake", TEACHER_VERBOSE="0")
+    samples = []
+    for _ in range(args.samples):
+        # Every sample starts with an empty cache directory, as a new pod does
+        env["TEACHER_CACHE_DIR"] = tempfile.mkdtemp(prefix="teacher-bench-")
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", "--think", str(args.think)],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    print(f"{'step':<14}{'median ms':>11}{'min ms':>9}{'max ms':>9}")
+    for step in STEPS:
+        values = [s[step] * 1000 for s in samples]
+        print(f"{step:<14}{statistics.median(values):>11.0f}{min(values):>9.0f}{max(values):>9.0f}")
@@ -0,0 +1,119 @@
+"""
+A local stand-in for the OpenAI HTTP API, to exercise the model gateway without network access or a key.
+
+It answers /chat/completions (plain and streamed) and /images/generations with canned content after an
+artificial latency, and can answer every Nth request with 429 to test the retry path.
+
+    python benchmarks/stub_openai_server.py --port 8765 --latency 0.2 --rate-limit-every 5
+    OPENAI_API_BASE=http://127.0.0.1:8765/v1 streamlit run main.py
+"""
+import argparse
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# A 1x1 gray PNG
+STUB_IMAGE = (
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAAAAAA6fptVAAAACklEQVR4nGNoAAAAggCBd81ytgAAAABJRU5ErkJggg=="
+)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    rate_limit_every = 0
+    counter = itertools.count(1)
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.lock:
+            number = next(self.counter)
+        if self.rate_limit_every and number % self.rate_limit_every == 0:
+            self._send_json(
+                429, {"error": {"message": "Rate limit reached"}}, {"Retry-After": "0.1"}
+            )
+            return
+        time.sleep(self.latency)
+        if self.path.endswith("/images/generations"):
+            if payload.get("response_format") == "b64_json":
+                self._send_json(200, {"data": [{"b64_json": STUB_IMAGE}]})
+            else:
+                self._send_json(200, {"data": [{"url": f"http://127.0.0.1/image/{number}.png"}]})
+        elif self.path.endswith("/chat/completions"):
+            prompt = payload["messages"][-1]["content"]
+            answer = f"Stub answer {number} to a prompt of {len(prompt)} characters."
+            if payload.get("stream"):
+                self._stream(answer)
+            else:
+                self._send_json(
+                    200,
+                    {
+                        "choices": [
+                            {
+                                "message": {"role": "assistant", "content": answer},
+                                "finish_reason": "stop",
+                            }
+                        ],
+                        "usage": {
+                            "prompt_tokens": len(prompt) // 4,
+                            "completion_tokens": len(answer) // 4,
+                        },
+                    },
+                )
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def _stream(self, answer):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for token in answer.split(" "):
+            event = {"choices": [{"delta": {"content": token + " "}}]}
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+def serve(port, latency=0.0, rate_limit_every=0):
+    """
+    The serve function starts the stub server in a background thread.
+
+    :param port: Port to listen on, 0 picks a free port
+    :param latency: Seconds to wait before every answer
+    :param rate_limit_every: Answer every Nth request with 429, 0 disables it
+    :return: The running server, its base url is http://127.0.0.1:<server.server_port>/v1
+    :doc-author: Yusuf
+    """
+    StubHandler.latency = latency
+    StubHandler.rate_limit_every = rate_limit_every
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--rate-limit-every", type=int, default=0)
+    args = parser.parse_args()
+    server = serve(args.port, args.latency, args.rate_limit_every)
+    print(f"Stub API on http://127.0.0.1:{server.server_port}/v1")
+    threading.Event().wait()
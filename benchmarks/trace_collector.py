@@ -0,0 +1,144 @@
+"""
+A local stand-in for an OpenTelemetry collector and a report of where the time of a session goes.
+
+The collector accepts OTLP/HTTP JSON on /v1/traces and appends every span to a JSON-lines file
+in the same format as TRACE_EXPORTER=jsonl. The report reads such a file and prints count, total,
+p50 and p95 per span kind and name, plus the token and cache counters of the LLM spans.
+
+    python benchmarks/trace_collector.py serve --port 4318 --output traces.jsonl
+    TRACE_EXPORTER=otlp TRACE_OTLP_ENDPOINT=http://127.0.0.1:4318/v1/traces streamlit run main.py
+    python benchmarks/trace_collector.py report traces.jsonl
+"""
+import argparse
+import json
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _value(value):
+    for kind in ("stringValue", "boolValue", "doubleValue"):
+        if kind in value:
+            return value[kind]
+    return int(value["intValue"])
+
+
+def otlp_to_spans(payload):
+    """
+    The otlp_to_spans function turns an OTLP/HTTP JSON payload into the span dictionaries of tracing.Span.as_dict.
+
+    :param payload: The decoded OTLP payload
+    :return: A list of span dictionaries
+    :doc-author: Yusuf
+    """
+    spans = []
+    for resource_spans in payload.get("resourceSpans", []):
+        for scope_spans in resource_spans.get("scopeSpans", []):
+            for span in scope_spans.get("spans", []):
+                attributes = {
+                    attribute["key"]: _value(attribute["value"])
+                    for attribute in span.get("attributes", [])
+                }
+                start = int(span["startTimeUnixNano"])
+                spans.append(
+                    {
+                        "name": span["name"],
+                        "kind": attributes.pop("span.kind", "internal"),
+                        "trace_id": span["traceId"],
+                        "span_id": span["spanId"],
+                        "parent_id": span.get("parentSpanId"),
+                        "session_id": attributes.pop("session.id", None),
+                        "start_time": start / 1e9,
+                        "duration": (int(span["endTimeUnixNano"]) - start) / 1e9,
+                        "attributes": attributes,
+                        "error": span.get("status", {}).get("message"),
+                    }
+                )
+    return spans
+
+
+class CollectorHandler(BaseHTTPRequestHandler):
+    output = "traces.jsonl"
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.endswith("/v1/traces"):
+            self.send_response(404)
+            self.end_headers()
+            return
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        spans = otlp_to_spans(payload)
+        with self.lock, open(self.output, "a", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(span) + "\n")
+        body = b"{}"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(port, output):
+    CollectorHandler.output = output
+    server = ThreadingHTTPServer(("127.0.0.1", port), CollectorHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def report(path):
+    """
+    The report function prints where the time of the traced requests went, per span kind and name.
+
+    :param path: Path of a JSON-lines span file
+    :doc-author: Yusuf
+    """
+    durations = defaultdict(list)
+    counters = defaultdict(lambda: defaultdict(int))
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            span = json.loads(line)
+            key = (span["kind"], span["name"])
+            durations[key].append(span["duration"])
+            for name in ("prompt_tokens", "completion_tokens", "cache_hits", "cache_misses"):
+                counters[key][name] += span["attributes"].get(name, 0)
+    print(
+        f"{'kind':<10}{'name':<28}{'count':>7}{'total s':>10}{'p50 ms':>10}{'p95 ms':>10}"
+        f"{'prompt tok':>12}{'compl tok':>11}{'hits':>7}{'misses':>8}"
+    )
+    for key, values in sorted(durations.items(), key=lambda item: -sum(item[1])):
+        counter = counters[key]
+        print(
+            f"{key[0]:<10}{key[1][:27]:<28}{len(values):>7}{sum(values):>10.2f}"
+            f"{percentile(values, 0.5) * 1000:>10.1f}{percentile(values, 0.95) * 1000:>10.1f}"
+            f"{counter['prompt_tokens']:>12}{counter['completion_tokens']:>11}"
+            f"{counter['cache_hits']:>7}{counter['cache_misses']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve")
+    serve_parser.add_argument("--port", type=int, default=4318)
+    serve_parser.add_argument("--output", default="traces.jsonl")
+    report_parser = commands.add_parser("report")
+    report_parser.add_argument("path")
+    args = parser.parse_args()
+    if args.command == "serve":
+        server = serve(args.port, args.output)
+        print(f"Collecting spans on http://127.0.0.1:{args.port}/v1/traces into {args.output}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
+    else:
+        report(args.path)
@@ -0,0 +1,142 @@
+import json
+import re
+
+import settings
+from quiz import Quiz, question_from_fields
+
+# JSON schema of the module bundle: everything the app needs for one module, generated in a single call
+BUNDLE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "module_content": {"type": "string"},
+        "flashcards": {"type": "array", "items": {"type": "string"}},
+        "quiz": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "question": {"type": "string"},
+                    "options": {"type": "array", "items": {"type": "string"}},
+                    "answer": {"type": "string"},
+                    "explanation": {"type": "string"},
+                },
+                "required": ["question", "options", "answer", "explanation"],
+                "additionalProperties": False,
+            },
+        },
+        "key_content": {"type": "string"},
+    },
+    "required": ["module_content", "flashcards", "quiz", "key_content"],
+    "additionalProperties": False,
+}
+
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+class BundleError(ValueError):
+    """
+    The BundleError exception is raised when a module bundle does not pass validation.
+
+    :doc-author: Yusuf
+    """
+
+
+class ModuleBundle:
+    """
+    The ModuleBundle class is a validated module bundle: the module content, its flashcards,
+    its parsed quiz and the key content the module image is generated from.
+
+    :doc-author: Yusuf
+    """
+
+    __slots__ = ("module_content", "flashcards", "quiz", "key_content")
+
+    def __init__(self, module_content, flashcards, quiz, key_content):
+        self.module_content = module_content
+        self.flashcards = flashcards
+        self.quiz = quiz
+        self.key_content = key_content
+
+
+def response_format():
+    """
+    The response_format function returns the response_format parameter of the bundle call for TEACHER_BUNDLE:
+    "json" asks for any JSON object (the schema is in the prompt), "schema" asks for the strict bundle schema,
+    which needs a model that supports structured outputs.
+
+    :return: The response_format dictionary
+    :doc-author: Yusuf
+    """
+    if settings.BUNDLE_MODE == "schema":
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": "module_bundle", "schema": BUNDLE_SCHEMA, "strict": True},
+        }
+    return {"type": "json_object"}
+
+
+def _load_object(text):
+    text = _FENCE.sub("", text.strip())
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    # Models without a JSON mode sometimes put a sentence around the object
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        raise BundleError("the bundle is not a JSON object")
+    try:
+        return json.loads(text[start : end + 1])
+    except ValueError as e:
+        raise BundleError(f"the bundle is not valid JSON: {e}")
+
+
+def parse_bundle(module_number, bundle_output):
+    """
+    The parse_bundle function validates the output of the bundle chain against BUNDLE_SCHEMA.
+    Quiz questions are checked like the ones of the evaluation chain and questions that can not be repaired are dropped.
+
+    :param module_number: Number of the module, starting from 1
+    :param bundle_output: Output of the bundle chain
+    :return: A ModuleBundle object
+    :raises BundleError: If the module content, the flashcards or every quiz question is missing or malformed
+    :doc-author: Yusuf
+    """
+    data = _load_object(bundle_output)
+    if not isinstance(data, dict):
+        raise BundleError("the bundle is not a JSON object")
+    module_content = data.get("module_content")
+    if not isinstance(module_content, str) or not module_content.strip():
+        raise BundleError("module_content is missing")
+    flashcards = data.get("flashcards")
+    if isinstance(flashcards, str):
+        flashcards = flashcards.split("####")
+    if not isinstance(flashcards, list):
+        raise BundleError("flashcards is not a list")
+    flashcards = tuple(
+        str(card).replace("####", "").strip() for card in flashcards if str(card).strip()
+    )
+    if not flashcards:
+        raise BundleError("flashcards is empty")
+    questions = []
+    for item in data.get("quiz") or []:
+        if not isinstance(item, dict):
+            continue
+        question = question_from_fields(
+            item.get("question"), item.get("options"), item.get("answer"), item.get("explanation")
+        )
+        if question is not None:
+            questions.append(question)
+    if not questions:
+        raise BundleError("the quiz has no valid question")
+    key_content = data.get("key_content")
+    if not isinstance(key_content, str) or not key_content.strip():
+        # The image prompt only needs the gist of the module
+        key_content = module_content[:1000]
+    quiz_id = f"quiz_{module_number}"
+    return ModuleBundle(
+        module_content.strip(),
+        flashcards,
+        Quiz(quiz_id, module_number, tuple(questions)),
+        key_content.strip(),
+    )
@@ -0,0 +1,303 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+import settings
+from state_store import get_state_backend
+from tracing import get_tracer
+
+
+class MemoryTier:
+    """
+    The MemoryTier class is an in-process LRU dictionary with a fixed number of entries.
+    The least recently used entry is dropped when the tier is full.
+
+    :doc-author: Yusuf
+    """
+
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self.evictions = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class DiskTier:
+    """
+    The DiskTier class keeps one small JSON file per entry in a directory.
+    Entries older than ttl_seconds are treated as missing, and the least recently used files
+    are deleted once the directory grows beyond max_bytes.
+
+    :doc-author: Yusuf
+    """
+
+    def __init__(self, directory, max_bytes, ttl_seconds):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(
+            entry.stat().st_size for entry in os.scandir(directory) if entry.is_file()
+        )
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry["created"] > self.ttl_seconds:
+            self._remove(path)
+            return None
+        # Touch the file so that eviction keeps recently used entries
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry["value"]
+
+    def set(self, key, value):
+        path = self._path(key)
+        data = json.dumps({"created": time.time(), "value": value}).encode("utf-8")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        with self._lock:
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            self.size += len(data) - old_size
+        if self.size > self.max_bytes:
+            self._evict()
+
+    def _remove(self, path):
+        with self._lock:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except OSError:
+                return
+            self.size -= size
+
+    def _evict(self):
+        entries = [
+            entry
+            for entry in os.scandir(self.directory)
+            if entry.is_file() and entry.name.endswith(".json")
+        ]
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        # Drop down to 90% of the budget so that we do not evict on every write
+        target = int(self.max_bytes * 0.9)
+        for entry in entries:
+            if self.size <= target:
+                break
+            self._remove(entry.path)
+            self.evictions += 1
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                self._remove(entry.path)
+
+
+class StateTier:
+    """
+    The StateTier class keeps responses in the state backend instead of files,
+    so server processes on other hosts share them. Entries expire after ttl_seconds.
+    The tier is bounded by the ttl only: the keys of other processes can not be listed, so no process knows
+    the size of the tier and RESPONSE_CACHE_DISK_BYTES does not apply. The memory policy of the server
+    (e.g. maxmemory of Redis) bounds it in bytes. Its size is None, it is not reported as disk usage.
+
+    :doc-author: Yusuf
+    """
+
+    size = None
+
+    def __init__(self, backend, ttl_seconds):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.evictions = 0
+
+    def get(self, key):
+        value = self.backend.get_many([f"response:{key}"]).get(f"response:{key}")
+        return None if value is None else value.decode("utf-8")
+
+    def set(self, key, value):
+        data = value.encode("utf-8")
+        self.backend.set_many({f"response:{key}": data}, self.ttl_seconds)
+
+    def clear(self):
+        # Keys of other processes can not be listed, their entries expire with the ttl
+        pass
+
+
+class ResponseCache(BaseCache):
+    """
+    The ResponseCache class is the LangChain cache behind every chain of the app.
+    It is registered with set_llm_cache, so every LLMChain, ConversationChain and agent call is
+    looked up here before the model is called.
+    Keys are a hash of the rendered prompt, the model name, the temperature and the stop words.
+    Values are looked up in an in-process LRU tier first and in the on-disk tier second.
+    With the resp state backend the second tier is the state backend, so every host shares it.
+
+    :doc-author: Yusuf
+    """
+
+    def __init__(self, memory_tier, disk_tier):
+        self.memory_tier = memory_tier
+        self.disk_tier = disk_tier
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(prompt, llm_string):
+        """
+        The make_key function hashes the prompt together with the model name, the temperature and the stop words.
+        Other model parameters (e.g. streaming) do not change the answer, so they are not part of the key.
+
+        :param prompt: The rendered prompt that is sent to the model
+        :param llm_string: The LangChain representation of the model configuration
+        :return: A hex digest
+        :doc-author: Yusuf
+        """
+        head, _, stop = llm_string.partition("---")
+        try:
+            kwargs = json.loads(head).get("kwargs", {})
+            signature = [
+                kwargs.get("model_name", kwargs.get("model")),
+                kwargs.get("temperature"),
+                stop,
+            ]
+        except ValueError:
+            signature = [llm_string]
+        payload = json.dumps([prompt] + signature, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def lookup(self, prompt, llm_string):
+        key = self.make_key(prompt, llm_string)
+        value = self.memory_tier.get(key)
+        if value is not None:
+            self._count("memory_hits")
+            get_tracer().count("cache_hits")
+            return loads(value)
+        value = self.disk_tier.get(key)
+        if value is not None:
+            self._count("disk_hits")
+            get_tracer().count("cache_hits")
+            self.memory_tier.set(key, value)
+            return loads(value)
+        self._count("misses")
+        get_tracer().count("cache_misses")
+        return None
+
+    def update(self, prompt, llm_string, return_val):
+        key = self.make_key(prompt, llm_string)
+        value = dumps(return_val)
+        self.memory_tier.set(key, value)
+        self.disk_tier.set(key, value)
+        self._count("writes")
+
+    def clear(self, **kwargs):
+        self.memory_tier.clear()
+        self.disk_tier.clear()
+
+    def stats(self):
+        """
+        The stats function returns the hit and miss counters of the cache.
+
+        :return: A dictionary of counters, including the hit rate over all lookups; disk_bytes is None
+                 when the second tier is the state backend, which has no known size
+        :doc-author: Yusuf
+        """
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters["memory_hits"] + counters["disk_hits"] + counters["misses"]
+        counters["hit_rate"] = (
+            (counters["memory_hits"] + counters["disk_hits"]) / lookups if lookups else 0.0
+        )
+        counters["memory_items"] = len(self.memory_tier)
+        counters["memory_evictions"] = self.memory_tier.evictions
+        counters["disk_bytes"] = self.disk_tier.size
+        counters["disk_evictions"] = self.disk_tier.evictions
+        return counters
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """
+    The get_response_cache function returns the process-wide ResponseCache and creates it on first use.
+
+    :return: The ResponseCache object
+    :doc-author: Yusuf
+    """
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            if settings.STATE_BACKEND == "resp":
+                shared_tier = StateTier(get_state_backend(), settings.RESPONSE_CACHE_TTL_SECONDS)
+            else:
+                # Files of the cache folder are already shared by the server processes of a host
+                shared_tier = DiskTier(
+                    settings.RESPONSE_CACHE_DIR,
+                    settings.RESPONSE_CACHE_DISK_BYTES,
+                    settings.RESPONSE_CACHE_TTL_SECONDS,
+                )
+            _response_cache = ResponseCache(
+                MemoryTier(settings.RESPONSE_CACHE_MEMORY_ITEMS), shared_tier
+            )
+        return _response_cache
+
+
+def install_response_cache():
+    """
+    The install_response_cache function registers the ResponseCache as the global LangChain cache,
+    so that every chain built in chains.py and tools.py goes through it.
+
+    :return: The ResponseCache object
+    :doc-author: Yusuf
+    """
+    from langchain.globals import set_llm_cache
+
+    cache = get_response_cache()
+    set_llm_cache(cache)
+    return cache
@@ -1,21 +1,70 @@
 from langchain.chains import LLMChain, ConversationChain
-from prompts import get_prompts
-
-def get_chains(llm, memory):
-    answer_question_prompt, curriculum_prompt, module_prompt, evalue_prompt, flashcard_prompt , analysis_module_prompt, extract_prompt = get_prompts()
-    answer_question_chain = ConversationChain(llm=llm,
-                                              prompt=answer_question_prompt,
-                                              verbose=True,
-                                              memory=memory
-                                              )
-    # use the generate curriculum chain to generate curriculum
-    generate_curriculum_chain = LLMChain(llm=llm,
-                                         prompt=curriculum_prompt,
-                                         verbose=True,
+
+import settings
+from memory import ArtifactMemory, BackgroundSummaryMemory
+from prompts import get_config_prompts, get_static_prompts
+
+
+class ChainSet:
+    """
+    The ChainSet class holds the chains and prompts used by the tools of one session.
+    Tools look up chains and prompts on this object when they are called, so the prompts can be swapped
+    in place when the user configuration changes, without rebuilding the tools or the agent.
+
+    :doc-author: Yusuf
+    """
+
+    def __init__(self, llm, memory, config_prompt):
+        self.llm = llm
+        self.memory = memory
+        self.config_prompt = config_prompt
+        (
+            answer_question_prompt,
+            curriculum_prompt,
+            self.module_prompt,
+            evalue_prompt,
+            self.flashcard_prompt,
+            self.bundle_prompt,
+        ) = get_config_prompts(config_prompt)
+        self.analysis_module_prompt, self.extract_prompt = get_static_prompts()
+        # Questions and quizzes are about the curriculum and modules, so these chains see the artifact texts
+        if isinstance(memory, BackgroundSummaryMemory):
+            memory = ArtifactMemory(memory=memory)
+        self.answer_question_chain = ConversationChain(llm=llm,
+                                                       prompt=answer_question_prompt,
+                                                       verbose=settings.VERBOSE,
+                                                       memory=memory
+                                                       )
+        # use the generate curriculum chain to generate curriculum
+        self.generate_curriculum_chain = LLMChain(llm=llm,
+                                                  prompt=curriculum_prompt,
+                                                  verbose=settings.VERBOSE,
+                                                  )
+        self.evaluation_chain = LLMChain(llm=llm,
+                                         prompt=evalue_prompt,
+                                         verbose=settings.VERBOSE,
+                                         memory=memory,
                                          )
-    evaluation_chain = LLMChain(llm=llm,
-                                prompt=evalue_prompt,
-                                verbose=True,
-                                memory=memory,
-                                )
-    return answer_question_chain, generate_curriculum_chain, module_prompt, evaluation_chain , flashcard_prompt, analysis_module_prompt, extract_prompt
+
+    def update_config(self, config_prompt):
+        """
+        The update_config function rebuilds only the prompts that contain the config prompt
+        and puts them into the existing chains.
+
+        :param config_prompt: The new config prompt
+        :return: True if the prompts were rebuilt, False if the config prompt did not change
+        :doc-author: Yusuf
+        """
+        if config_prompt == self.config_prompt:
+            return False
+        (
+            self.answer_question_chain.prompt,
+            self.generate_curriculum_chain.prompt,
+            self.module_prompt,
+            self.evaluation_chain.prompt,
+            self.flashcard_prompt,
+            self.bundle_prompt,
+        ) = get_config_prompts(config_prompt)
+        self.config_prompt = config_prompt
+        return True
+
@@ -0,0 +1,304 @@
+"""
+Compile complete courses offline into the shared library, the response cache and the image store.
+
+A spec file lists topics and configurations, and every topic is compiled for every configuration:
+
+    {
+        "topics": ["how to cook a steak?", "how to cook ramen?"],
+        "configs": [
+            {"depth": "Beginner"},
+            {"depth": "Expert", "communication": "Image-Containing", "language": "German"}
+        ]
+    }
+
+Options missing in a configuration take the first value of CONFIG_OPTIONS, as the config boxes of the app do.
+Curricula are generated first, and as soon as one is ready its modules (content, flashcards, quiz and, with
+--images, the module image) are generated on the same worker pool. Every finished part is appended to a
+checkpoint file, so a run that was stopped continues where it stopped when it is started again:
+
+    python course_compiler.py courses.json --workers 8 --rpm 500 --images
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import settings
+from backends import get_chat_model
+from cache import install_response_cache
+from curriculum_store import config_key, get_curriculum_store, normalize_topic
+from image_store import get_image_store
+from prewarm import prewarm_curriculum, prewarm_module
+from prompts import build_config_prompt, get_config_prompts, get_static_prompts
+from session_store import session_scope
+from tools import image_generator, parse_curriculum
+from tracing import log_info
+
+
+def load_spec(path):
+    """
+    The load_spec function reads a spec file and returns the courses it describes.
+
+    :param path: Path of the JSON spec file
+    :return: A list of (topic, config list) tuples, every topic for every configuration, each course once
+    :doc-author: Yusuf
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        spec = json.load(f)
+    courses = []
+    seen = set()
+    for config in spec.get("configs") or [{}]:
+        unknown = set(config) - set(settings.CONFIG_OPTIONS)
+        if unknown:
+            raise ValueError(f"unknown config options {sorted(unknown)} in {path}")
+        configs = []
+        for name, options in settings.CONFIG_OPTIONS.items():
+            value = config.get(name, options[0])
+            if value not in options:
+                raise ValueError(f"{name} must be one of {options}, not {value!r}")
+            configs.append(value)
+        for topic in spec["topics"]:
+            # Configs that differ only in defaulted options, and rewordings of a topic, are the same course
+            key = (normalize_topic(topic), config_key(configs))
+            if key not in seen:
+                seen.add(key)
+                courses.append((topic, configs))
+    return courses
+
+
+class RateLimiter:
+    """
+    The RateLimiter class lets at most a number of requests per minute start, over all worker threads.
+    Requests wait for the next free slot, so a burst of workers is spread evenly over the minute.
+    It is the request_limiter of the chat model and of the image requests, which acquire it right before a request
+    is sent: answers served by the response cache and images found in the image store do not wait.
+
+    :doc-author: Yusuf
+    """
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class Checkpoint:
+    """
+    The Checkpoint class is an append-only JSON lines file of finished and failed parts of a compile run.
+    Finished parts are kept with the details they were recorded with, e.g. the image id of an image part.
+
+    :doc-author: Yusuf
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = {}
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # The last line of a run that was killed while writing
+                        continue
+                    if record["status"] == "done":
+                        self.done[tuple(record["part"])] = record
+        except OSError:
+            pass
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    @staticmethod
+    def part(topic, configs, index, kind):
+        return (normalize_topic(topic), config_key(configs), index, kind)
+
+    def record(self, part, status, **details):
+        record = {"part": list(part), "status": status, "time": time.time(), **details}
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+            if status == "done":
+                self.done[part] = record
+
+
+class CourseCompiler:
+    """
+    The CourseCompiler class generates complete courses on a bounded thread pool.
+    Parts go through the same functions as prewarm.py and the tools, so the app finds them in the library,
+    the response cache and the image store. Parts that are in the checkpoint and still in the library or the image
+    store are skipped, parts that are in the library already are not generated again.
+
+    :doc-author: Yusuf
+    """
+
+    def __init__(self, llm, checkpoint, workers, images=False):
+        self.llm = llm
+        self.checkpoint = checkpoint
+        self.workers = workers
+        self.images = images
+        self.extract_prompt = get_static_prompts()[1]
+        self.stats = {"parts": 0, "generated": 0, "skipped": 0, "failed": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self.stats[name] += amount
+
+    def _stored(self, part, record):
+        # The library and the image store evict, a part of the checkpoint may be gone since
+        topic, config, index, kind = part
+        if kind == "module":
+            store = get_curriculum_store()
+            return all(
+                store.get_module(topic, config.split("|"), index, name, hit=False) is not None
+                for name in ("module", "flashcard", "quiz")
+            )
+        if kind == "image":
+            return "image_id" in record and get_image_store().exists(record["image_id"])
+        return False
+
+    def _run_part(self, number, part, func, *args, resume=True):
+        # Returns whether the part is there, and the result of func if it ran
+        record = self.checkpoint.done.get(part) if resume else None
+        if record is not None and self._stored(part, record):
+            self._count("skipped")
+            return True, None
+        started = time.perf_counter()
+        try:
+            # Every course is its own session for the fair queue of the model gateway
+            with session_scope(f"compile-{number}"):
+                result, generated = func(*args)
+        except Exception as e:
+            log_info(f"{part} failed: {e}")
+            self.checkpoint.record(part, "failed", error=repr(e))
+            self._count("failed")
+            return False, None
+        details = {"image_id": result} if part[3] == "image" else {}
+        self.checkpoint.record(
+            part,
+            "done",
+            generated=generated,
+            seconds=round(time.perf_counter() - started, 2),
+            **details,
+        )
+        self._count("parts")
+        self._count("generated", generated)
+        return True, result
+
+    def _curriculum(self, topic, configs, prompts):
+        curriculum, generated = prewarm_curriculum(self.llm, prompts, topic, configs)
+        return parse_curriculum(curriculum), int(generated)
+
+    def _module(self, topic, configs, prompts, index, module):
+        return None, prewarm_module(self.llm, prompts, topic, configs, index, module)
+
+    def _image(self, topic, configs, index):
+        content = get_curriculum_store().get_module(topic, configs, index, "module", hit=False)
+        if content is None:
+            raise ValueError(f"module {index + 1} of {topic} is not in the library, it was evicted")
+        # The app asks for the image of a library module the same way, so its key content is a cache hit.
+        # The image request counts against the same requests per minute as the chat requests.
+        image_id = image_generator(
+            self.llm, self.extract_prompt, content, request_limiter=self.llm.request_limiter
+        )
+        return image_id, 1
+
+    def compile(self, courses):
+        """
+        The compile function generates every missing part of the courses.
+
+        :param courses: A list of (topic, config list) tuples
+        :return: The statistics dictionary: finished, generated, skipped and failed parts
+        :doc-author: Yusuf
+        """
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="compile") as executor:
+            pending = {}
+
+            def submit(kind, course, index, *args, resume=True):
+                number, topic, configs, prompts = course
+                part = self.checkpoint.part(topic, configs, index, kind)
+                func = {"curriculum": self._curriculum, "module": self._module, "image": self._image}[kind]
+                future = executor.submit(self._run_part, number, part, func, *args, resume=resume)
+                pending[future] = (kind, course, index)
+
+            for number, (topic, configs) in enumerate(courses):
+                prompts = get_config_prompts(build_config_prompt(configs))
+                course = (number, topic, configs, prompts)
+                # The curriculum is read again on a resumed run, the checkpoint does not hold its modules
+                submit("curriculum", course, None, topic, configs, prompts, resume=False)
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    kind, course, index = pending.pop(future)
+                    _, topic, configs, prompts = course
+                    ok, result = future.result()
+                    if not ok:
+                        continue
+                    if kind == "curriculum":
+                        for module_index, module in enumerate(result):
+                            submit(
+                                "module", course, module_index, topic, configs, prompts, module_index, module
+                            )
+                    elif kind == "module" and self.images and "Image-Containing" in configs:
+                        # The image is generated from the module content, so it waits for the module
+                        submit("image", course, index, topic, configs, index)
+        return self.stats
+
+
+def compile_courses(spec_path, checkpoint_path, workers, rpm=0, images=False):
+    """
+    The compile_courses function compiles the courses of a spec file.
+
+    :param spec_path: Path of the JSON spec file
+    :param checkpoint_path: Path of the checkpoint file, an existing one is continued
+    :param workers: Number of parts generated at the same time
+    :param rpm: Maximum model requests per minute over all workers, 0 for no limit
+    :param images: Generate the module images of image-containing configurations
+    :return: The statistics dictionary of the CourseCompiler
+    :doc-author: Yusuf
+    """
+    install_response_cache()
+    llm = get_chat_model(model_name="gpt-4-1106-preview", temperature=0, streaming=False)
+    if rpm:
+        llm.request_limiter = RateLimiter(rpm)
+    compiler = CourseCompiler(llm, Checkpoint(checkpoint_path), workers, images)
+    return compiler.compile(load_spec(spec_path))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("spec", help="JSON file with topics and configs")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rpm", type=int, default=0, help="model requests per minute, 0 for no limit")
+    parser.add_argument("--images", action="store_true", help="generate images of image-containing configs")
+    parser.add_argument(
+        "--checkpoint",
+        help="checkpoint file, by default next to the library and named after the spec",
+    )
+    args = parser.parse_args()
+    checkpoint_path = args.checkpoint or os.path.join(
+        settings.CACHE_DIR,
+        "compiler",
+        os.path.splitext(os.path.basename(args.spec))[0] + ".jsonl",
+    )
+    started = time.perf_counter()
+    stats = compile_courses(args.spec, checkpoint_path, args.workers, args.rpm, args.images)
+    store = get_curriculum_store()
+    print(
+        f"{stats['parts']} parts compiled ({stats['generated']} generated, the others were in the library), "
+        f"{stats['skipped']} skipped (checkpoint), {stats['failed']} failed "
+        f"in {time.perf_counter() - started:.1f}s"
+    )
+    print(f"library: {len(store)} curricula, {store.size()} bytes, checkpoint: {checkpoint_path}")
+    sys.exit(1 if stats["failed"] else 0)
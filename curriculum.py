@@ -0,0 +1,103 @@
+import hashlib
+
+import streamlit as st
+
+
+class Submodule:
+    """
+    The Submodule class is one "##" section of a curriculum module: its title and its directions.
+
+    :doc-author: Yusuf
+    """
+
+    __slots__ = ("title", "directions")
+
+    def __init__(self, title, directions):
+        self.title = title
+        self.directions = directions
+
+
+class CurriculumModule:
+    """
+    The CurriculumModule class is one module of a curriculum, parsed once when the curriculum is set.
+    The id is a hash of the module markdown, so it stays the same across reruns and changes with the module.
+
+    :doc-author: Yusuf
+    """
+
+    __slots__ = ("module_id", "index", "title", "directions", "submodules", "body", "markdown")
+
+    def __init__(self, module_id, index, title, directions, submodules, body, markdown):
+        self.module_id = module_id
+        self.index = index
+        self.title = title
+        self.directions = directions
+        self.submodules = submodules
+        self.body = body
+        self.markdown = markdown
+
+
+def _directions(line):
+    text = line.lstrip("#").strip()
+    return text.split(":", 1)[1].strip() if text.lower().startswith("directions:") else text
+
+
+def parse_module(index, markdown):
+    """
+    The parse_module function parses the markdown of a curriculum module:
+    "# Module 1: Title", an optional "###### Directions: ..." line and "## Submodule" sections with their directions.
+
+    :param index: Index of the module in the curriculum
+    :param markdown: The markdown of the module
+    :return: A CurriculumModule object
+    :doc-author: Yusuf
+    """
+    lines = markdown.split("\n")
+    directions = ""
+    submodules = []
+    for line in lines[1:]:
+        stripped = line.strip()
+        if stripped.startswith("######"):
+            if submodules:
+                if not submodules[-1].directions:
+                    submodules[-1].directions = _directions(stripped)
+            elif not directions:
+                directions = _directions(stripped)
+        elif stripped.startswith("##") and not stripped.startswith("###"):
+            title = stripped.lstrip("#").replace(":pushpin:", "").strip()
+            submodules.append(Submodule(title, ""))
+    return CurriculumModule(
+        module_id=hashlib.sha256(markdown.encode("utf-8")).hexdigest()[:12],
+        index=index,
+        title=lines[0].replace("#", "").strip(),
+        directions=directions,
+        submodules=submodules,
+        body="\n".join(lines[1:]),
+        markdown=markdown,
+    )
+
+
+def build_curriculum_tree(modules):
+    """
+    The build_curriculum_tree function parses every module of a curriculum.
+
+    :param modules: The module markdowns, as parse_curriculum returns them
+    :return: A list of CurriculumModule objects
+    :doc-author: Yusuf
+    """
+    return [parse_module(index, markdown) for index, markdown in enumerate(modules)]
+
+
+def get_curriculum_tree():
+    """
+    The get_curriculum_tree function returns the module tree of the current curriculum.
+    It is built when the curriculum is set (see tools.set_curriculum), a restored session builds it once here.
+
+    :return: A list of CurriculumModule objects, empty without a curriculum
+    :doc-author: Yusuf
+    """
+    tree = st.session_state.get("curriculum_tree")
+    if tree is None:
+        tree = build_curriculum_tree(st.session_state.get("curriculum") or [])
+        st.session_state["curriculum_tree"] = tree
+    return tree
@@ -0,0 +1,403 @@
+import glob
+import itertools
+import os
+import pickle
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+import settings
+from tracing import log_info
+
+
+def normalize_topic(topic):
+    """
+    The normalize_topic function turns a user topic into the key used by the curriculum store.
+    Case, surrounding punctuation and repeated whitespace are ignored, so "How to cook a steak?" and
+    "how to cook a  steak" map to the same entry.
+
+    :param topic: The topic that user wants to learn
+    :return: The normalized topic
+    :doc-author: Yusuf
+    """
+    topic = re.sub(r"\s+", " ", topic.lower())
+    return topic.strip(" \t\n?!.,;:")
+
+
+def config_key(configs):
+    """
+    The config_key function turns the config list of create_conf_buttons into the key used by the curriculum store.
+
+    :param configs: The user configuration list
+    :return: A string that identifies the configuration
+    :doc-author: Yusuf
+    """
+    return "|".join(configs)
+
+
+class CurriculumStore:
+    """
+    The CurriculumStore class is the shared content library of the server: every generated curriculum and,
+    per module, its content, flashcards and quiz, in a single SQLite database shared by all users.
+    Entries are indexed by (normalized topic, config), and texts are stored zlib-compressed.
+    Every request is counted, so popular topic/config pairs can be pre-warmed (see prewarm.py), and every hit
+    is counted on its pair. When the library grows beyond max_bytes, the least frequently used pairs are
+    deleted with their modules. The size is kept as a running count of this process; other processes write
+    to the same database, so it is counted again from the database before anything is evicted.
+    The database runs in WAL mode, so several Streamlit worker processes can read while one of them writes.
+
+    :doc-author: Yusuf
+    """
+
+    def __init__(self, path, max_bytes=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connection() as connection:
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS curriculum (
+                    topic TEXT NOT NULL,
+                    config TEXT NOT NULL,
+                    content BLOB NOT NULL,
+                    created REAL NOT NULL,
+                    PRIMARY KEY (topic, config)
+                ) WITHOUT ROWID
+                """
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+            )
+            columns = {
+                row[1] for row in connection.execute("PRAGMA table_info(curriculum)")
+            }
+            # Libraries created before hit counting get the popularity columns
+            if "hits" not in columns:
+                connection.execute(
+                    "ALTER TABLE curriculum ADD COLUMN hits INTEGER NOT NULL DEFAULT 0"
+                )
+                connection.execute(
+                    "ALTER TABLE curriculum ADD COLUMN last_used REAL NOT NULL DEFAULT 0"
+                )
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS module (
+                    topic TEXT NOT NULL,
+                    config TEXT NOT NULL,
+                    module_index INTEGER NOT NULL,
+                    kind TEXT NOT NULL,
+                    content BLOB NOT NULL,
+                    created REAL NOT NULL,
+                    PRIMARY KEY (topic, config, module_index, kind)
+                ) WITHOUT ROWID
+                """
+            )
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS request (
+                    topic TEXT NOT NULL,
+                    config TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    last REAL NOT NULL,
+                    PRIMARY KEY (topic, config)
+                ) WITHOUT ROWID
+                """
+            )
+        self._bytes = self.size()
+
+    def _connection(self):
+        # sqlite3 connections can not be shared between threads, so every thread opens its own one
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA mmap_size=67108864")
+            self._local.connection = connection
+        return connection
+
+    def get(self, topic, configs, hit=True):
+        """
+        The get function looks up the curriculum of a topic for the given configuration.
+
+        :param topic: The topic that user wants to learn
+        :param configs: The user configuration list
+        :param hit: Count the lookup as a hit of the pair, off for lookups that do not serve a user
+        :return: The raw curriculum string, or None if it was never generated
+        :doc-author: Yusuf
+        """
+        key = (normalize_topic(topic), config_key(configs))
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT content FROM curriculum WHERE topic = ? AND config = ?", key
+        ).fetchone()
+        if row is None:
+            return None
+        if hit:
+            self._hit(connection, key)
+        return zlib.decompress(row[0]).decode("utf-8")
+
+    def _hit(self, connection, key):
+        with connection:
+            connection.execute(
+                "UPDATE curriculum SET hits = hits + 1, last_used = ? WHERE topic = ? AND config = ?",
+                (time.time(),) + key,
+            )
+
+    def record_request(self, topic, configs):
+        """
+        The record_request function counts a request for a topic and configuration, whether it is in the library or not.
+
+        :param topic: The topic that user wants to learn
+        :param configs: The user configuration list
+        :doc-author: Yusuf
+        """
+        with self._connection() as connection:
+            connection.execute(
+                """
+                INSERT INTO request VALUES (?, ?, 1, ?)
+                ON CONFLICT (topic, config) DO UPDATE SET count = count + 1, last = excluded.last
+                """,
+                (normalize_topic(topic), config_key(configs), time.time()),
+            )
+
+    def top_requests(self, count):
+        """
+        The top_requests function returns the most requested topic/config pairs.
+
+        :param count: Number of pairs
+        :return: A list of (normalized topic, config list, request count) tuples, most requested first
+        :doc-author: Yusuf
+        """
+        rows = self._connection().execute(
+            "SELECT topic, config, count FROM request ORDER BY count DESC, last DESC LIMIT ?",
+            (count,),
+        )
+        return [(topic, config.split("|"), requests) for topic, config, requests in rows]
+
+    def get_module(self, topic, configs, module_index, kind, hit=True):
+        """
+        The get_module function looks up a generated part of a module.
+
+        :param topic: The topic that user wants to learn
+        :param configs: The user configuration list
+        :param module_index: Index of the module in the curriculum
+        :param kind: "module" for the content, "flashcard" or "quiz"
+        :param hit: Count the lookup as a hit of the pair, off for lookups that do not serve a user
+        :return: The text as generated by its chain, or None if it was never generated
+        :doc-author: Yusuf
+        """
+        key = (normalize_topic(topic), config_key(configs))
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT content FROM module WHERE topic = ? AND config = ? AND module_index = ? AND kind = ?",
+            key + (module_index, kind),
+        ).fetchone()
+        if row is None:
+            return None
+        if hit:
+            self._hit(connection, key)
+        return zlib.decompress(row[0]).decode("utf-8")
+
+    def put_module(self, topic, configs, module_index, kind, content):
+        """
+        The put_module function stores a generated part of a module.
+
+        :param topic: The topic that user wants to learn
+        :param configs: The user configuration list
+        :param module_index: Index of the module in the curriculum
+        :param kind: "module" for the content, "flashcard" or "quiz"
+        :param content: The text as generated by its chain
+        :doc-author: Yusuf
+        """
+        key = (normalize_topic(topic), config_key(configs))
+        data = zlib.compress(content.encode("utf-8"))
+        with self._connection() as connection:
+            replaced = connection.execute(
+                "SELECT LENGTH(content) FROM module WHERE topic = ? AND config = ? AND module_index = ? AND kind = ?",
+                key + (module_index, kind),
+            ).fetchone()
+            connection.execute(
+                "INSERT OR REPLACE INTO module VALUES (?, ?, ?, ?, ?, ?)",
+                key + (module_index, kind, data, time.time()),
+            )
+        self._bytes += len(data) - (replaced[0] if replaced else 0)
+        self._evict(key)
+
+    def size(self):
+        """
+        The size function returns the compressed size of all texts in the library.
+
+        :return: Size in bytes
+        :doc-author: Yusuf
+        """
+        connection = self._connection()
+        return sum(
+            connection.execute(f"SELECT COALESCE(SUM(LENGTH(content)), 0) FROM {table}").fetchone()[0]
+            for table in ("curriculum", "module")
+        )
+
+    def _pair_bytes(self, connection, table, key):
+        return connection.execute(
+            f"SELECT COALESCE(SUM(LENGTH(content)), 0) FROM {table} WHERE topic = ? AND config = ?",
+            key,
+        ).fetchone()[0]
+
+    def _evict(self, keep):
+        if self.max_bytes is None or self._bytes <= self.max_bytes:
+            return
+        connection = self._connection()
+        size = self.size()
+        # Modules whose curriculum was evicted or replaced while a session was still learning them
+        orphans = """
+            FROM module WHERE NOT (topic = ? AND config = ?) AND NOT EXISTS (
+                SELECT 1 FROM curriculum
+                WHERE curriculum.topic = module.topic AND curriculum.config = module.config
+            )
+        """
+        with connection:
+            size -= connection.execute(
+                f"SELECT COALESCE(SUM(LENGTH(content)), 0) {orphans}", keep
+            ).fetchone()[0]
+            connection.execute(f"DELETE {orphans}", keep)
+        self._bytes = size
+        if size <= self.max_bytes:
+            return
+        # Least frequently used pairs first, the least recently used among equally popular ones
+        pairs = connection.execute(
+            "SELECT topic, config FROM curriculum ORDER BY hits ASC, last_used ASC"
+        ).fetchall()
+        # Drop down to 90% of the budget so that we do not evict on every write
+        target = int(self.max_bytes * 0.9)
+        for key in pairs:
+            if size <= target:
+                break
+            # The pair that was just written has no hits yet, but it is the one a user is waiting for
+            if key == keep:
+                continue
+            with connection:
+                for table in ("curriculum", "module"):
+                    size -= self._pair_bytes(connection, table, key)
+                    connection.execute(
+                        f"DELETE FROM {table} WHERE topic = ? AND config = ?", key
+                    )
+            self.evictions += 1
+        self._bytes = size
+
+    def put(self, topic, configs, curriculum):
+        """
+        The put function stores the raw curriculum string of a topic for the given configuration.
+
+        :param topic: The topic that user wants to learn
+        :param configs: The user configuration list
+        :param curriculum: The raw curriculum string, as returned by the curriculum chain
+        :doc-author: Yusuf
+        """
+        key = (normalize_topic(topic), config_key(configs))
+        data = zlib.compress(curriculum.encode("utf-8"))
+        with self._connection() as connection:
+            replaced = sum(
+                self._pair_bytes(connection, table, key) for table in ("curriculum", "module")
+            )
+            # Modules of a previous curriculum of the pair do not belong to the new one
+            connection.execute("DELETE FROM module WHERE topic = ? AND config = ?", key)
+            connection.execute(
+                """
+                INSERT OR REPLACE INTO curriculum (topic, config, content, created, hits, last_used)
+                VALUES (?, ?, ?, ?, 0, ?)
+                """,
+                key + (data, time.time(), time.time()),
+            )
+        self._bytes += len(data) - replaced
+        self._evict(key)
+
+    def pairs(self):
+        """
+        The pairs function lists the topic/config pairs that have a curriculum.
+
+        :return: A list of (normalized topic, config list) tuples
+        :doc-author: Yusuf
+        """
+        rows = self._connection().execute("SELECT topic, config FROM curriculum")
+        return [(topic, config.split("|")) for topic, config in rows]
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM curriculum").fetchone()[0]
+
+    def migrate_pickle_cache(self, directory):
+        """
+        The migrate_pickle_cache function moves the old one-pickle-per-topic cache files into the store.
+        Files are named '<topic with dashes>_<configs joined by dashes>.pkl'. Since config values may contain
+        dashes themselves, the config part is matched against every combination of create_conf_buttons.
+        Migrated files are deleted, unreadable ones are skipped. The migration runs only once per database.
+
+        :param directory: Folder that contains the old .pkl files
+        :return: Number of migrated files
+        :doc-author: Yusuf
+        """
+        connection = self._connection()
+        done = connection.execute(
+            "SELECT value FROM meta WHERE key = 'pickle_migrated'"
+        ).fetchone()
+        if done is not None:
+            return 0
+        known_configs = {
+            "-".join(configs): list(configs)
+            for configs in itertools.product(*settings.CONFIG_OPTIONS.values())
+        }
+        migrated = 0
+        for path in glob.glob(os.path.join(directory, "*.pkl")):
+            name = os.path.basename(path)[: -len(".pkl")]
+            topic, _, configs = name.rpartition("_")
+            if not topic or configs not in known_configs:
+                log_info(f"skip unknown curriculum cache file {path}")
+                continue
+            # Old cache files were written by this app, so loading them once is safe
+            try:
+                with open(path, "rb") as f:
+                    curriculum = pickle.load(f)
+            except FileNotFoundError:
+                # Another server process that started at the same time migrated it
+                continue
+            except (pickle.UnpicklingError, EOFError) as e:
+                log_info(f"skip unreadable curriculum cache file {path}: {e}")
+                continue
+            self.put(topic.replace("-", " "), known_configs[configs], curriculum)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            migrated += 1
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('pickle_migrated', ?)",
+                (str(time.time()),),
+            )
+        log_info(f"migrated {migrated} curriculum pickle files")
+        return migrated
+
+
+_curriculum_store = None
+_curriculum_store_lock = threading.Lock()
+
+
+def get_curriculum_store():
+    """
+    The get_curriculum_store function returns the process-wide CurriculumStore.
+    On first use it also migrates the old .pkl cache files of generate_curriculum.
+
+    :return: The CurriculumStore object
+    :doc-author: Yusuf
+    """
+    global _curriculum_store
+    with _curriculum_store_lock:
+        if _curriculum_store is None:
+            _curriculum_store = CurriculumStore(
+                settings.CURRICULUM_DB_PATH, settings.LIBRARY_MAX_BYTES
+            )
+            _curriculum_store.migrate_pickle_cache(settings.CACHE_DIR)
+        return _curriculum_store
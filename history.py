@@ -0,0 +1,239 @@
+import hashlib
+import zlib
+
+import streamlit as st
+
+import settings
+from session_store import mark_changed
+
+# Message fields that can hold long texts (module contents, answers, analyses)
+TEXT_FIELDS = ("content", "output", "analysis")
+
+
+class PayloadRef:
+    """
+    The PayloadRef class stands in a history message for a long text that is kept in the payload side store.
+    It carries a short preview, so collapsed messages can be shown without loading the text.
+
+    :doc-author: Yusuf
+    """
+
+    __slots__ = ("payload_id", "preview", "length")
+
+    def __init__(self, payload_id, preview, length):
+        self.payload_id = payload_id
+        self.preview = preview
+        self.length = length
+
+
+def get_payloads():
+    """
+    The get_payloads function returns the payload side store of the session: payload id to compressed text.
+    save_session_state writes a payload to the state backend once and leaves it out of the per-run snapshot.
+    Only the payloads of messages in the stub window stay in session state (see offload_payloads),
+    older ones are loaded from the state backend when their message is expanded.
+
+    :return: The dictionary of payloads
+    :doc-author: Yusuf
+    """
+    return st.session_state.setdefault("history_payloads", {})
+
+
+def message_payload_ids(messages):
+    """
+    The message_payload_ids function returns the ids of the payloads that messages reference.
+
+    :param messages: A list of message dictionaries
+    :return: A list of payload ids
+    :doc-author: Yusuf
+    """
+    return [value.payload_id for message in messages for value in message.values() if isinstance(value, PayloadRef)]
+
+
+def resident_payload_ids():
+    """
+    The resident_payload_ids function returns the ids of the payloads that are kept in session state:
+    the ones of messages in the stub window and of expanded messages.
+
+    :return: A set of payload ids
+    :doc-author: Yusuf
+    """
+    messages = st.session_state.get("messages", [])
+    stub_from = _stub_from(messages)
+    expanded = [messages[index] for index in st.session_state.get("history_expanded", set()) if index < stub_from]
+    return set(message_payload_ids(messages[stub_from:] + expanded))
+
+
+def load_payloads(payload_ids):
+    """
+    The load_payloads function puts payloads that are not in session state back from the state backend.
+
+    :param payload_ids: A list of payload ids
+    :doc-author: Yusuf
+    """
+    # state_store imports this module for PayloadRef
+    from state_store import get_state_backend
+
+    payloads = get_payloads()
+    missing = [payload_id for payload_id in payload_ids if payload_id not in payloads]
+    if not missing:
+        return
+    for key, data in get_state_backend().get_many([f"payload:{payload_id}" for payload_id in missing]).items():
+        payloads[key.split(":", 1)[1]] = data
+
+
+def offload_payloads(saved_payloads):
+    """
+    The offload_payloads function drops the payloads that only messages before the stub window reference
+    from session state, so it stays bounded while the conversation grows.
+    Only payloads that are written to the state backend are dropped, _expand loads them again.
+
+    :param saved_payloads: The set of payload ids that are written to the state backend
+    :return: Number of dropped payloads
+    :doc-author: Yusuf
+    """
+    payloads = get_payloads()
+    resident = resident_payload_ids()
+    dropped = [payload_id for payload_id in payloads if payload_id in saved_payloads and payload_id not in resident]
+    for payload_id in dropped:
+        del payloads[payload_id]
+    return len(dropped)
+
+
+def make_preview(text, width=80):
+    """
+    The make_preview function returns the first line of a markdown text without heading marks, shortened to width.
+
+    :param text: The markdown text
+    :param width: Maximum length of the preview
+    :return: The preview
+    :doc-author: Yusuf
+    """
+    for line in text.splitlines():
+        line = line.strip().lstrip("#").replace("*", "").strip()
+        if line:
+            return line if len(line) <= width else line[: width - 1] + "…"
+    return ""
+
+
+def put_payload(text):
+    """
+    The put_payload function moves a long text into the payload side store of the session.
+    Texts are stored zlib-compressed under their hash, so the same text is kept once.
+
+    :param text: The text
+    :return: A PayloadRef object
+    :doc-author: Yusuf
+    """
+    payload_id = hashlib.sha256(text.encode("utf-8")).hexdigest()[:24]
+    get_payloads()[payload_id] = zlib.compress(text.encode("utf-8"))
+    return PayloadRef(payload_id, make_preview(text), len(text))
+
+
+def resolve(value):
+    """
+    The resolve function returns the text of a message field, loading it from the side store if it was moved there.
+    A payload that is not in session state is loaded from the state backend.
+
+    :param value: A text or a PayloadRef
+    :return: The text
+    :doc-author: Yusuf
+    """
+    if not isinstance(value, PayloadRef):
+        return value
+    data = get_payloads().get(value.payload_id)
+    if data is None:
+        load_payloads([value.payload_id])
+        data = get_payloads().get(value.payload_id)
+    if data is None:
+        return "*This message is no longer available.*"
+    return zlib.decompress(data).decode("utf-8")
+
+
+def append_message(message):
+    """
+    The append_message function adds a message to the chat history. Texts longer than HISTORY_INLINE_CHARS
+    are moved to the payload side store, so session state only keeps small messages.
+
+    :param message: The message dictionary, with role and one of content, quiz_id, analysis or image_module
+                    (with the image_key of its image stage)
+    :doc-author: Yusuf
+    """
+    for field in TEXT_FIELDS:
+        text = message.get(field)
+        if isinstance(text, str) and len(text) > settings.HISTORY_INLINE_CHARS:
+            message[field] = put_payload(text)
+    st.session_state.setdefault("messages", []).append(message)
+    mark_changed("messages")
+
+
+def message_preview(message):
+    """
+    The message_preview function returns the one-line summary a collapsed message is shown with.
+
+    :param message: The message dictionary
+    :return: The preview
+    :doc-author: Yusuf
+    """
+    if "quiz_id" in message:
+        return f"📝 Quiz of module {message['quiz_id'].rsplit('_', 1)[-1]}"
+    if "analysis" in message:
+        return "📊 Analysis of your quiz results"
+    for field in TEXT_FIELDS:
+        value = message.get(field)
+        if isinstance(value, PayloadRef):
+            return value.preview
+        if isinstance(value, str):
+            return make_preview(value)
+    return ""
+
+
+def _stub_from(messages):
+    full_from = max(0, len(messages) - settings.HISTORY_FULL_MESSAGES)
+    return max(0, full_from - st.session_state.get("history_stub_messages", settings.HISTORY_STUB_MESSAGES))
+
+
+def _expand(index):
+    st.session_state.setdefault("history_expanded", set()).add(index)
+    mark_changed("history_expanded")
+    load_payloads(message_payload_ids(st.session_state.get("messages", [])[index : index + 1]))
+
+
+def _show_earlier():
+    st.session_state["history_stub_messages"] = (
+        st.session_state.get("history_stub_messages", settings.HISTORY_STUB_MESSAGES)
+        + settings.HISTORY_STUB_MESSAGES
+    )
+
+
+def render_history(render_message):
+    """
+    The render_history function renders the chat history with a cost that depends on the visible messages only.
+    The last HISTORY_FULL_MESSAGES messages are rendered fully. Older messages are rendered as one-line stubs
+    that the user can expand one by one, and messages beyond the stub window are hidden behind a button.
+
+    :param render_message: Function that renders one message fully inside its chat message container
+    :doc-author: Yusuf
+    """
+    messages = st.session_state.get("messages", [])
+    expanded = st.session_state.get("history_expanded", set())
+    full_from = max(0, len(messages) - settings.HISTORY_FULL_MESSAGES)
+    stub_from = _stub_from(messages)
+    if stub_from > 0:
+        st.button(
+            f"Show earlier messages ({stub_from} hidden)",
+            key="history_show_earlier",
+            on_click=_show_earlier,
+        )
+    for index in range(stub_from, len(messages)):
+        message = messages[index]
+        with st.chat_message(message["role"]):
+            if index >= full_from or index in expanded:
+                render_message(message)
+            else:
+                st.button(
+                    message_preview(message) or "…",
+                    key=f"history_stub_{index}",
+                    on_click=_expand,
+                    args=(index,),
+                )
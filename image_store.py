@@ -0,0 +1,174 @@
+import hashlib
+import io
+import os
+import threading
+
+from PIL import Image
+
+import settings
+
+
+def transcode_image(data, max_size, quality):
+    """
+    The transcode_image function scales an image down to display resolution and compresses it as WebP.
+
+    :param data: The image bytes in any format Pillow can read
+    :param max_size: Longest side of the stored image in pixels
+    :param quality: WebP quality from 0 to 100
+    :return: The WebP image as bytes
+    :doc-author: Yusuf
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        image.thumbnail((max_size, max_size), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, format="WEBP", quality=quality, method=4)
+    return buffer.getvalue()
+
+
+class ImageStore:
+    """
+    The ImageStore class keeps generated images as content-addressed blobs on local disk.
+    A blob is named by the SHA-256 of its bytes, so the same image is stored once however often it is generated.
+    A second index maps the key content an image was generated for to its blob, so the same module does not
+    pay for an image twice. The least recently used blobs are deleted once the store grows beyond max_bytes.
+
+    :doc-author: Yusuf
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self.blob_directory = os.path.join(directory, "blobs")
+        self.key_directory = os.path.join(directory, "keys")
+        self._lock = threading.Lock()
+        os.makedirs(self.blob_directory, exist_ok=True)
+        os.makedirs(self.key_directory, exist_ok=True)
+        self.size = sum(
+            entry.stat().st_size
+            for entry in os.scandir(self.blob_directory)
+            if entry.is_file()
+        )
+
+    def _blob_path(self, image_id):
+        return os.path.join(self.blob_directory, f"{image_id}.webp")
+
+    def _key_path(self, key):
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.key_directory, digest)
+
+    def _write(self, path, data):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def put(self, data):
+        """
+        The put function stores an image blob.
+
+        :param data: The image bytes, already transcoded
+        :return: The image id, the SHA-256 of the bytes
+        :doc-author: Yusuf
+        """
+        image_id = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(image_id)
+        if os.path.exists(path):
+            os.utime(path)
+            return image_id
+        self._write(path, data)
+        with self._lock:
+            self.size += len(data)
+        if self.size > self.max_bytes:
+            self._evict()
+        return image_id
+
+    def read(self, image_id):
+        """
+        The read function returns the bytes of an image blob.
+
+        :param image_id: The image id
+        :return: The image bytes, or None if the blob was evicted
+        :doc-author: Yusuf
+        """
+        path = self._blob_path(image_id)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def exists(self, image_id):
+        """
+        The exists function tells whether the blob of an image is still in the store.
+
+        :param image_id: The image id
+        :return: True if the blob was not evicted
+        :doc-author: Yusuf
+        """
+        return os.path.exists(self._blob_path(image_id))
+
+    def lookup(self, key):
+        """
+        The lookup function returns the image that was generated for a key before.
+
+        :param key: The key content the image was generated for
+        :return: The image id, or None if there is no image for the key or its blob was evicted
+        :doc-author: Yusuf
+        """
+        try:
+            with open(self._key_path(key), "r", encoding="utf-8") as f:
+                image_id = f.read().strip()
+        except OSError:
+            return None
+        return image_id if self.exists(image_id) else None
+
+    def remember(self, key, image_id):
+        self._write(self._key_path(key), image_id.encode("utf-8"))
+
+    def _evict(self):
+        entries = [
+            entry
+            for entry in os.scandir(self.blob_directory)
+            if entry.is_file() and entry.name.endswith(".webp")
+        ]
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        # Drop down to 90% of the budget so that we do not evict on every write
+        target = int(self.max_bytes * 0.9)
+        for entry in entries:
+            if self.size <= target:
+                break
+            with self._lock:
+                try:
+                    size = entry.stat().st_size
+                    os.remove(entry.path)
+                except OSError:
+                    continue
+                self.size -= size
+                self.evictions += 1
+
+
+_image_store = None
+_image_store_lock = threading.Lock()
+
+
+def get_image_store():
+    """
+    The get_image_store function returns the process-wide ImageStore.
+
+    :return: The ImageStore object
+    :doc-author: Yusuf
+    """
+    global _image_store
+    with _image_store_lock:
+        if _image_store is None:
+            _image_store = ImageStore(
+                settings.IMAGE_STORE_DIR, settings.IMAGE_STORE_BYTES
+            )
+        return _image_store
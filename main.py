@@ -4,29 +4,63 @@ import sys
 sys.path.append(os.path.abspath("."))
 import streamlit as st
 
+import settings
+
 st.set_page_config(
     page_title="The Chef",
     page_icon="🧑‍🍳",
     layout="wide",
     initial_sidebar_state="auto",
 )
+# The header is the first paint, it is sent before the app modules are imported
+st.header(
+    "🧑‍🍳 The Chef: Anytime, Anywhere, Just for You, Understanding You Better Than You Do"
+)
 
 from utils import (
     create_conf_buttons,
-    display_images,
+    display_module_image,
     display_quiz,
-    get_flashcard_color,
+    flashcards_html,
     handle_module_click,
     initialize_llm,
+    initialize_memory,
     initialize_ui,
+    restore_session_state,
+    save_session_state,
     visualize_quiz_results,
 )
 
 initialize_ui()
-from langchain.callbacks import StreamlitCallbackHandler
+from curriculum import get_curriculum_tree
+from history import append_message, render_history, resolve
+from router import router_stats
+from streaming import start_stream, stop_stream
+from pipeline import get_pipeline
+from session_store import current_session_id
+from tracing import get_tracer, log_info
+from warmup import start_warmup, wait_warmup
 
-from agent import get_agent
-from tools import calculate_score
+
+def load_agent():
+    """
+    The load_agent function returns the agent of the session, with the language model and the memory it uses.
+    LangChain, the tools and the agent are imported here on the first request and not on the first page load;
+    the warm-up has usually imported them by then.
+
+    :return: The IntentRouter object
+    :doc-author: Yusuf
+    """
+    wait_warmup("agent")
+    from agent import get_agent
+
+    st.session_state["llm"] = initialize_llm()
+    (
+        st.session_state["memory"],
+        st.session_state["readonlymemory"],
+    ) = initialize_memory(st.session_state["llm"])
+    # The agent is built once per session, a config change only rebuilds the config prompts
+    return get_agent()
 
 
 def run_agent(user_input):
@@ -40,31 +74,46 @@ def run_agent(user_input):
     :param user_input: Pass the user's input to the agent
     :doc-author: Yusuf
     """
-    st.session_state.messages.append({"role": "user", "content": user_input})
+    agent = load_agent()
+    wait_warmup("langchain.callbacks")
+    from langchain.callbacks import StreamlitCallbackHandler
+
+    from cache import get_response_cache
+    from memory import memory_stats
+    from tools import calculate_score
+
+    append_message({"role": "user", "content": user_input})
     # Display user message in chat message container
     with st.chat_message("user"):
         st.markdown(user_input)
     # Display assistant response in chat message container
     with st.chat_message("assistant"):
         message_placeholder = st.empty()
-        with st.spinner("I am thinking ..."):
-            container = st.container()
-            st_cb = StreamlitCallbackHandler(container)
-            print("\nINFO: User input: ", user_input)
-            response = agent.run(user_input, callbacks=[st_cb])
+        # Tools with return_direct=True stream their tokens into message_placeholder
+        start_stream(message_placeholder)
+        try:
+            with st.spinner("I am thinking ..."):
+                container = st.container()
+                st_cb = StreamlitCallbackHandler(container)
+                log_info(f"User input: {user_input}")
+                with get_tracer().span(
+                    "agent_run", "agent", input_chars=len(user_input)
+                ):
+                    response = agent.run(user_input, callbacks=[st_cb])
+        finally:
+            # The streamed preview is replaced by the final rendering below
+            metrics = stop_stream()
         if response.startswith("Quiz generated "):
-            quiz = response.replace("Quiz generated ", "")
-            quiz_id = st.session_state.get("quiz_curriculum_id", "quiz_unknown")
-            st.session_state.messages.append(
-                {"role": "assistant", "content_quiz": quiz, "id": quiz_id}
-            )
+            # quiz_generator parsed the quiz into the quiz index, the history only keeps its id
+            quiz_id = response[len("Quiz generated ") :].split("\n", 1)[0]
+            append_message({"role": "assistant", "quiz_id": quiz_id})
             display_quiz(quiz_id)
         elif response.startswith("ANALYSIS:"):
             analysis = response.replace("ANALYSIS:", "")
             scores, total = calculate_score(return_string=False)
             visualize_quiz_results(scores, total)
             st.markdown(analysis)
-            st.session_state.messages.append(
+            append_message(
                 {
                     "role": "assistant",
                     "analysis": analysis,
@@ -74,42 +123,67 @@ def run_agent(user_input):
             )
         elif response.startswith("Image generated "):
             output = response.replace("Image generated ", "")
-            image_url = st.session_state["image_url"][
-                st.session_state["last_module_number"]
-            ]
-            display_images(image_url)
+            # The image is still being generated, collect_module_stages puts its id into the message
+            message = {
+                "role": "assistant",
+                "output": output,
+                "image_module": st.session_state["last_module_number"],
+                "image_key": st.session_state["last_image_key"],
+            }
+            display_module_image(message)
             st.markdown(output)
-            st.session_state.messages.append(
-                {"role": "assistant", "output": output, "image_url": image_url}
-            )
+            append_message(message)
 
         else:
             st.markdown(response)
-            st.session_state.messages.append({"role": "assistant", "content": response})
+            append_message({"role": "assistant", "content": response})
+        if metrics["time_to_first_token"] is not None:
+            st.caption(
+                f"First token after {metrics['time_to_first_token']:.2f}s, done after {metrics['total_latency']:.2f}s"
+            )
+        log_info(f"Response cache stats: {get_response_cache().stats()}")
+        log_info(f"Router stats: {router_stats()}")
+        log_info(f"Memory stats: {memory_stats()}")
         # print(f' Memory: {st.session_state["memory"].load_memory_variables({})}')
 
 
-if __name__ == "__main__":
+def render_message(message):
+    """
+    The render_message function renders one chat history message fully.
 
-    # Display the header and sidebar
-    st.header(
-        "🧑‍🍳 The Chef: Anytime, Anywhere, Just for You, Understanding You Better Than You Do"
-    )
-    (
-        st.session_state["llm"],
-        st.session_state["memory"],
-        st.session_state["readonlymemory"],
-    ) = initialize_llm()
-    agent = get_agent()
+    :param message: The message dictionary
+    :doc-author: Yusuf
+    """
+    if "content" in message:
+        st.markdown(resolve(message["content"]))
+    elif "quiz_id" in message:
+        display_quiz(message["quiz_id"])
+    elif "analysis" in message:
+        visualize_quiz_results(message["scores"], message["total"])
+        st.markdown(resolve(message["analysis"]))
+    elif "image_module" in message:
+        display_module_image(message)
+        st.markdown(resolve(message["output"]))
+
+
+if __name__ == "__main__":
+    # Spans left open by a rerun that was interrupted are dropped with root=True
+    rerun_span = get_tracer().start_span("rerun", "rerun", root=True)
+    # A reloaded page or another server process continues the session where it was
+    restore_session_state()
 
     # set user configuration
     user_config = create_conf_buttons()
 
-    if st.session_state.get("config_changed", False):
-        if "llm" in st.session_state:
-            agent = get_agent()  # Recreate or update the agent
-        # Reset the flag
-        st.session_state["config_changed"] = False
+    # Only a session whose agent ran in this process has prefetches and background stages
+    agent_loaded = "agent_registry" in st.session_state
+    if agent_loaded:
+        from tools import cancel_prefetch, collect_module_stages
+    if agent_loaded and st.session_state.get("config_changed", False):
+        # Prefetched modules were generated for the old config
+        cancel_prefetch()
+    # Reset the flag
+    st.session_state["config_changed"] = False
 
     if "user_input" not in st.session_state:
         st.session_state["user_input"] = ""
@@ -125,19 +199,12 @@ if __name__ == "__main__":
     # if 'user_config' not in st.session_state:
     #    st.session_state["user_config"] = ""
 
-    # Display chat messages from history on app rerun
-    for message in st.session_state.messages:
-        with st.chat_message(message["role"]):
-            if "content" in message:
-                st.markdown(message["content"])
-            elif "content_quiz" in message:
-                display_quiz(message["id"])
-            elif "analysis" in message:
-                visualize_quiz_results(message["scores"], message["total"])
-                st.markdown(message["analysis"])
-            elif "image_url" in message:
-                display_images(message["image_url"])
-                st.markdown(message["output"])
+    # Put flashcards and images that were generated in the background into session state
+    if agent_loaded:
+        collect_module_stages()
+
+    # Display chat messages from history on app rerun, older ones collapsed
+    render_history(render_message)
 
     # Initialize session state for prepopulated text if not present
     if "prepopulated_text" not in st.session_state:
@@ -147,9 +214,7 @@ if __name__ == "__main__":
     prompts = """how to cook a steak?"""
     continue_button = st.button(prompts, key=prompts)
 
-    print(
-        "INFO: sidebar_request from sidebar: ", st.session_state.get("sidebar_request")
-    )
+    log_info(f"sidebar_request from sidebar: {st.session_state.get('sidebar_request')}")
     if (
         user_input := st.chat_input("What is your action?")
         or continue_button
@@ -158,57 +223,65 @@ if __name__ == "__main__":
         if continue_button:
             user_input = prompts
         if st.session_state.get("sidebar_request") is not None:
-            print(
-                "INFO: sidebar_request from sidebar: ",
-                st.session_state.get("sidebar_request"),
+            log_info(
+                f"sidebar_request from sidebar: {st.session_state.get('sidebar_request')}"
             )
             user_input = st.session_state.get("sidebar_request")
             st.session_state["sidebar_request"] = None
-            print("INFO: Side bar request is detected")
+            log_info("Side bar request is detected")
         run_agent(user_input)
 
     if "curriculum" in st.session_state and st.session_state["curriculum"] != "":
         with st.sidebar:
             st.markdown("# Curriculum")
 
-            # Iterate through each module in the curriculum
-            for idx, module_markdown in enumerate(st.session_state["curriculum"]):
-                # Split the markdown content by '##' to separate the title from the content
-                module_parts = module_markdown.split("##")
-                module_title = module_parts[0].split("\n")[0].replace("#", "").strip()
-                module_content = "\n".join(module_markdown.split("\n")[1:])
-
+            # The module tree is parsed when the curriculum is set, the flashcard HTML is memoized per module
+            flashcards = st.session_state.get("flashcard", None)
+            for module in get_curriculum_tree():
+                idx = module.index
                 # Create a unique key for each button based on the module index
                 button_key = f"module_button_{idx}"
                 quiz_key = f"quiz_button_{idx}"
                 # Use columns to place the button next to the module title
                 col1, col2 = st.columns([0.8, 0.2], gap="small")
                 with col1:
-                    with st.expander(module_title):
-                        st.markdown(module_content)
+                    with st.expander(module.title):
+                        st.markdown(module.body)
                         # Display flashcards under the title
-                        if (
-                            st.session_state.get("flashcard", None) is not None
-                            and st.session_state["flashcard"][idx] is not None
-                        ):
-                            st.markdown("\n\n--- Flashcards ---")
-                            for card_idx, card in enumerate(
-                                st.session_state["flashcard"][idx].split("####")
-                            ):
-                                # Create a colored button for each flashcard
-                                button_html = f"<button style='background-color: {get_flashcard_color(card_idx)}; color: white; border: none; padding: 10px 20px; text-align: center; text-decoration: none; display: inline-block; font-size: 16px; margin: 4px 2px; cursor: pointer;'>{card}</button>"
-                                st.markdown(button_html, unsafe_allow_html=True)
+                        if flashcards is not None and flashcards[idx] is not None:
+                            st.markdown(flashcards_html(flashcards[idx]), unsafe_allow_html=True)
                 with col2:
                     # Create a button with an emoji icon for each module
-                    if st.button("📖", key=button_key):
-                        handle_module_click(idx, "module")
-                        st.experimental_rerun()
-                    if st.button("📝", key=quiz_key):
-                        handle_module_click(idx, "quiz")
-                        st.experimental_rerun()
+                    # Callbacks run before the next script run, so the request is handled in that run
+                    st.button(
+                        "📖",
+                        key=button_key,
+                        on_click=handle_module_click,
+                        args=(idx, "module"),
+                    )
+                    st.button(
+                        "📝",
+                        key=quiz_key,
+                        on_click=handle_module_click,
+                        args=(idx, "quiz"),
+                    )
 
             c = st.container()
             # Green button
-            if c.button("Analyse Me!", key="green_button", args={"color": "green"}):
-                handle_module_click(idx, "analyse")
-                st.experimental_rerun()
+            c.button(
+                "Analyse Me!",
+                key="green_button",
+                on_click=handle_module_click,
+                args=(idx, "analyse"),
+            )
+
+    # Other server processes continue from here if the next request of the session lands there
+    save_session_state()
+    get_tracer().end_span(rerun_span)
+    # The page is complete, the agent stack is imported while the user reads it
+    start_warmup()
+
+    # Rerun as soon as a background stage finishes, so its flashcards or image show up
+    if get_pipeline().pending(current_session_id()):
+        get_pipeline().wait(current_session_id(), settings.PIPELINE_POLL_SECONDS)
+        st.experimental_rerun()
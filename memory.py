@@ -0,0 +1,366 @@
+import hashlib
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain.memory.summary import SummarizerMixin
+from langchain_core.memory import BaseMemory
+from langchain_core.messages import (
+    AIMessage,
+    HumanMessage,
+    get_buffer_string,
+    messages_from_dict,
+    messages_to_dict,
+)
+from langchain_core.pydantic_v1 import PrivateAttr
+
+import settings
+from session_store import current_session_id, session_scope
+from tokens import count_tokens
+from tracing import get_tracer, log_info
+
+_summary_executor = None
+_summary_executor_lock = threading.Lock()
+
+# Latency memory adds to the request, per operation, over the last calls of the process
+_latencies = {"load": deque(maxlen=1000), "save": deque(maxlen=1000)}
+_summaries = {"done": 0, "failed": 0, "seconds": 0.0}
+_stats_lock = threading.Lock()
+
+# Start of an artifact reference, see BackgroundSummaryMemory.save_artifact
+_ARTIFACT_REFERENCE = re.compile(r"\[artifact ([0-9a-f]{12}), \d+ chars: ")
+
+
+def _get_summary_executor():
+    global _summary_executor
+    with _summary_executor_lock:
+        if _summary_executor is None:
+            _summary_executor = ThreadPoolExecutor(
+                max_workers=settings.MEMORY_SUMMARY_WORKERS,
+                thread_name_prefix="summary",
+            )
+        return _summary_executor
+
+
+def _record(operation, seconds):
+    with _stats_lock:
+        _latencies[operation].append(seconds)
+    # Shows up on the span of the chain or agent run that used the memory
+    get_tracer().count(f"memory_{operation}_ms", round(seconds * 1000, 3))
+
+
+def memory_stats():
+    """
+    The memory_stats function reports the latency the conversation memory adds to requests and the background summaries.
+
+    :return: A dictionary with p50 and max milliseconds of load and save, and the number and duration of summaries
+    :doc-author: Yusuf
+    """
+    with _stats_lock:
+        stats = {}
+        for operation, values in _latencies.items():
+            ordered = sorted(values)
+            stats[f"{operation}_count"] = len(ordered)
+            stats[f"{operation}_p50_ms"] = (
+                round(ordered[len(ordered) // 2] * 1000, 2) if ordered else 0.0
+            )
+            stats[f"{operation}_max_ms"] = round(ordered[-1] * 1000, 2) if ordered else 0.0
+        stats["summaries"] = _summaries["done"]
+        stats["summaries_failed"] = _summaries["failed"]
+        stats["summary_seconds"] = round(_summaries["seconds"], 2)
+    return stats
+
+
+def artifact_preview(text, max_lines=8, width=200):
+    """
+    The artifact_preview function returns the short text an artifact is referenced with in the conversation.
+    Markdown texts (curriculum, module content) are previewed by their headings, other texts by their beginning.
+
+    :param text: The artifact text
+    :param max_lines: Maximum number of headings
+    :param width: Maximum length of a preview without headings
+    :return: The preview
+    :doc-author: Yusuf
+    """
+    headings = [
+        line.lstrip("#").replace("*", "").replace(":pushpin:", "").strip()
+        for line in text.splitlines()
+        if line.startswith("#") and not line.startswith("######")
+    ]
+    headings = [heading for heading in headings if heading]
+    if headings:
+        more = f" (+{len(headings) - max_lines} more)" if len(headings) > max_lines else ""
+        return "; ".join(headings[:max_lines]) + more
+    text = " ".join(text.split())
+    return text if len(text) <= width else text[: width - 1] + "…"
+
+
+class BackgroundSummaryMemory(BaseChatMemory, SummarizerMixin):
+    """
+    The BackgroundSummaryMemory class is a summary buffer memory that never calls the model while a request waits.
+    When the buffer grows beyond max_token_limit, the oldest messages are moved to a pending list and summarized on
+    a background worker. Until the new summary is ready, the last summary and the pending messages are loaded instead.
+    Texts longer than artifact_chars (curriculum, module content, quizzes) are kept out of the buffer as artifacts:
+    the conversation only holds a reference with their id and a preview, the text is available through artifact().
+    The agent sees the references; ArtifactMemory and the summaries see the texts. The last max_artifacts are kept.
+
+    :doc-author: Yusuf
+    """
+
+    max_token_limit: int = 2000
+    artifact_chars: int = 2000
+    max_artifacts: int = 32
+    moving_summary_buffer: str = ""
+    memory_key: str = "history"
+
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _pending: List[Any] = PrivateAttr(default_factory=list)
+    _future: Any = PrivateAttr(default=None)
+    _artifacts: Dict[str, str] = PrivateAttr(default_factory=dict)
+    _version: int = PrivateAttr(default=0)
+
+    @property
+    def buffer(self):
+        return self.chat_memory.messages
+
+    @property
+    def version(self):
+        # Changes whenever dump_state would return something else, so an unchanged memory is not dumped
+        return self._version
+
+    @property
+    def memory_variables(self):
+        return [self.memory_key]
+
+    def load_memory_variables(self, inputs):
+        started = time.perf_counter()
+        with self._lock:
+            summary = self.moving_summary_buffer
+            messages = self._pending + list(self.buffer)
+        if summary:
+            messages = [self.summary_message_cls(content=summary)] + messages
+        if self.return_messages:
+            history = messages
+        else:
+            history = get_buffer_string(
+                messages, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix
+            )
+        _record("load", time.perf_counter() - started)
+        return {self.memory_key: history}
+
+    def save_artifact(self, text):
+        """
+        The save_artifact function keeps a long text out of the conversation buffer.
+
+        :param text: The text
+        :return: The reference that is put into the conversation instead of the text
+        :doc-author: Yusuf
+        """
+        artifact_id = hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+        with self._lock:
+            # The oldest artifacts are dropped, their references stay in the conversation with the preview
+            self._artifacts.pop(artifact_id, None)
+            self._artifacts[artifact_id] = text
+            while len(self._artifacts) > self.max_artifacts:
+                del self._artifacts[next(iter(self._artifacts))]
+        return self._reference(artifact_id, text)
+
+    @staticmethod
+    def _reference(artifact_id, text):
+        return f"[artifact {artifact_id}, {len(text)} chars: {artifact_preview(text)}]"
+
+    def artifact(self, artifact_id):
+        """
+        The artifact function returns the text of an artifact referenced in the conversation.
+
+        :param artifact_id: The id from the reference
+        :return: The text, or None if there is no such artifact
+        :doc-author: Yusuf
+        """
+        return self._artifacts.get(artifact_id)
+
+    def resolve_artifacts(self, text):
+        """
+        The resolve_artifacts function puts the texts of the artifacts back in place of their references.
+        References to artifacts that were dropped are left as they are.
+
+        :param text: A text with artifact references
+        :return: The text with the artifact texts
+        :doc-author: Yusuf
+        """
+        for artifact_id in _ARTIFACT_REFERENCE.findall(text):
+            artifact = self._artifacts.get(artifact_id)
+            if artifact is not None:
+                text = text.replace(self._reference(artifact_id, artifact), artifact)
+        return text
+
+    def _compact(self, value):
+        if not isinstance(value, str):
+            value = "\n".join(value) if isinstance(value, (list, tuple)) else str(value)
+        if len(value) > self.artifact_chars:
+            return self.save_artifact(value)
+        return value
+
+    def save_context(self, inputs, outputs):
+        started = time.perf_counter()
+        input_str, output_str = self._get_input_output(inputs, outputs)
+        self.chat_memory.add_messages(
+            [
+                HumanMessage(content=self._compact(input_str)),
+                AIMessage(content=self._compact(output_str)),
+            ]
+        )
+        self._version += 1
+        self.prune()
+        _record("save", time.perf_counter() - started)
+
+    def _buffer_tokens(self):
+        return sum(count_tokens(message.content) for message in self.buffer)
+
+    def prune(self):
+        """
+        The prune function moves the oldest messages beyond max_token_limit to the pending list
+        and schedules their summary. It does not wait for the model.
+
+        :doc-author: Yusuf
+        """
+        buffer = self.buffer
+        length = self._buffer_tokens()
+        if length <= self.max_token_limit:
+            return
+        with self._lock:
+            while buffer and length > self.max_token_limit:
+                message = buffer.pop(0)
+                length -= count_tokens(message.content)
+                self._pending.append(message)
+            if self._future is None:
+                self._schedule_summary(current_session_id(), get_tracer().current_span())
+
+    def _schedule_summary(self, session_id, parent_span):
+        # Called with the lock held. One summary runs at a time per memory, later messages wait in pending.
+        messages = list(self._pending)
+        summary = self.moving_summary_buffer
+        self._future = _get_summary_executor().submit(
+            self._summarize, session_id, parent_span, messages, summary
+        )
+
+    def _summarize(self, session_id, parent_span, messages, summary):
+        started = time.perf_counter()
+        try:
+            with session_scope(session_id), get_tracer().span(
+                "memory_summary", "memory", parent_span, messages=len(messages)
+            ):
+                # The summary is made of the texts, not of their references
+                messages = [
+                    message.__class__(content=self.resolve_artifacts(message.content))
+                    for message in messages
+                ]
+                new_summary = self.predict_new_summary(messages, summary)
+        except Exception as e:
+            log_info(f"conversation summary failed, the messages are kept unsummarized: {e}")
+            with _stats_lock:
+                _summaries["failed"] += 1
+            with self._lock:
+                self._future = None
+            return
+        with _stats_lock:
+            _summaries["done"] += 1
+            _summaries["seconds"] += time.perf_counter() - started
+        with self._lock:
+            self.moving_summary_buffer = new_summary
+            self._version += 1
+            del self._pending[: len(messages)]
+            self._future = None
+            if self._pending:
+                self._schedule_summary(session_id, parent_span)
+
+    def wait_for_summary(self, timeout=None):
+        """
+        The wait_for_summary function blocks until the scheduled summaries are done, e.g. in benchmarks.
+
+        :param timeout: Maximum seconds to wait for each summary
+        :doc-author: Yusuf
+        """
+        while True:
+            with self._lock:
+                future = self._future
+            if future is None:
+                return
+            future.result(timeout)
+
+    def dump_state(self):
+        """
+        The dump_state function returns the state of the memory as plain data, so another server process can take it over.
+
+        :return: A dictionary with the summary, the unsummarized messages and the artifacts
+        :doc-author: Yusuf
+        """
+        with self._lock:
+            return {
+                "summary": self.moving_summary_buffer,
+                "messages": messages_to_dict(self._pending + list(self.buffer)),
+                "artifacts": dict(self._artifacts),
+            }
+
+    def load_state(self, state):
+        """
+        The load_state function replaces the state of the memory with the one of dump_state.
+        Messages whose summary was still running in the other process are summarized again here.
+
+        :param state: The dictionary of dump_state
+        :doc-author: Yusuf
+        """
+        with self._lock:
+            self.moving_summary_buffer = state["summary"]
+            self.chat_memory.messages = messages_from_dict(state["messages"])
+            self._pending = []
+            self._artifacts = dict(list(state["artifacts"].items())[-self.max_artifacts :])
+            self._version += 1
+        self.prune()
+
+    def clear(self):
+        with self._lock:
+            super().clear()
+            self.moving_summary_buffer = ""
+            self._pending = []
+            self._artifacts = {}
+            self._version += 1
+
+
+class ArtifactMemory(BaseMemory):
+    """
+    The ArtifactMemory class gives a chain the conversation of a BackgroundSummaryMemory with the artifact texts
+    in place of their references, e.g. the module content a question is asked about. Saving goes to the memory.
+
+    :doc-author: Yusuf
+    """
+
+    memory: BackgroundSummaryMemory
+
+    @property
+    def memory_variables(self):
+        return self.memory.memory_variables
+
+    def load_memory_variables(self, inputs):
+        variables = self.memory.load_memory_variables(inputs)
+        resolved = {}
+        for key, value in variables.items():
+            if isinstance(value, str):
+                value = self.memory.resolve_artifacts(value)
+            elif isinstance(value, list):
+                value = [
+                    message.__class__(content=self.memory.resolve_artifacts(message.content))
+                    for message in value
+                ]
+            resolved[key] = value
+        return resolved
+
+    def save_context(self, inputs, outputs):
+        self.memory.save_context(inputs, outputs)
+
+    def clear(self):
+        self.memory.clear()
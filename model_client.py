@@ -0,0 +1,415 @@
+import asyncio
+import base64
+import atexit
+import json
+import os
+import queue
+import random
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Dict
+
+import aiohttp
+from langchain_community.adapters.openai import convert_message_to_dict
+from langchain_core.language_models.chat_models import (
+    BaseChatModel,
+    generate_from_stream,
+)
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.pydantic_v1 import Field
+
+import settings
+from session_store import current_session_id
+from tokens import count_tokens
+from tracing import log_info
+
+
+class ModelRequestError(Exception):
+    """
+    The ModelRequestError class is raised when the model API answers with an error status.
+
+    :doc-author: Yusuf
+    """
+
+    def __init__(self, status, body):
+        super().__init__(f"Model API returned {status}: {body[:500]}")
+        self.status = status
+        self.body = body
+
+
+class FairQueue:
+    """
+    The FairQueue class limits the number of requests in flight and admits waiting requests round-robin per session,
+    so a session that fires many requests (e.g. prefetching) can not starve the others.
+    It must only be used from the gateway event loop.
+
+    :doc-author: Yusuf
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self._waiting = OrderedDict()
+
+    async def acquire(self, session_id):
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(session_id, deque()).append(future)
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # The slot was granted just before the request was cancelled, so give it back
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.in_flight < self.limit and self._waiting:
+            session_id, waiting = next(iter(self._waiting.items()))
+            future = waiting.popleft()
+            # The session goes to the back of the line after every admitted request
+            del self._waiting[session_id]
+            if waiting:
+                self._waiting[session_id] = waiting
+            if future.cancelled():
+                continue
+            future.set_result(None)
+            self.in_flight += 1
+
+
+class ModelGateway:
+    """
+    The ModelGateway class is the single access point to the model API for chains and the image generator.
+    It runs an asyncio event loop in a background thread with one pooled aiohttp session,
+    admits requests through a FairQueue, and retries rate-limited and failed requests with jittered exponential backoff.
+    Synchronous callers (the Streamlit script thread, worker threads) use the *_sync functions and never block each other.
+
+    :doc-author: Yusuf
+    """
+
+    def __init__(self, api_base, max_in_flight, max_connections, max_retries, timeout):
+        self.api_base = api_base.rstrip("/")
+        self.max_in_flight = max_in_flight
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.retries = 0
+        self._loop = None
+        self._http = None
+        self._queue = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=loop.run_forever, name="model-gateway", daemon=True
+                ).start()
+                self._loop = loop
+        return self._loop
+
+    def submit(self, coroutine):
+        """
+        The submit function runs a coroutine on the gateway event loop.
+
+        :param coroutine: The coroutine to run
+        :return: A concurrent.futures.Future with the result
+        :doc-author: Yusuf
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self._ensure_loop())
+
+    def run(self, coroutine):
+        return self.submit(coroutine).result()
+
+    def close(self):
+        """
+        The close function closes the pooled HTTP session, it is called when the process exits.
+
+        :doc-author: Yusuf
+        """
+        if self._http is not None:
+            self.run(self._http.close())
+            self._http = None
+
+    def _session(self):
+        if self._http is None:
+            self._queue = FairQueue(self.max_in_flight)
+            self._http = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._http
+
+    def _headers(self):
+        return {"Authorization": f"Bearer {os.environ.get('OPENAI_API_KEY', '')}"}
+
+    def _backoff(self, attempt, retry_after):
+        # Full jitter: a random delay up to an exponentially growing cap
+        delay = random.uniform(0, min(settings.MODEL_BACKOFF_CAP_SECONDS, 2**attempt))
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        return delay
+
+    async def _open(self, session_id, path, payload):
+        """
+        The _open function sends a request and returns the open response once it has a success status.
+        The queue slot is held until the caller releases it, so streamed responses count as in flight.
+        """
+        http = self._session()
+        for attempt in range(self.max_retries + 1):
+            await self._queue.acquire(session_id)
+            try:
+                response = await http.post(
+                    f"{self.api_base}{path}", json=payload, headers=self._headers()
+                )
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self._queue.release()
+                error, retry_after = e, None
+            else:
+                if response.status < 400:
+                    return response
+                body = await response.text()
+                response.release()
+                self._queue.release()
+                error = ModelRequestError(response.status, body)
+                retry_after = response.headers.get("Retry-After")
+                if response.status != 429 and response.status < 500:
+                    raise error
+            if attempt == self.max_retries:
+                raise error
+            self.retries += 1
+            log_info(f"model request failed ({error}), retry {attempt + 1}")
+            await asyncio.sleep(self._backoff(attempt, retry_after))
+
+    async def request(self, session_id, path, payload):
+        """
+        The request function posts a JSON payload to the model API and returns the decoded JSON answer.
+
+        :param session_id: Id of the browser session the request belongs to
+        :param path: API path, e.g. "/chat/completions"
+        :param payload: The JSON payload
+        :return: The decoded answer
+        :doc-author: Yusuf
+        """
+        response = await self._open(session_id, path, payload)
+        try:
+            return await response.json()
+        finally:
+            response.release()
+            self._queue.release()
+
+    async def stream(self, session_id, path, payload):
+        """
+        The stream function posts a streaming request and yields the decoded server-sent events.
+
+        :param session_id: Id of the browser session the request belongs to
+        :param path: API path, e.g. "/chat/completions"
+        :param payload: The JSON payload, "stream" is set to True
+        :doc-author: Yusuf
+        """
+        response = await self._open(session_id, path, {**payload, "stream": True})
+        try:
+            async for line in response.content:
+                line = line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:") :].strip()
+                if data == "[DONE]":
+                    break
+                yield json.loads(data)
+        finally:
+            response.release()
+            self._queue.release()
+
+    def request_sync(self, session_id, path, payload):
+        return self.run(self.request(session_id, path, payload))
+
+    def stream_sync(self, session_id, path, payload):
+        """
+        The stream_sync function yields the events of a streaming request in the calling thread.
+
+        :param session_id: Id of the browser session the request belongs to
+        :param path: API path
+        :param payload: The JSON payload
+        :doc-author: Yusuf
+        """
+        events = queue.Queue()
+        done = object()
+
+        async def pump():
+            try:
+                async for event in self.stream(session_id, path, payload):
+                    events.put(event)
+            except Exception as e:
+                events.put(e)
+            finally:
+                events.put(done)
+
+        future = self.submit(pump())
+        try:
+            while True:
+                event = events.get()
+                if event is done:
+                    break
+                if isinstance(event, Exception):
+                    raise event
+                yield event
+        finally:
+            future.cancel()
+
+    def generate_image(self, prompt, size="1024x1024", quality="standard"):
+        """
+        The generate_image function asks DALL-E 3 for one image.
+        The image comes back inline as base64, so it never has to be fetched from an expiring url.
+
+        :param prompt: The image prompt
+        :param size: Image size
+        :param quality: Image quality
+        :return: The image bytes (PNG)
+        :doc-author: Yusuf
+        """
+        response = self.request_sync(
+            current_session_id(),
+            "/images/generations",
+            {
+                "model": "dall-e-3",
+                "prompt": prompt,
+                "size": size,
+                "quality": quality,
+                "n": 1,
+                "response_format": "b64_json",
+            },
+        )
+        return base64.b64decode(response["data"][0]["b64_json"])
+
+
+class GatewayChatModel(BaseChatModel):
+    """
+    The GatewayChatModel class is a LangChain chat model that sends OpenAI chat completion requests through the ModelGateway.
+
+    :doc-author: Yusuf
+    """
+
+    model_name: str = "gpt-4-1106-preview"
+    temperature: float = 0.0
+    streaming: bool = False
+    model_kwargs: Dict[str, Any] = Field(default_factory=dict)
+    # Object with an acquire() function, called right before a request is sent, i.e. after the response cache missed
+    request_limiter: Any = None
+
+    @property
+    def _llm_type(self):
+        return "openai-gateway-chat"
+
+    @property
+    def _identifying_params(self):
+        # Only parameters that change the answer, so that the response cache key does not depend on streaming
+        return {
+            "model_name": self.model_name,
+            "temperature": self.temperature,
+            **self.model_kwargs,
+        }
+
+    def get_num_tokens(self, text):
+        return count_tokens(text)
+
+    def _payload(self, messages, stop, **kwargs):
+        payload = {
+            "model": self.model_name,
+            "temperature": self.temperature,
+            "messages": [convert_message_to_dict(message) for message in messages],
+            **self.model_kwargs,
+            **kwargs,
+        }
+        if stop:
+            payload["stop"] = stop
+        return payload
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.streaming:
+            return generate_from_stream(
+                self._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            )
+        if self.request_limiter is not None:
+            self.request_limiter.acquire()
+        response = get_gateway().request_sync(
+            current_session_id(), "/chat/completions", self._payload(messages, stop, **kwargs)
+        )
+        return self._create_result(response)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.request_limiter is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.request_limiter.acquire)
+        gateway = get_gateway()
+        future = gateway.submit(
+            gateway.request(
+                current_session_id(),
+                "/chat/completions",
+                self._payload(messages, stop, **kwargs),
+            )
+        )
+        return self._create_result(await asyncio.wrap_future(future))
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.request_limiter is not None:
+            self.request_limiter.acquire()
+        for event in get_gateway().stream_sync(
+            current_session_id(), "/chat/completions", self._payload(messages, stop, **kwargs)
+        ):
+            if not event.get("choices"):
+                continue
+            token = event["choices"][0].get("delta", {}).get("content") or ""
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    def _create_result(self, response):
+        generations = [
+            ChatGeneration(
+                message=AIMessage(content=choice["message"].get("content") or ""),
+                generation_info={"finish_reason": choice.get("finish_reason")},
+            )
+            for choice in response["choices"]
+        ]
+        return ChatResult(
+            generations=generations,
+            llm_output={
+                "token_usage": response.get("usage", {}),
+                "model_name": self.model_name,
+            },
+        )
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    """
+    The get_gateway function returns the process-wide ModelGateway.
+
+    :return: The ModelGateway object
+    :doc-author: Yusuf
+    """
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = ModelGateway(
+                settings.OPENAI_API_BASE,
+                settings.MODEL_MAX_IN_FLIGHT,
+                settings.MODEL_MAX_CONNECTIONS,
+                settings.MODEL_MAX_RETRIES,
+                settings.MODEL_TIMEOUT_SECONDS,
+            )
+            atexit.register(_gateway.close)
+        return _gateway
@@ -0,0 +1,185 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import settings
+from session_store import get_session_store, session_scope
+from tracing import get_tracer, log_info
+
+
+class StageResult:
+    """
+    The StageResult class is the outcome of one pipeline stage: its value or the error it raised, and how long it took.
+    The key is whatever the submitter gave the stage to find its result again, e.g. the chat message it belongs to,
+    and curriculum_id the curriculum the module belongs to, so results of a replaced curriculum can be told apart.
+
+    :doc-author: Yusuf
+    """
+
+    __slots__ = ("stage", "module_index", "value", "error", "duration", "key", "curriculum_id")
+
+    def __init__(
+        self,
+        stage,
+        module_index,
+        value=None,
+        error=None,
+        duration=0.0,
+        key=None,
+        curriculum_id=None,
+    ):
+        self.stage = stage
+        self.module_index = module_index
+        self.value = value
+        self.error = error
+        self.duration = duration
+        self.key = key
+        self.curriculum_id = curriculum_id
+
+    def as_metric(self):
+        return {
+            "stage": self.stage,
+            "module": self.module_index + 1,
+            "duration": self.duration,
+            "error": None if self.error is None else repr(self.error),
+        }
+
+
+def run_stage(
+    session_id, stage, module_index, func, *args, parent_span=None, key=None, curriculum_id=None
+):
+    """
+    The run_stage function runs one pipeline stage, measures it and turns an exception into a failed StageResult,
+    so that one failing stage never breaks the other stages of the module.
+
+    :param session_id: Id of the browser session the stage works for
+    :param stage: Name of the stage, e.g. "flashcard" or "image"
+    :param module_index: Index of the module in the curriculum
+    :param func: Function that does the work
+    :param args: Arguments of func
+    :param parent_span: Span of the request that submitted the stage
+    :param key: Key of the stage, returned with its result
+    :param curriculum_id: Id of the curriculum of the module, returned with its result
+    :return: A StageResult object
+    :doc-author: Yusuf
+    """
+    started = time.perf_counter()
+    try:
+        with session_scope(session_id), get_tracer().span(
+            stage, "stage", parent_span, module=module_index + 1
+        ):
+            value = func(*args)
+    except Exception as e:
+        log_info(f"{stage} stage of module {module_index + 1} failed: {e}")
+        return StageResult(
+            stage,
+            module_index,
+            error=e,
+            duration=time.perf_counter() - started,
+            key=key,
+            curriculum_id=curriculum_id,
+        )
+    return StageResult(
+        stage,
+        module_index,
+        value=value,
+        duration=time.perf_counter() - started,
+        key=key,
+        curriculum_id=curriculum_id,
+    )
+
+
+class ModulePipeline:
+    """
+    The ModulePipeline class runs the slow stages of a module (flashcards, image) on a managed worker pool.
+    learn_module returns the module text as soon as it is ready. The finished stages are collected
+    on a later rerun and put into session state.
+
+    :doc-author: Yusuf
+    """
+
+    def __init__(self, max_workers):
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="module-pipeline"
+        )
+
+    def _futures(self, session_id):
+        return get_session_store().get(session_id, "pipeline", list)
+
+    def submit(self, session_id, stage, module_index, func, *args, key=None, curriculum_id=None):
+        """
+        The submit function starts a stage in the background.
+
+        :param session_id: Id of the browser session
+        :param stage: Name of the stage
+        :param module_index: Index of the module in the curriculum
+        :param func: Function that does the work. It must not read session state
+        :param args: Arguments of func
+        :param key: Key of the stage, returned with its StageResult
+        :param curriculum_id: Id of the curriculum of the module, returned with its StageResult
+        :return: The future of the stage
+        :doc-author: Yusuf
+        """
+        future = self.executor.submit(
+            run_stage,
+            session_id,
+            stage,
+            module_index,
+            func,
+            *args,
+            parent_span=get_tracer().current_span(),
+            key=key,
+            curriculum_id=curriculum_id,
+        )
+        self._futures(session_id).append(future)
+        return future
+
+    def collect(self, session_id):
+        """
+        The collect function returns the stages of a session that finished since the last call.
+
+        :param session_id: Id of the browser session
+        :return: A list of StageResult objects
+        :doc-author: Yusuf
+        """
+        futures = self._futures(session_id)
+        done = [future for future in futures if future.done()]
+        for future in done:
+            futures.remove(future)
+        return [future.result() for future in done]
+
+    def pending(self, session_id):
+        return list(self._futures(session_id))
+
+    def wait(self, session_id, timeout):
+        """
+        The wait function blocks until one pending stage of the session finishes or the timeout passes.
+
+        :param session_id: Id of the browser session
+        :param timeout: Maximum waiting time in seconds
+        :return: True if a stage finished
+        :doc-author: Yusuf
+        """
+        pending = self.pending(session_id)
+        if not pending:
+            return False
+        done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        return bool(done)
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_pipeline():
+    """
+    The get_pipeline function returns the process-wide ModulePipeline.
+
+    :return: The ModulePipeline object
+    :doc-author: Yusuf
+    """
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = ModulePipeline(settings.PIPELINE_WORKERS)
+        return _pipeline
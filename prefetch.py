@@ -0,0 +1,147 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import settings
+from session_store import get_session_store, session_scope
+from tokens import count_tokens
+from tracing import get_tracer, log_info
+
+
+class PrefetchState:
+    """
+    The PrefetchState class keeps the prefetch bookkeeping of one session:
+    the current generation (bumped on cancel), the tokens spent so far and the scheduled futures.
+
+    :doc-author: Yusuf
+    """
+
+    def __init__(self, token_budget):
+        self.token_budget = token_budget
+        self.tokens_spent = 0
+        self.generation = 0
+        self.futures = {}
+        self.lock = threading.Lock()
+
+    def charge(self, *texts):
+        with self.lock:
+            self.tokens_spent += sum(count_tokens(text) for text in texts)
+
+    def has_budget(self):
+        return self.tokens_spent < self.token_budget
+
+
+class PrefetchScheduler:
+    """
+    The PrefetchScheduler class generates the content of the next module on a bounded worker pool
+    while the user is still reading the current one.
+    Module text, flashcards and quiz are produced with the same prompts the tools use, so the results land in
+    the response cache and the user's next click is a cache hit.
+
+    :doc-author: Yusuf
+    """
+
+    def __init__(self, max_workers, token_budget):
+        self.token_budget = token_budget
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="prefetch"
+        )
+
+    def _state(self, session_id):
+        return get_session_store().get(
+            session_id, "prefetch", lambda: PrefetchState(self.token_budget)
+        )
+
+    def schedule(self, session_id, module_index, module, stages):
+        """
+        The schedule function queues the prefetch of one module.
+        Nothing is queued if the module is already scheduled or the session has used up its token budget.
+
+        :param session_id: Id of the browser session
+        :param module_index: Index of the module in the curriculum
+        :param module: Curriculum text of the module
+        :param stages: A tuple of (teach, flashcards, quiz) functions. teach takes the module text, the others take the module content
+        :return: The future of the prefetch, or None if nothing was queued
+        :doc-author: Yusuf
+        """
+        state = self._state(session_id)
+        with state.lock:
+            if module_index in state.futures or not state.has_budget():
+                return None
+            generation = state.generation
+            future = self.executor.submit(
+                self._run,
+                session_id,
+                state,
+                generation,
+                module_index,
+                module,
+                stages,
+                get_tracer().current_span(),
+            )
+            state.futures[module_index] = future
+        log_info(f"prefetch of module {module_index + 1} scheduled")
+        return future
+
+    @staticmethod
+    def _run(session_id, state, generation, module_index, module, stages, parent_span):
+        teach, flashcards, quiz = stages
+
+        def still_wanted():
+            return state.generation == generation and state.has_budget()
+
+        try:
+            with session_scope(session_id), get_tracer().span(
+                "prefetch", "prefetch", parent_span, module=module_index + 1
+            ):
+                if not still_wanted():
+                    return None
+                module_content = teach(module)
+                state.charge(module, module_content)
+                for stage in (flashcards, quiz):
+                    if not still_wanted():
+                        return None
+                    state.charge(module_content, stage(module_content))
+        except Exception as e:
+            log_info(f"prefetch of module {module_index + 1} failed: {e}")
+            return None
+        log_info(
+            f"prefetch of module {module_index + 1} done, {state.tokens_spent} tokens spent"
+        )
+        return module_content
+
+    def cancel(self, session_id):
+        """
+        The cancel function drops every queued prefetch of a session, e.g. when the topic or the config changes.
+        Prefetches that are already running stop before their next stage.
+
+        :param session_id: Id of the browser session
+        :doc-author: Yusuf
+        """
+        state = self._state(session_id)
+        with state.lock:
+            state.generation += 1
+            for future in state.futures.values():
+                future.cancel()
+            state.futures = {}
+
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_prefetcher():
+    """
+    The get_prefetcher function returns the process-wide PrefetchScheduler, or None if prefetching is disabled.
+
+    :return: The PrefetchScheduler object or None
+    :doc-author: Yusuf
+    """
+    global _prefetcher
+    if not settings.PREFETCH_ENABLED:
+        return None
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = PrefetchScheduler(
+                settings.PREFETCH_WORKERS, settings.PREFETCH_TOKEN_BUDGET
+            )
+        return _prefetcher
@@ -0,0 +1,175 @@
+"""
+Pre-warm the shared content library with the most requested topic/config pairs.
+
+For each of the top-K pairs the curriculum and, for every module, its content, flashcards and quiz are
+generated with the same prompts the tools use, so users who ask for them are served from the library.
+Parts that are already in the library are skipped. Run it offline, e.g. nightly:
+
+    python prewarm.py --top 20 --workers 4
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain.chains import LLMChain
+
+import settings
+from backends import get_chat_model
+from bundle import BundleError, parse_bundle
+from cache import install_response_cache
+from curriculum_store import get_curriculum_store
+from prompts import build_config_prompt, get_config_prompts
+from quiz import format_quiz
+from semantic import get_topic_index
+from session_store import session_scope
+from tools import (
+    create_bundle,
+    create_flashcards,
+    create_quiz,
+    parse_curriculum,
+    teach_module,
+)
+from tracing import log_info
+
+
+def prewarm_curriculum(llm, prompts, topic, configs):
+    """
+    The prewarm_curriculum function returns the curriculum of a topic and configuration from the library
+    and generates it if it is missing.
+
+    :param llm: The language model
+    :param prompts: The tuple of get_config_prompts for the configuration
+    :param topic: The topic
+    :param configs: The user configuration list
+    :return: A tuple of the raw curriculum and whether it was generated
+    :doc-author: Yusuf
+    """
+    store = get_curriculum_store()
+    curriculum = store.get(topic, configs, hit=False)
+    if curriculum is not None:
+        return curriculum, False
+    curriculum = LLMChain(llm=llm, prompt=prompts[1]).run(topic)
+    store.put(topic, configs, curriculum)
+    get_topic_index().add([(topic, configs)])
+    return curriculum, True
+
+
+def prewarm_module(llm, prompts, topic, configs, index, module):
+    """
+    The prewarm_module function generates the content, flashcards and quiz of a module that are missing in the library.
+
+    :param llm: The language model
+    :param prompts: The tuple of get_config_prompts for the configuration
+    :param topic: The topic
+    :param configs: The user configuration list
+    :param index: Index of the module in the curriculum
+    :param module: The module text of the curriculum
+    :return: Number of generated parts
+    :doc-author: Yusuf
+    """
+    store = get_curriculum_store()
+    _, _, module_prompt, evaluation_prompt, flashcard_prompt, bundle_prompt = prompts
+    missing = [
+        kind
+        for kind in ("module", "flashcard", "quiz")
+        if store.get_module(topic, configs, index, kind, hit=False) is None
+    ]
+    if not missing:
+        return 0
+    if settings.BUNDLE_MODE != "off" and "module" in missing:
+        try:
+            bundle = parse_bundle(index + 1, create_bundle(llm, bundle_prompt, module, ""))
+        except BundleError as e:
+            log_info(f"bundle of {topic} module {index + 1} rejected: {e}")
+        else:
+            store.put_module(topic, configs, index, "module", bundle.module_content)
+            store.put_module(
+                topic, configs, index, "flashcard", " #### ".join(bundle.flashcards)
+            )
+            store.put_module(topic, configs, index, "quiz", format_quiz(bundle.quiz))
+            return 3
+    generated = 0
+    content = store.get_module(topic, configs, index, "module", hit=False)
+    if content is None:
+        content = teach_module(llm, module_prompt, module, "")
+        store.put_module(topic, configs, index, "module", content)
+        generated += 1
+    if "flashcard" in missing:
+        store.put_module(
+            topic, configs, index, "flashcard", create_flashcards(llm, flashcard_prompt, content)
+        )
+        generated += 1
+    if "quiz" in missing:
+        store.put_module(
+            topic, configs, index, "quiz", create_quiz(llm, evaluation_prompt, content)
+        )
+        generated += 1
+    return generated
+
+
+def prewarm_pair(llm, topic, configs):
+    """
+    The prewarm_pair function generates everything that is missing in the library for one topic and configuration.
+
+    :param llm: The language model
+    :param topic: The normalized topic
+    :param configs: The user configuration list
+    :return: Number of generated parts
+    :doc-author: Yusuf
+    """
+    prompts = get_config_prompts(build_config_prompt(configs))
+    curriculum, generated = prewarm_curriculum(llm, prompts, topic, configs)
+    return int(generated) + sum(
+        prewarm_module(llm, prompts, topic, configs, index, module)
+        for index, module in enumerate(parse_curriculum(curriculum))
+    )
+
+
+def prewarm(top, workers):
+    """
+    The prewarm function pre-warms the top requested topic/config pairs on a worker pool.
+
+    :param top: Number of pairs
+    :param workers: Number of pairs generated at the same time
+    :return: A list of (topic, configs, requests, generated parts, seconds) tuples
+    :doc-author: Yusuf
+    """
+    install_response_cache()
+    llm = get_chat_model(model_name="gpt-4-1106-preview", temperature=0, streaming=False)
+    pairs = get_curriculum_store().top_requests(top)
+
+    def run(number, topic, configs, requests):
+        started = time.perf_counter()
+        # Every pair is its own session for the fair queue of the model gateway
+        with session_scope(f"prewarm-{number}"):
+            generated = prewarm_pair(llm, topic, configs)
+        return topic, configs, requests, generated, time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prewarm") as executor:
+        futures = [
+            executor.submit(run, number, topic, configs, requests)
+            for number, (topic, configs, requests) in enumerate(pairs)
+        ]
+        return [future.result() for future in futures]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--top", type=int, default=20, help="number of topic/config pairs")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument(
+        "--list", action="store_true", help="only list the most requested pairs"
+    )
+    args = parser.parse_args()
+    if args.list:
+        rows = [
+            (topic, configs, requests, 0, 0.0)
+            for topic, configs, requests in get_curriculum_store().top_requests(args.top)
+        ]
+    else:
+        rows = prewarm(args.top, args.workers)
+    print(f"{'requests':>9}{'generated':>11}{'seconds':>9}  topic | config")
+    for topic, configs, requests, generated, seconds in rows:
+        print(f"{requests:>9}{generated:>11}{seconds:>9.1f}  {topic} | {'|'.join(configs)}")
+    store = get_curriculum_store()
+    print(f"\nlibrary: {len(store)} curricula, {store.size()} bytes, {store.evictions} evictions")
@@ -1,5 +1,12 @@
-import streamlit as st
-from langchain.prompts import PromptTemplate
+import json
+from typing import Dict
+
+from langchain_core.prompts import PromptTemplate
+
+import settings
+from bundle import BUNDLE_SCHEMA
+from tokens import compact_markdown, count_tokens, truncate_tokens
+from tracing import get_tracer, log_info
 
 PREFIX = """
 You are an personalized cooking assistant that aims to help the user cook and answer their question about cooking.
@@ -16,22 +23,110 @@ Question: {input}
 """
 
 
-def get_prompts():
-    if "config_prompt" not in st.session_state:
-        st.session_state["config_prompt"] = ""
+class BudgetedPromptTemplate(PromptTemplate):
+    """
+    The BudgetedPromptTemplate class is a PromptTemplate that keeps its variables within token budgets before formatting.
+    Conversation history keeps its latest part, module content keeps its outline (see tokens.compact_markdown).
+    The size of every formatted prompt is logged and recorded on the current span.
+
+    :doc-author: Yusuf
+    """
+
+    prompt_name: str = "prompt"
+    budgets: Dict[str, int] = {}
+
+    def format(self, **kwargs):
+        kwargs = self._merge_partial_and_user_variables(**kwargs)
+        shortened = []
+        for variable, budget in self.budgets.items():
+            value = kwargs.get(variable)
+            if not isinstance(value, str):
+                continue
+            if variable == "chat_history":
+                fitted = truncate_tokens(value, budget, keep="tail")
+            else:
+                fitted = compact_markdown(value, budget)
+            if fitted is not value:
+                kwargs[variable] = fitted
+                shortened.append(variable)
+        prompt = super().format(**kwargs)
+        tokens = count_tokens(prompt)
+        get_tracer().annotate(prompt=self.prompt_name, prompt_tokens=tokens)
+        log_info(
+            f"{self.prompt_name} prompt: {tokens} tokens"
+            + (f", shortened {', '.join(shortened)}" if shortened else "")
+        )
+        return prompt
+
+
+def budgeted_prompt(prompt_name, template, input_variables):
+    """
+    The budgeted_prompt function builds a BudgetedPromptTemplate with the budgets from settings for the variables it uses:
+    PROMPT_HISTORY_TOKENS for chat_history and PROMPT_MODULE_TOKENS for module and module_content.
+
+    :param prompt_name: Name of the prompt in the logs
+    :param template: The template text
+    :param input_variables: The input variables of the template
+    :return: A BudgetedPromptTemplate object
+    :doc-author: Yusuf
+    """
+    limits = {
+        "chat_history": settings.PROMPT_HISTORY_TOKENS,
+        "module": settings.PROMPT_MODULE_TOKENS,
+        "module_content": settings.PROMPT_MODULE_TOKENS,
+    }
+    return BudgetedPromptTemplate(
+        prompt_name=prompt_name,
+        template=template,
+        input_variables=input_variables,
+        budgets={
+            variable: limits[variable] for variable in input_variables if variable in limits
+        },
+    )
+
+
+def build_config_prompt(user_config):
+    """
+    The build_config_prompt function turns the configuration selected in create_conf_buttons into the text
+    that is appended to every prompt that depends on the user configuration.
+
+    :param user_config: The user configuration list (depth, style, time, communication, language)
+    :return: The config prompt
+    :doc-author: Yusuf
+    """
+    (
+        depth_option,
+        style_option,
+        time_option,
+        communication_option,
+        language_option,
+    ) = user_config
+    return f"""
+            Here is the user configuration: Make sure that the user your generated content is suitable for the following configs:
+                The user is {depth_option} at cooking, user prefers a  dish from {style_option if style_option != 'All World' else 'everywhere so it does not matter'}, user wants to spend a {time_option} time on cooking, and your answer MUST be in {language_option} language.
+        """
 
+
+def get_config_prompts(config_prompt):
+    """
+    The get_config_prompts function builds the prompts that contain the user configuration.
+    They have to be rebuilt whenever the configuration changes.
+
+    :param config_prompt: The config prompt built by build_config_prompt
+    :return: A tuple of answer_question_prompt, curriculum_prompt, module_prompt, evalue_prompt, flashcard_prompt and bundle_prompt
+    :doc-author: Yusuf
+    """
     answer_user_question_template = (
         """ 
     You should answer the user's question in detail, and make it easy to understand. Make sure that answer is related to the question.
     Conversation history: {chat_history}
     User question: {input}
     """
-        + st.session_state.config_prompt
+        + config_prompt
     )
 
-    answer_question_prompt = PromptTemplate(
-        input_variables=["chat_history", "input"],
-        template=answer_user_question_template,
+    answer_question_prompt = budgeted_prompt(
+        "answer_question", answer_user_question_template, ["chat_history", "input"]
     )
 
     curriculum_template = (
@@ -70,11 +165,9 @@ def get_prompts():
     
     User Configuration:
     """
-        + st.session_state.config_prompt
-    )
-    curriculum_prompt = PromptTemplate(
-        input_variables=["topic"], template=curriculum_template
+        + config_prompt
     )
+    curriculum_prompt = budgeted_prompt("curriculum", curriculum_template, ["topic"])
 
     module_prompt = (
         """
@@ -85,12 +178,10 @@ def get_prompts():
 
     User Configuration:
     """
-        + st.session_state.config_prompt
+        + config_prompt
     )
 
-    module_prompt = PromptTemplate(
-        input_variables=["extra_config", "module"], template=module_prompt
-    )
+    module_prompt = budgeted_prompt("module", module_prompt, ["extra_config", "module"])
     evaluation_prompt_template = (
         """
     Please generate a set of Single-Choice-Questions following the strict output format provided. Each question should assess the user's understanding of the module content and should align with the user's configuration settings. The number of questions should correspond to the user's configuration preferences.
@@ -112,16 +203,13 @@ def get_prompts():
 
     Repeat this structure for the number of questions specified in the user configuration. Put a #### between each question to make the output splittable.
 
-
-    Module content: {module_content}
-    
     The choices provided are listed vertically below the question
     User Configuration:
     """
-        + st.session_state.config_prompt
+        + config_prompt
     )
-    evalue_prompt = PromptTemplate(
-        input_variables=["module_content"], template=evaluation_prompt_template
+    evalue_prompt = budgeted_prompt(
+        "evaluation", evaluation_prompt_template, ["module_content"]
     )
 
     flashcard_template = (
@@ -149,12 +237,54 @@ def get_prompts():
     
      User Configuration:
     """
-        + st.session_state.config_prompt
+        + config_prompt
+    )
+    flashcard_prompt = budgeted_prompt(
+        "flashcard", flashcard_template, ["module_content"]
+    )
+
+    # Braces of the schema are doubled, the template is formatted with str.format
+    schema = json.dumps(BUNDLE_SCHEMA).replace("{", "{{").replace("}", "}}")
+    bundle_template = (
+        """
+    Generate the complete learning material for the following curriculum module in one answer. Make sure that it is suitable for the user's configuration.
+    You can add new submodules if user specifically want to learn something new in this module. You should also be careful {extra_config} while generating the content.
+
+    {module}
+
+    Return one JSON object that follows this JSON schema, without any text before or after it:
+    """
+        + schema
+        + """
+
+    - module_content: the content of the module in markdown, with the submodules of the curriculum as headings
+    - flashcards: flashcards with only the most important information of the module, generally 1-3 words each
+    - quiz: Single-Choice-Questions about the module content, each with four distinct options, the answer (exactly one of the options) and an explanation. The number of questions should correspond to the user's configuration preferences
+    - key_content: the key elements of the module content, which includes the definitions, the examples and this kind of things, in a few sentences
+
+    User Configuration:
+    """
+        + config_prompt
     )
-    flashcard_prompt = PromptTemplate(
-        input_variables=["module_content"], template=flashcard_template
+    bundle_prompt = budgeted_prompt("bundle", bundle_template, ["extra_config", "module"])
+    return (
+        answer_question_prompt,
+        curriculum_prompt,
+        module_prompt,
+        evalue_prompt,
+        flashcard_prompt,
+        bundle_prompt,
     )
 
+
+def get_static_prompts():
+    """
+    The get_static_prompts function builds the prompts that do not depend on the user configuration.
+
+    :return: A tuple of analysis_module_prompt and extract_prompt
+    :doc-author: Yusuf
+    """
+
     analysis_module_template = """
     Act as a reviewer and you are supplied with the user wrong answers, and correct answers. Firstly, you should look user statistics on test, write a report for user which includes positive and negative feedbacks if they are exists. 
     Assume that user name is "User" and you are writing a report for "User".
@@ -165,23 +295,12 @@ def get_prompts():
     
     
     {user_wrong_content}"""
-    analysis_module_prompt = PromptTemplate(
-        input_variables=["statistics", "user_wrong_content"],
-        template=analysis_module_template,
+    analysis_module_prompt = budgeted_prompt(
+        "analysis", analysis_module_template, ["statistics", "user_wrong_content"]
     )
 
     extract_template = """You should extract the key elements of the module content, which includes the definitions, the examples and this kind of things.
     Module content: {module_content}"""
-    extract_prompt = PromptTemplate(
-        input_variables=["module_content"], template=extract_template
-    )
+    extract_prompt = budgeted_prompt("extract", extract_template, ["module_content"])
 
-    return (
-        answer_question_prompt,
-        curriculum_prompt,
-        module_prompt,
-        evalue_prompt,
-        flashcard_prompt,
-        analysis_module_prompt,
-        extract_prompt,
-    )
+    return analysis_module_prompt, extract_prompt
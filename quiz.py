@@ -0,0 +1,218 @@
+import ast
+import json
+import re
+
+from tracing import log_info
+
+_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+_OPTION_LABEL = re.compile(r"^(?:[A-Da-d]|[1-4])[\).:]\s+")
+
+
+class QuizQuestion:
+    """
+    The QuizQuestion class is one parsed single-choice question: its text, its options, the correct option and the explanation.
+
+    :doc-author: Yusuf
+    """
+
+    __slots__ = ("question", "options", "answer", "explanation")
+
+    def __init__(self, question, options, answer, explanation):
+        self.question = question
+        self.options = options
+        self.answer = answer
+        self.explanation = explanation
+
+
+class Quiz:
+    """
+    The Quiz class is a quiz as it is kept in session state: parsed once when it is generated and looked up by its id.
+
+    :doc-author: Yusuf
+    """
+
+    __slots__ = ("quiz_id", "module_number", "questions")
+
+    def __init__(self, quiz_id, module_number, questions):
+        self.quiz_id = quiz_id
+        self.module_number = module_number
+        self.questions = questions
+
+
+def _strip_item(line):
+    line = line.strip()
+    if line.startswith(("- ", "* ")):
+        line = line[2:]
+    return line.strip().strip(",").strip()
+
+
+def _unquote(text):
+    text = text.strip()
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in "\"'":
+        text = text[1:-1]
+    return text.strip()
+
+
+def parse_options(text):
+    """
+    The parse_options function reads the option list of a question without evaluating code.
+    It accepts a Python or JSON list literal and repairs common model mistakes
+    (curly quotes, a missing bracket, unquoted options).
+
+    :param text: The option line, e.g. ["Option 1", "Option 2", "Option 3", "Option 4"]
+    :return: A list of option strings, empty if nothing could be read
+    :doc-author: Yusuf
+    """
+    text = text.translate(_QUOTES).strip()
+    candidates = [text]
+    if text.startswith("[") and not text.endswith("]"):
+        candidates.append(text + "]")
+    for candidate in candidates:
+        for loads in (ast.literal_eval, json.loads):
+            try:
+                value = loads(candidate)
+            except (ValueError, SyntaxError, TypeError):
+                continue
+            if isinstance(value, (list, tuple)):
+                return [str(option).strip() for option in value if str(option).strip()]
+    # Repair pass: take the quoted strings, or split the bare list by commas
+    quoted = re.findall(r'"([^"]+)"|\'([^\']+)\'', text)
+    if quoted:
+        return [(double or single).strip() for double, single in quoted]
+    inner = text.strip("[] ")
+    return [option.strip() for option in inner.split(",") if option.strip()]
+
+
+def _match_answer(answer, options):
+    if not answer:
+        return None
+    if answer in options:
+        return answer
+    lowered = answer.lower()
+    for option in options:
+        if option.lower() == lowered:
+            return option
+    # "B", "B) Salt" or "2" point at an option by its position
+    label = re.match(r"^([A-Da-d1-4])(?:[\).:]|$)", answer)
+    if label:
+        position = "abcd1234".index(label.group(1).lower()) % 4
+        if position < len(options):
+            return options[position]
+    for option in options:
+        if lowered in option.lower() or option.lower() in lowered:
+            return option
+    return None
+
+
+def parse_question(raw_question):
+    """
+    The parse_question function parses one question block of the evaluation chain output.
+    The expected block is four bullet lines: question, option list, "Answer: ..." and explanation.
+    When the block does not follow the format exactly, the options are also read from one option per line
+    and the answer is matched to an option by text or by its letter.
+
+    :param raw_question: Text of one question, without the '####' separators
+    :return: A QuizQuestion object, or None if the block can not be repaired
+    :doc-author: Yusuf
+    """
+    lines = [_strip_item(line) for line in raw_question.strip().splitlines()]
+    lines = [line for line in lines if line]
+    if len(lines) < 2:
+        return None
+    question = _unquote(lines[0])
+    answer_at = next(
+        (
+            index
+            for index, line in enumerate(lines[1:], 1)
+            if _unquote(line).lower().startswith(("answer:", "correct answer:"))
+        ),
+        None,
+    )
+    if answer_at is None:
+        return None
+    option_lines = lines[1:answer_at]
+    if len(option_lines) == 1:
+        options = parse_options(option_lines[0])
+    else:
+        options = [_OPTION_LABEL.sub("", _unquote(line)) for line in option_lines]
+    answer = _unquote(_unquote(lines[answer_at]).split(":", 1)[1])
+    answer = _match_answer(answer, options)
+    if not question or len(options) < 2 or answer is None:
+        return None
+    explanation = " ".join(_unquote(line) for line in lines[answer_at + 1 :])
+    return QuizQuestion(question, tuple(options), answer, explanation)
+
+
+def question_from_fields(question, options, answer, explanation=""):
+    """
+    The question_from_fields function validates a question that was generated as structured fields, e.g. in a module bundle.
+    The options may also be given as one option line, and the answer is matched to an option as in parse_question.
+
+    :param question: The question text
+    :param options: A list of option strings, or an option line
+    :param answer: The correct option, its text or its letter
+    :param explanation: The explanation of the answer
+    :return: A QuizQuestion object, or None if the fields do not make a valid question
+    :doc-author: Yusuf
+    """
+    if isinstance(options, str):
+        options = parse_options(options)
+    if not isinstance(question, str) or not isinstance(options, (list, tuple)):
+        return None
+    options = [str(option).strip() for option in options if str(option).strip()]
+    question = _unquote(question)
+    answer = _match_answer(_unquote(str(answer or "")), options)
+    if not question or len(options) < 2 or answer is None:
+        return None
+    return QuizQuestion(question, tuple(options), answer, str(explanation or "").strip())
+
+
+def format_quiz(quiz):
+    """
+    The format_quiz function writes a Quiz in the output format of the evaluation chain, e.g. for the conversation memory.
+
+    :param quiz: The Quiz object
+    :return: The quiz string, questions separated by '####'
+    :doc-author: Yusuf
+    """
+    return "\n####\n".join(
+        f'- "{question.question}"\n- {json.dumps(list(question.options))}\n'
+        f'- "Answer: {question.answer}"\n- "{question.explanation}"'
+        for question in quiz.questions
+    )
+
+
+def make_quiz_id(curriculum_id, module_number):
+    """
+    The make_quiz_id function returns the id of the quiz of a module. The id contains the curriculum id,
+    so quizzes of the same module number of different curricula do not replace each other.
+
+    :param curriculum_id: Id of the curriculum, see set_curriculum
+    :param module_number: Number of the module the quiz is about, starting from 1
+    :return: The quiz id, e.g. quiz_<curriculum id>_1
+    :doc-author: Yusuf
+    """
+    return f"quiz_{curriculum_id}_{module_number}"
+
+
+def parse_quiz(quiz_id, module_number, quiz_output):
+    """
+    The parse_quiz function parses the output of the evaluation chain into a Quiz.
+    Questions that can not be repaired are dropped.
+
+    :param quiz_id: Id of the quiz, see make_quiz_id
+    :param module_number: Number of the module the quiz is about, starting from 1
+    :param quiz_output: Output of the evaluation chain, questions separated by '####'
+    :return: A Quiz object
+    :doc-author: Yusuf
+    """
+    questions = []
+    for raw_question in quiz_output.split("####"):
+        if not raw_question.strip():
+            continue
+        question = parse_question(raw_question)
+        if question is None:
+            log_info(f"skip malformed quiz question: {raw_question.strip()[:200]}")
+            continue
+        questions.append(question)
+    return Quiz(quiz_id, module_number, tuple(questions))
@@ -0,0 +1,134 @@
+import re
+import threading
+from collections import Counter
+
+import streamlit
+
+from tracing import get_tracer, log_info
+
+# (tool, pattern) pairs. A pattern must match the whole normalized input, so inputs with extra wishes
+# (e.g. "proceed to module 2 but make it vegan") still go to the agent, which passes the wish on to the tool.
+MODULE_PATTERNS = [
+    r"(?:proceed|go|continue|move|skip|jump)(?: on)? to module (\d+)",
+    r"(?:start|open|begin|teach me|show me|learn) module (\d+)",
+    r"module (\d+)",
+]
+EVALUATION_PATTERNS = [
+    r"(?:evaluate|quiz|test|examine) me on module (\d+)",
+    r"(?:give me |start |create )?(?:a )?(?:quiz|test|exam) (?:on|for|about) module (\d+)",
+]
+ANALYSIS_PATTERNS = [
+    r"analy[sz]e me",
+    r"(?:show|give)(?: me)? my (?:analysis|results|report|score)",
+]
+
+_PATTERNS = [
+    ("module_content", [re.compile(pattern) for pattern in MODULE_PATTERNS]),
+    ("evaluation", [re.compile(pattern) for pattern in EVALUATION_PATTERNS]),
+    ("analyze", [re.compile(pattern) for pattern in ANALYSIS_PATTERNS]),
+]
+
+
+def normalize_request(user_input):
+    """
+    The normalize_request function lowercases a user input and drops politeness and punctuation around it.
+
+    :param user_input: The user input
+    :return: The normalized input
+    :doc-author: Yusuf
+    """
+    text = " ".join(user_input.lower().split())
+    text = re.sub(r"^(?:please|can you|could you|let's|lets)\s+", "", text)
+    text = re.sub(r"\s+please$", "", text)
+    return text.strip(" .!?")
+
+
+def match_intent(user_input, module_count):
+    """
+    The match_intent function maps a structured request (e.g. from the sidebar) or an obvious free-text request
+    to the tool and the tool input the agent would pick.
+
+    :param user_input: The user input
+    :param module_count: Number of modules of the current curriculum, 0 if there is none
+    :return: A tuple of tool name and tool input, or None if the agent has to decide
+    :doc-author: Yusuf
+    """
+    text = normalize_request(user_input)
+    for tool, patterns in _PATTERNS:
+        for pattern in patterns:
+            match = pattern.fullmatch(text)
+            if match is None:
+                continue
+            if tool == "analyze":
+                return tool, ""
+            module_number = int(match.group(1))
+            # Unknown modules are left to the agent, which can explain the problem to the user
+            if not 1 <= module_number <= module_count:
+                return None
+            if tool == "module_content":
+                return tool, f"{module_number}##"
+            return tool, str(module_number)
+    return None
+
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _count(*names):
+    with _stats_lock:
+        for name in names:
+            _stats[name] += 1
+
+
+def router_stats():
+    """
+    The router_stats function returns how many requests took the fast path and how many went to the agent.
+    Every fast path request saves at least one agent LLM call.
+
+    :return: A dictionary of counters, including the share of requests that took the fast path
+    :doc-author: Yusuf
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    requests = stats.get("fast_path", 0) + stats.get("agent", 0)
+    stats["fast_path_rate"] = stats.get("fast_path", 0) / requests if requests else 0.0
+    return stats
+
+
+class IntentRouter:
+    """
+    The IntentRouter class runs requests whose tool is known without asking the model, e.g. the sidebar requests
+    "Proceed to module N", "Evaluate me on Module N" and "Analyse me", directly with that tool.
+    Everything else goes through the ZeroShotAgent. Both paths save the exchange into the conversation memory.
+
+    :doc-author: Yusuf
+    """
+
+    def __init__(self, tools, agent_chain, memory):
+        self.tools = {tool.name: tool for tool in tools}
+        self.agent_chain = agent_chain
+        self.memory = memory
+
+    def run(self, user_input, callbacks=None):
+        """
+        The run function answers a user input with the matching tool, or with the agent if no tool matches.
+
+        :param user_input: The user input
+        :param callbacks: Callbacks of the agent run. The fast path does not use them, it has no agent thoughts to show
+        :return: The response
+        :doc-author: Yusuf
+        """
+        curriculum = streamlit.session_state.get("curriculum") or []
+        intent = match_intent(user_input, len(curriculum))
+        if intent is None:
+            _count("agent")
+            get_tracer().annotate(route="agent")
+            return self.agent_chain.run(user_input, callbacks=callbacks)
+        tool, tool_input = intent
+        _count("fast_path", f"fast_path:{tool}")
+        get_tracer().annotate(route="fast_path", tool=tool)
+        log_info(f"Fast path to {tool} with input '{tool_input}'")
+        output = self.tools[tool].run(tool_input)
+        self.memory.save_context({"input": user_input}, {"output": output})
+        return output
@@ -0,0 +1,108 @@
+import streamlit as st
+
+from curriculum import get_curriculum_tree
+
+
+class ScoreBoard:
+    """
+    The ScoreBoard class keeps the quiz scores of a session per module and in total.
+    It is updated when answers are submitted, so reports and charts never recount the quiz results.
+    A module whose quiz is submitted again replaces its previous score.
+
+    :doc-author: Yusuf
+    """
+
+    __slots__ = ("modules", "correct", "total")
+
+    def __init__(self):
+        # Module index -> (correct answers, questions, results of the wrong answers)
+        self.modules = {}
+        self.correct = 0
+        self.total = 0
+
+    def record(self, module_index, results):
+        """
+        The record function puts the results of a submitted quiz into the scores.
+
+        :param module_index: Index of the module in the curriculum
+        :param results: The result dictionaries of display_quiz, one per question
+        :doc-author: Yusuf
+        """
+        previous = self.modules.get(module_index)
+        if previous is not None:
+            self.correct -= previous[0]
+            self.total -= previous[1]
+        wrong = [result for result in results if not result["is_correct"]]
+        correct = len(results) - len(wrong)
+        self.modules[module_index] = (correct, len(results), wrong)
+        self.correct += correct
+        self.total += len(results)
+
+    def report(self, titles):
+        """
+        The report function writes the scores as the text the analysis prompt gets.
+
+        :param titles: The module titles of the curriculum
+        :return: A tuple of the score lines and the wrong answers of every module that has some
+        :doc-author: Yusuf
+        """
+        scores, user_wrong_content = "", ""
+        for index in sorted(self.modules):
+            if index >= len(titles):
+                continue
+            correct, total, wrong = self.modules[index]
+            if wrong:
+                user_wrong_content += titles[index]
+                for result in wrong:
+                    user_wrong_content += f"\nQuestion: {result['question']}\nUser Answer: {result['user_answer']}\nCorrect Answer: {result['correct_answer']}\n"
+            scores += f"Module {titles[index]}: User correct answer accuracy {correct}/{total}\n"
+        scores += f"\n\nTotal All modules user correct answer accuracy: {self.correct}/{self.total}"
+        return scores, user_wrong_content
+
+    def chart_data(self, titles):
+        """
+        The chart_data function returns the scores in the form visualize_quiz_results draws.
+
+        :param titles: The module titles of the curriculum
+        :return: A tuple of a list with one score dictionary or None per module, and the total dictionary
+        :doc-author: Yusuf
+        """
+        scores = [None] * len(titles)
+        for index, (correct, total, _) in self.modules.items():
+            if index < len(titles):
+                scores[index] = {
+                    "correct_answer_count": correct,
+                    "total_questions": total,
+                    "module_title": titles[index],
+                }
+        return scores, {"correct_answer_count": self.correct, "total_questions": self.total}
+
+
+def get_scoreboard():
+    """
+    The get_scoreboard function returns the ScoreBoard of the current session.
+    A session that has quiz results but no scoreboard yet gets one built from them once.
+
+    :return: The ScoreBoard object
+    :doc-author: Yusuf
+    """
+    board = st.session_state.get("scoreboard")
+    if board is None:
+        board = ScoreBoard()
+        for quiz_id, results in st.session_state.get("quiz_results", {}).items():
+            number = quiz_id.rsplit("_", 1)[-1]
+            if number.isdigit():
+                board.record(int(number) - 1, results)
+        st.session_state["scoreboard"] = board
+    return board
+
+
+def get_module_titles():
+    """
+    The get_module_titles function returns the module titles of the current curriculum from its module tree,
+    the same titles the sidebar shows.
+
+    :return: A list of titles
+    :doc-author: Yusuf
+    """
+    return [module.title for module in get_curriculum_tree()]
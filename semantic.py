@@ -0,0 +1,300 @@
+import atexit
+import hashlib
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+import settings
+from curriculum_store import config_key, get_curriculum_store, normalize_topic
+from tracing import log_info
+
+# Words every cooking request contains, they say nothing about the dish
+STOP_WORDS = {
+    "a", "an", "the", "how", "to", "i", "me", "my", "you", "can", "could", "please", "want",
+    "wanna", "would", "like", "learn", "learning", "teach", "show", "tell", "about", "do",
+    "cook", "cooking", "cooked", "make", "making", "prepare", "preparing", "recipe", "recipes",
+    "dish", "for", "of", "with", "some", "best", "way", "good", "perfect", "homemade",
+    "bake", "baking", "easy", "simple", "quick", "classic", "traditional", "does", "at", "home",
+}
+
+
+def topic_words(topic):
+    """
+    The topic_words function returns the words of a topic that describe the dish.
+
+    :param topic: The topic that user wants to learn
+    :return: A list of words, all words of the topic if it only has stop words
+    :doc-author: Yusuf
+    """
+    words = re.findall(r"\w+", normalize_topic(topic))
+    words = [word for word in words if word not in STOP_WORDS] or words
+    # A light plural stemmer, "steaks" and "steak" are the same dish
+    return [word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word for word in words]
+
+
+class HashedNgramEmbedder:
+    """
+    The HashedNgramEmbedder class embeds a topic without a model: its dish words and their character
+    3- and 4-grams are hashed into a fixed number of signed buckets, and the vector is L2-normalized.
+    Word order and cooking verbs do not matter, so "how to cook a steak" and "Steak cooking" get the same vector,
+    and the n-grams make small spelling differences ("steaks", "stake") still close.
+
+    :doc-author: Yusuf
+    """
+
+    name = "hashed-ngram"
+
+    def __init__(self, dimensions=1024):
+        self.dimensions = dimensions
+
+    def _features(self, topic):
+        for word in topic_words(topic):
+            yield word, 1.0
+            padded = f" {word} "
+            for size in (3, 4):
+                for start in range(len(padded) - size + 1):
+                    yield padded[start : start + size], 0.5
+
+    def embed(self, topic):
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for feature, weight in self._features(topic):
+            digest = int.from_bytes(
+                hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little"
+            )
+            sign = 1.0 if digest & 1 else -1.0
+            vector[(digest >> 1) % self.dimensions] += sign * weight
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class SentenceEmbedder:
+    """
+    The SentenceEmbedder class embeds topics with a local sentence-transformers model on the CPU.
+
+    :doc-author: Yusuf
+    """
+
+    def __init__(self, model_name):
+        from sentence_transformers import SentenceTransformer
+
+        self.name = model_name
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.dimensions = self.model.get_sentence_embedding_dimension()
+
+    def embed(self, topic):
+        # The dish words are embedded, so cooking verbs do not pull unrelated dishes together
+        text = " ".join(topic_words(topic))
+        return self.model.encode(text, normalize_embeddings=True).astype(np.float32)
+
+
+def get_embedder():
+    """
+    The get_embedder function returns the embedder of SEMANTIC_MODEL, or the HashedNgramEmbedder
+    if no model is configured or sentence-transformers is not installed.
+
+    :return: An object with a name, dimensions and an embed(topic) function
+    :doc-author: Yusuf
+    """
+    if settings.SEMANTIC_MODEL:
+        try:
+            return SentenceEmbedder(settings.SEMANTIC_MODEL)
+        except Exception as e:
+            # sentence-transformers is optional, without it the hashed n-grams are used
+            log_info(f"embedding model {settings.SEMANTIC_MODEL} is not available, using hashed n-grams ({e})")
+    return HashedNgramEmbedder()
+
+
+class TopicIndex:
+    """
+    The TopicIndex class finds the stored topic that is most similar to a new one, within the same config bucket.
+    Topic vectors of a bucket are kept in one NumPy matrix with one row per dimension, so a lookup is a single
+    matrix-vector product over the dimensions the query uses (a few dozen for hashed n-grams). The matrix can have
+    spare columns after the last topic of the bucket.
+    New topics are used right away and saved to an .npz file by a background thread every flush_interval seconds,
+    so a request never waits for the whole index to be written. The index is loaded at startup, changes that other
+    server processes saved are picked up on the next lookup, together with the topics of this process that are not
+    saved yet.
+
+    :doc-author: Yusuf
+    """
+
+    def __init__(self, path, embedder, flush_interval=5.0):
+        self.path = path
+        self.embedder = embedder
+        self.flush_interval = flush_interval
+        self._buckets = {}
+        self._pending = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._load()
+
+    def __len__(self):
+        return sum(len(topics) for topics, _ in self._buckets.values())
+
+    def _load(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        with np.load(self.path, allow_pickle=False) as data:
+            if str(data["embedder"]) != self.embedder.name:
+                log_info(f"topic index {self.path} was built with another embedder, it is rebuilt")
+                return
+            # One topic list and one matrix per bucket, stored as they are used, so loading copies nothing
+            buckets = {
+                str(config): (data[f"topics_{number}"].tolist(), data[f"vectors_{number}"])
+                for number, config in enumerate(data["configs"])
+            }
+        self._buckets = buckets
+        self._mtime = mtime
+        # Topics added since the last save are kept on top of the index of the other processes
+        self._insert(self._pending)
+
+    def _save(self):
+        arrays = {
+            "embedder": np.array(self.embedder.name),
+            "configs": np.array(list(self._buckets), dtype=str),
+        }
+        for number, (topics, matrix) in enumerate(self._buckets.values()):
+            arrays[f"topics_{number}"] = np.array(topics, dtype=str)
+            arrays[f"vectors_{number}"] = matrix[:, : len(topics)]
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, self.path)
+        self._mtime = os.stat(self.path).st_mtime
+
+    def _insert(self, grouped):
+        changed = False
+        for config, new_topics in grouped.items():
+            topics, matrix = self._buckets.get(config, ([], None))
+            known = set(topics)
+            new_topics = [topic for topic in new_topics if topic not in known]
+            if not new_topics:
+                continue
+            size = len(topics) + len(new_topics)
+            if matrix is None or matrix.shape[1] < size:
+                # The matrix grows with spare columns, so adding a topic does not copy the whole bucket
+                grown = np.zeros((self.embedder.dimensions, max(size, 2 * len(topics))), dtype=np.float32)
+                if matrix is not None:
+                    grown[:, : len(topics)] = matrix[:, : len(topics)]
+                matrix = grown
+            for column, topic in enumerate(new_topics, len(topics)):
+                matrix[:, column] = self.embedder.embed(topic)
+            self._buckets[config] = (topics + new_topics, matrix)
+            changed = True
+        return changed
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._flush_loop, name="topic-index-flush", daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """
+        The flush function saves the topics added since the last save, it is called by the background thread
+        and when the process exits.
+
+        :doc-author: Yusuf
+        """
+        with self._lock:
+            if not self._pending:
+                return
+            self._save()
+            self._pending = {}
+
+    def add(self, pairs):
+        """
+        The add function puts topics into the buckets of their configurations, they are saved by the background thread.
+        Topics of a bucket are added in one step, so building the index from a large library stays linear.
+
+        :param pairs: A list of (topic, config list) tuples
+        :doc-author: Yusuf
+        """
+        grouped = {}
+        for topic, configs in pairs:
+            grouped.setdefault(config_key(configs), {})[normalize_topic(topic)] = None
+        with self._lock:
+            self._load()
+            if not self._insert(grouped):
+                return
+            for config, new_topics in grouped.items():
+                self._pending.setdefault(config, {}).update(new_topics)
+            if self.flush_interval <= 0:
+                self._save()
+                self._pending = {}
+            else:
+                self._ensure_thread()
+
+    def find(self, topic, configs):
+        """
+        The find function returns the stored topic of the same configuration that is most similar to a topic.
+
+        :param topic: The topic that user wants to learn
+        :param configs: The user configuration list
+        :return: A tuple of the stored topic and its cosine similarity, or None if the bucket is empty
+        :doc-author: Yusuf
+        """
+        vector = self.embedder.embed(topic)
+        with self._lock:
+            self._load()
+            bucket = self._buckets.get(config_key(configs))
+        if bucket is None or not bucket[0]:
+            return None
+        topics, matrix = bucket
+        # Vectors are L2-normalized, so the dot product is the cosine similarity
+        used = np.flatnonzero(vector)
+        scores = vector[used] @ matrix[used, : len(topics)]
+        best = int(np.argmax(scores))
+        return topics[best], float(scores[best])
+
+
+_topic_index = None
+_topic_index_lock = threading.Lock()
+
+
+def get_topic_index():
+    """
+    The get_topic_index function returns the process-wide TopicIndex.
+    If there is no index file yet, it is built from the topics of the curriculum store.
+
+    :return: The TopicIndex object
+    :doc-author: Yusuf
+    """
+    global _topic_index
+    with _topic_index_lock:
+        if _topic_index is None:
+            index = TopicIndex(settings.SEMANTIC_INDEX_PATH, get_embedder(), settings.SEMANTIC_FLUSH_SECONDS)
+            if len(index) == 0:
+                index.add(get_curriculum_store().pairs())
+            _topic_index = index
+        return _topic_index
+
+
+def find_similar_topic(topic, configs):
+    """
+    The find_similar_topic function returns the stored topic that can serve a request for another wording of it.
+
+    :param topic: The topic that user wants to learn
+    :param configs: The user configuration list
+    :return: The stored topic, or None if no stored topic reaches SEMANTIC_THRESHOLD
+    :doc-author: Yusuf
+    """
+    match = get_topic_index().find(topic, configs)
+    if match is None:
+        return None
+    stored_topic, score = match
+    log_info(f"most similar topic to '{topic}': '{stored_topic}' ({score:.2f})")
+    return stored_topic if score >= settings.SEMANTIC_THRESHOLD else None
@@ -0,0 +1,133 @@
+import threading
+import time
+from collections import OrderedDict
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+import settings
+
+
+class SessionStore:
+    """
+    The SessionStore class keeps per-session objects that must not be shared between browser sessions
+    (e.g. the conversation memory) in one bounded, process-wide dictionary.
+    Sessions that were not used for idle_timeout seconds are dropped, and when more than max_sessions
+    sessions are alive the least recently used one is dropped.
+
+    :doc-author: Yusuf
+    """
+
+    def __init__(self, max_sessions, idle_timeout):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.evictions = 0
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id, key, factory):
+        """
+        The get function returns the object stored under key for a session and creates it with factory if it is missing.
+
+        :param session_id: Id of the browser session
+        :param key: Name of the object
+        :param factory: Function without arguments that creates the object
+        :return: The stored object
+        :doc-author: Yusuf
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._evict(now)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                entry = {"last_used": now, "values": {}}
+                self._sessions[session_id] = entry
+            entry["last_used"] = now
+            self._sessions.move_to_end(session_id)
+            if key not in entry["values"]:
+                entry["values"][key] = factory()
+            value = entry["values"][key]
+            # Drop the least recently used sessions only after the current one is stored
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+            return value
+
+    def _evict(self, now):
+        while self._sessions:
+            session_id, entry = next(iter(self._sessions.items()))
+            if now - entry["last_used"] <= self.idle_timeout:
+                break
+            del self._sessions[session_id]
+            self.evictions += 1
+
+    def drop(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+_session_store = SessionStore(
+    settings.MAX_LIVE_SESSIONS, settings.SESSION_IDLE_TIMEOUT_SECONDS
+)
+
+
+def get_session_store():
+    """
+    The get_session_store function returns the process-wide SessionStore.
+
+    :return: The SessionStore object
+    :doc-author: Yusuf
+    """
+    return _session_store
+
+
+_thread_session = threading.local()
+
+
+class session_scope:
+    """
+    The session_scope context manager lets background worker threads act on behalf of a browser session,
+    so that current_session_id returns that session inside the block.
+
+    :doc-author: Yusuf
+    """
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+
+    def __enter__(self):
+        self._previous = getattr(_thread_session, "session_id", None)
+        _thread_session.session_id = self.session_id
+        return self
+
+    def __exit__(self, *exc_info):
+        _thread_session.session_id = self._previous
+
+
+def current_session_id():
+    """
+    The current_session_id function returns the id of the browser session the running code belongs to.
+
+    :return: The session id, or "default" when the code does not run inside a Streamlit script or a session_scope
+    :doc-author: Yusuf
+    """
+    session_id = getattr(_thread_session, "session_id", None)
+    if session_id is not None:
+        return session_id
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else "default"
+
+
+def mark_changed(*names):
+    """
+    The mark_changed function records session state values that were changed in place, e.g. a message appended
+    to "messages", so save_session_state writes them to the state backend. Values that are assigned anew
+    are noticed without it.
+
+    :param names: Names of SESSION_STATE_KEYS
+    :doc-author: Yusuf
+    """
+    st.session_state.setdefault("state_changed", set()).update(names)
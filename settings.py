@@ -0,0 +1,145 @@
+import os
+
+from dotenv import find_dotenv, load_dotenv
+
+# A local .env file is read once per process, before any setting or API key is read from the environment
+load_dotenv(find_dotenv(usecwd=True))
+
+
+def _env_int(name, default):
+    """
+    The _env_int function reads an integer setting from the environment and falls back to a default value.
+
+    :param name: Name of the environment variable
+    :param default: Value used when the variable is missing or empty
+    :return: An integer
+    :doc-author: Yusuf
+    """
+    value = os.environ.get(name, "")
+    return int(value) if value.strip() else default
+
+
+def _env_flag(name, default):
+    """
+    The _env_flag function reads a boolean setting from the environment ("1", "true", "yes" and "on" are true).
+
+    :param name: Name of the environment variable
+    :param default: Value used when the variable is missing or empty
+    :return: A boolean
+    :doc-author: Yusuf
+    """
+    value = os.environ.get(name, "").strip().lower()
+    return value in ("1", "true", "yes", "on") if value else default
+
+
+# Root folder for everything the app persists locally
+CACHE_DIR = os.environ.get("TEACHER_CACHE_DIR", ".cache")
+
+# Response cache for every LLM call (see cache.py)
+RESPONSE_CACHE_DIR = os.path.join(CACHE_DIR, "responses")
+RESPONSE_CACHE_MEMORY_ITEMS = _env_int("RESPONSE_CACHE_MEMORY_ITEMS", 256)
+RESPONSE_CACHE_DISK_BYTES = _env_int("RESPONSE_CACHE_DISK_BYTES", 256 * 1024 * 1024)
+RESPONSE_CACHE_TTL_SECONDS = _env_int("RESPONSE_CACHE_TTL_SECONDS", 7 * 24 * 3600)
+
+# Shared content library of curricula and modules (see curriculum_store.py and prewarm.py)
+CURRICULUM_DB_PATH = os.path.join(CACHE_DIR, "curriculum.sqlite3")
+LIBRARY_MAX_BYTES = _env_int("LIBRARY_MAX_BYTES", 256 * 1024 * 1024)
+
+# Semantic topic lookup of the library (see semantic.py). Without SEMANTIC_MODEL topics are
+# embedded with hashed character n-grams, a model needs the optional sentence-transformers package.
+SEMANTIC_INDEX_PATH = os.path.join(CACHE_DIR, "topics.npz")
+SEMANTIC_MODEL = os.environ.get("SEMANTIC_MODEL", "")
+SEMANTIC_THRESHOLD = float(os.environ.get("SEMANTIC_THRESHOLD", "0.8"))
+SEMANTIC_FLUSH_SECONDS = float(os.environ.get("SEMANTIC_FLUSH_SECONDS", "5.0"))
+
+# Options offered by create_conf_buttons, in the order they appear in the config tuple
+CONFIG_OPTIONS = {
+    "depth": ["Beginner", "Intermediate", "Expert"],
+    "style": ["All World", "Asian", "European", "American", "South-American", "African"],
+    "time": ["Short", "Medium", "Long"],
+    "communication": ["Image-Containing", "Text-Only"],
+    "language": ["English", "Chinese", "Turkish", "German"],
+}
+
+# Stream module, answer and analysis tokens into the chat container (see streaming.py)
+STREAMING_ENABLED = _env_flag("TEACHER_STREAMING", True)
+
+# Quiz result charts kept as PNG bytes (see utils.render_quiz_chart)
+CHART_CACHE_ITEMS = _env_int("CHART_CACHE_ITEMS", 64)
+
+# Flashcard HTML of sidebar modules (see utils.flashcards_html)
+SIDEBAR_CACHE_ITEMS = _env_int("SIDEBAR_CACHE_ITEMS", 512)
+
+# Generated images, transcoded to WebP at display resolution (see image_store.py)
+IMAGE_STORE_DIR = os.path.join(CACHE_DIR, "images")
+IMAGE_STORE_BYTES = _env_int("IMAGE_STORE_BYTES", 512 * 1024 * 1024)
+IMAGE_DISPLAY_PX = _env_int("IMAGE_DISPLAY_PX", 768)
+IMAGE_WEBP_QUALITY = _env_int("IMAGE_WEBP_QUALITY", 80)
+
+# Chat history rendering (see history.py)
+HISTORY_FULL_MESSAGES = _env_int("HISTORY_FULL_MESSAGES", 6)
+HISTORY_STUB_MESSAGES = _env_int("HISTORY_STUB_MESSAGES", 30)
+HISTORY_INLINE_CHARS = _env_int("HISTORY_INLINE_CHARS", 1000)
+
+# Token budgets of prompt variables (see prompts.BudgetedPromptTemplate)
+PROMPT_HISTORY_TOKENS = _env_int("PROMPT_HISTORY_TOKENS", 800)
+PROMPT_MODULE_TOKENS = _env_int("PROMPT_MODULE_TOKENS", 2500)
+
+# Module content, flashcards, quiz and image key content in one JSON call (see bundle.py):
+# "off", "json" (JSON mode, schema in the prompt) or "schema" (strict structured outputs)
+BUNDLE_MODE = os.environ.get("TEACHER_BUNDLE", "off")
+
+# Per-session conversation memory (see session_store.py and memory.py)
+MEMORY_BUFFER_TOKENS = _env_int("MEMORY_BUFFER_TOKENS", 2000)
+MEMORY_ARTIFACT_CHARS = _env_int("MEMORY_ARTIFACT_CHARS", 2000)
+MEMORY_ARTIFACT_ITEMS = _env_int("MEMORY_ARTIFACT_ITEMS", 32)
+MEMORY_SUMMARY_WORKERS = _env_int("MEMORY_SUMMARY_WORKERS", 2)
+MAX_LIVE_SESSIONS = _env_int("MAX_LIVE_SESSIONS", 200)
+SESSION_IDLE_TIMEOUT_SECONDS = _env_int("SESSION_IDLE_TIMEOUT_SECONDS", 3600)
+
+# Session artifacts outside the server process (see state_store.py): "memory" (this process only),
+# "sqlite" (every process of the host) or "resp" (a Redis protocol server, see state_server.py)
+STATE_BACKEND = os.environ.get("STATE_BACKEND", "memory")
+STATE_DB_PATH = os.path.join(CACHE_DIR, "state.sqlite3")
+STATE_URL = os.environ.get("STATE_URL", "redis://localhost:6380")
+STATE_TTL_SECONDS = _env_int("STATE_TTL_SECONDS", 24 * 3600)
+# Bounds of the "memory" state backend, the least recently used values are dropped first
+STATE_MEMORY_MAX_ITEMS = _env_int("STATE_MEMORY_MAX_ITEMS", 100000)
+STATE_MEMORY_MAX_BYTES = _env_int("STATE_MEMORY_MAX_BYTES", 256 * 1024 * 1024)
+
+# Speculative prefetch of the next module (see prefetch.py)
+PREFETCH_ENABLED = _env_flag("TEACHER_PREFETCH", False)
+PREFETCH_WORKERS = _env_int("PREFETCH_WORKERS", 2)
+PREFETCH_TOKEN_BUDGET = _env_int("PREFETCH_TOKEN_BUDGET", 30000)
+
+# Background stages of learn_module (see pipeline.py)
+PIPELINE_WORKERS = _env_int("PIPELINE_WORKERS", 8)
+PIPELINE_POLL_SECONDS = float(os.environ.get("PIPELINE_POLL_SECONDS", "1.0"))
+
+# Model access through the async gateway (see model_client.py)
+OPENAI_API_BASE = os.environ.get("OPENAI_API_BASE", "https://api.openai.com/v1")
+MODEL_MAX_IN_FLIGHT = _env_int("MODEL_MAX_IN_FLIGHT", 16)
+MODEL_MAX_CONNECTIONS = _env_int("MODEL_MAX_CONNECTIONS", 32)
+MODEL_MAX_RETRIES = _env_int("MODEL_MAX_RETRIES", 4)
+MODEL_TIMEOUT_SECONDS = _env_int("MODEL_TIMEOUT_SECONDS", 180)
+MODEL_BACKOFF_CAP_SECONDS = _env_int("MODEL_BACKOFF_CAP_SECONDS", 30)
+
+# Model backend: "openai" (through the gateway) or "fake" (offline and deterministic, see backends.py)
+MODEL_BACKEND = os.environ.get("TEACHER_BACKEND", "openai")
+FAKE_LLM_LATENCY_SECONDS = float(os.environ.get("FAKE_LLM_LATENCY_SECONDS", "0.0"))
+FAKE_LLM_TOKEN_LATENCY_SECONDS = float(os.environ.get("FAKE_LLM_TOKEN_LATENCY_SECONDS", "0.0"))
+FAKE_IMAGE_LATENCY_SECONDS = float(os.environ.get("FAKE_IMAGE_LATENCY_SECONDS", "0.0"))
+
+# Logging and tracing (see tracing.py)
+VERBOSE = _env_flag("TEACHER_VERBOSE", True)
+TRACE_EXPORTER = os.environ.get("TRACE_EXPORTER", "off")
+TRACE_FILE = os.environ.get("TRACE_FILE", os.path.join(CACHE_DIR, "traces.jsonl"))
+TRACE_OTLP_ENDPOINT = os.environ.get(
+    "TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces"
+)
+TRACE_FLUSH_SECONDS = float(os.environ.get("TRACE_FLUSH_SECONDS", "2.0"))
+# Latest request, stage and tool metrics kept in session state, older ones are only in the traces
+SESSION_METRICS_ITEMS = _env_int("SESSION_METRICS_ITEMS", 100)
+
+# Import the agent stack in the background after the first page load of a process (see warmup.py)
+WARMUP_ENABLED = _env_flag("TEACHER_WARMUP", True)
@@ -0,0 +1,115 @@
+"""
+A local stand-in for Redis: the few commands of the Redis protocol (RESP) the RESP state backend uses.
+
+Start it once per host (or on one host of a small deployment) and point every server process at it:
+
+    python state_server.py --port 6380
+    STATE_BACKEND=resp STATE_URL=redis://localhost:6380 streamlit run main.py --server.port 8501
+    STATE_BACKEND=resp STATE_URL=redis://localhost:6380 streamlit run main.py --server.port 8502
+
+Values live in the memory of this process only. With a real Redis server nothing else changes.
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+_values = {}
+_lock = threading.Lock()
+
+
+def _get(key, now):
+    entry = _values.get(key)
+    if entry is None:
+        return None
+    if entry[1] is not None and entry[1] <= now:
+        del _values[key]
+        return None
+    return entry[0]
+
+
+def handle_command(command):
+    """
+    The handle_command function runs one command on the stored values.
+
+    :param command: A list of byte strings, the command name first
+    :return: The reply, encoded for the protocol
+    :doc-author: Yusuf
+    """
+    name = command[0].upper()
+    arguments = command[1:]
+    now = time.time()
+    with _lock:
+        if name == b"PING":
+            return b"+PONG\r\n"
+        if name == b"GET":
+            return _bulk(_get(arguments[0], now))
+        if name == b"MGET":
+            values = [_bulk(_get(key, now)) for key in arguments]
+            return b"*%d\r\n%s" % (len(values), b"".join(values))
+        if name == b"SET":
+            expires = None
+            options = [option.upper() for option in arguments[2:]]
+            if b"EX" in options:
+                expires = now + int(arguments[2 + options.index(b"EX") + 1])
+            _values[arguments[0]] = (arguments[1], expires)
+            return b"+OK\r\n"
+        if name == b"DEL":
+            removed = sum(_values.pop(key, None) is not None for key in arguments)
+            return b":%d\r\n" % removed
+        if name == b"EXPIRE":
+            value = _get(arguments[0], now)
+            if value is None:
+                return b":0\r\n"
+            _values[arguments[0]] = (value, now + int(arguments[1]))
+            return b":1\r\n"
+        if name == b"DBSIZE":
+            return b":%d\r\n" % len(_values)
+        if name == b"FLUSHALL":
+            _values.clear()
+            return b"+OK\r\n"
+    return b"-ERR unknown command '%s'\r\n" % name
+
+
+def _bulk(value):
+    if value is None:
+        return b"$-1\r\n"
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+class RespHandler(socketserver.StreamRequestHandler):
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            # Inline commands, e.g. typed into telnet
+            return line.split()
+        command = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            command.append(self.rfile.read(length + 2)[:-2])
+        return command
+
+    def handle(self):
+        while True:
+            command = self._read_command()
+            if command is None or command[:1] == [b"QUIT"]:
+                return
+            if command:
+                self.wfile.write(handle_command(command))
+
+
+class RespServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6380)
+    args = parser.parse_args()
+    with RespServer((args.host, args.port), RespHandler) as server:
+        print(f"state server listening on {args.host}:{args.port}")
+        server.serve_forever()
@@ -0,0 +1,360 @@
+import base64
+import json
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import settings
+from history import PayloadRef
+from quiz import Quiz, QuizQuestion
+from scores import ScoreBoard
+
+
+class MemoryStateBackend:
+    """
+    The MemoryStateBackend class keeps state values in a dictionary of the server process.
+    It is the default: sessions survive a page reload, but other server processes do not see them.
+    Beyond max_items values or max_bytes bytes, the least recently used values are dropped.
+
+    :doc-author: Yusuf
+    """
+
+    shared = False
+
+    def __init__(self, max_items=None, max_bytes=None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._values = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._last_purge = time.monotonic()
+
+    def get_many(self, keys):
+        """
+        The get_many function looks up several keys at once.
+
+        :param keys: A list of keys
+        :return: A dictionary of the keys that are present to their bytes
+        :doc-author: Yusuf
+        """
+        now = time.time()
+        with self._lock:
+            values = {}
+            for key in keys:
+                entry = self._values.get(key)
+                if entry is not None and entry[1] > now:
+                    values[key] = entry[0]
+                    self._values.move_to_end(key)
+            return values
+
+    def set_many(self, items, ttl):
+        """
+        The set_many function stores several values at once.
+
+        :param items: A dictionary of keys to bytes
+        :param ttl: Seconds until the values expire
+        :doc-author: Yusuf
+        """
+        now = time.time()
+        with self._lock:
+            for key, value in items.items():
+                self._remove(key)
+                self._values[key] = (value, now + ttl)
+                self._bytes += len(value)
+            # Expired sessions are dropped at most once a minute
+            if time.monotonic() - self._last_purge > 60:
+                self._last_purge = time.monotonic()
+                for key in [key for key, (_, expires) in self._values.items() if expires <= now]:
+                    self._remove(key)
+            while self._values and (
+                (self.max_items is not None and len(self._values) > self.max_items)
+                or (self.max_bytes is not None and self._bytes > self.max_bytes)
+            ):
+                self._remove(next(iter(self._values)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._values.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[0])
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._remove(key)
+
+
+class SqliteStateBackend:
+    """
+    The SqliteStateBackend class keeps state values in a SQLite database in WAL mode,
+    so every Streamlit server process on the host reads and writes the same sessions.
+
+    :doc-author: Yusuf
+    """
+
+    shared = True
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connection() as connection:
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS state (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    expires REAL NOT NULL
+                ) WITHOUT ROWID
+                """
+            )
+
+    def _connection(self):
+        # sqlite3 connections can not be shared between threads, so every thread opens its own one
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        rows = self._connection().execute(
+            f"SELECT key, value FROM state WHERE key IN ({','.join('?' * len(keys))}) AND expires > ?",
+            keys + [time.time()],
+        )
+        return {key: bytes(value) for key, value in rows}
+
+    def set_many(self, items, ttl):
+        now = time.time()
+        with self._connection() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO state (key, value, expires) VALUES (?, ?, ?)",
+                [(key, value, now + ttl) for key, value in items.items()],
+            )
+            # Expired sessions are dropped by one write in a hundred
+            if random.random() < 0.01:
+                connection.execute("DELETE FROM state WHERE expires <= ?", (now,))
+
+    def delete(self, keys):
+        with self._connection() as connection:
+            connection.executemany("DELETE FROM state WHERE key = ?", [(key,) for key in keys])
+
+
+class RespError(Exception):
+    pass
+
+
+class RespStateBackend:
+    """
+    The RespStateBackend class keeps state values in a server that speaks the Redis protocol (RESP):
+    Redis itself, or the stand-in of state_server.py. Server processes on several hosts can share it.
+    Every thread keeps one connection, and several commands are sent in one round trip.
+
+    :doc-author: Yusuf
+    """
+
+    shared = True
+
+    def __init__(self, url):
+        # redis://host:port
+        address = url.split("://", 1)[-1].rstrip("/")
+        host, _, port = address.partition(":")
+        self.address = (host or "localhost", int(port or 6379))
+        self._local = threading.local()
+
+    def _socket(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            sock = socket.create_connection(self.address, timeout=30)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection = (sock, sock.makefile("rb"))
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _encode(command):
+        parts = [f"*{len(command)}\r\n".encode()]
+        for argument in command:
+            if not isinstance(argument, bytes):
+                argument = str(argument).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(argument), argument))
+        return b"".join(parts)
+
+    @classmethod
+    def _read_reply(cls, reader):
+        line = reader.readline()
+        if not line:
+            raise ConnectionError("state server closed the connection")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode()
+        if kind == b"-":
+            raise RespError(body.decode())
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            return reader.read(length + 2)[:-2]
+        if kind == b"*":
+            length = int(body)
+            return None if length < 0 else [cls._read_reply(reader) for _ in range(length)]
+        raise RespError(f"unknown reply {line!r}")
+
+    def execute(self, *commands):
+        """
+        The execute function sends commands in one round trip and returns their replies.
+
+        :param commands: Lists of command arguments, e.g. ["GET", "key"]
+        :return: A list with one reply per command
+        :doc-author: Yusuf
+        """
+        payload = b"".join(self._encode(command) for command in commands)
+        try:
+            sock, reader = self._socket()
+            sock.sendall(payload)
+            return [self._read_reply(reader) for _ in commands]
+        except OSError:
+            # A broken connection is opened again once, the commands are idempotent
+            self._local.connection = None
+            sock, reader = self._socket()
+            sock.sendall(payload)
+            return [self._read_reply(reader) for _ in commands]
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = self.execute(["MGET"] + keys)[0]
+        return {key: value for key, value in zip(keys, values) if value is not None}
+
+    def set_many(self, items, ttl):
+        if items:
+            self.execute(*[["SET", key, value, "EX", int(ttl)] for key, value in items.items()])
+
+    def delete(self, keys):
+        keys = list(keys)
+        if keys:
+            self.execute(["DEL"] + keys)
+
+
+def encode_value(value):
+    """
+    The encode_value function turns a session state value into JSON bytes.
+    Sets, tuples, bytes, dictionaries with non-string keys, quizzes and history payload references
+    are tagged, so decode_value gives back the same objects.
+
+    :param value: The value
+    :return: UTF-8 encoded JSON
+    :doc-author: Yusuf
+    """
+    return json.dumps(_tag(value), separators=(",", ":")).encode("utf-8")
+
+
+def decode_value(data):
+    """
+    The decode_value function turns the bytes of encode_value back into the value.
+
+    :param data: UTF-8 encoded JSON
+    :return: The value
+    :doc-author: Yusuf
+    """
+    return _untag(json.loads(data))
+
+
+def _tag(value):
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, list):
+        return [_tag(item) for item in value]
+    if isinstance(value, tuple):
+        return {"__tuple__": [_tag(item) for item in value]}
+    if isinstance(value, (set, frozenset)):
+        return {"__set__": [_tag(item) for item in value]}
+    if isinstance(value, bytes):
+        return {"__bytes__": base64.b64encode(value).decode("ascii")}
+    if isinstance(value, dict):
+        if all(isinstance(key, str) for key in value):
+            return {key: _tag(item) for key, item in value.items()}
+        return {"__dict__": [[_tag(key), _tag(item)] for key, item in value.items()]}
+    if isinstance(value, Quiz):
+        questions = [
+            [question.question, question.options, question.answer, question.explanation]
+            for question in value.questions
+        ]
+        return {"__quiz__": [value.quiz_id, value.module_number, questions]}
+    if isinstance(value, PayloadRef):
+        return {"__payload__": [value.payload_id, value.preview, value.length]}
+    if isinstance(value, ScoreBoard):
+        return {"__scores__": [[index, _tag(score)] for index, score in value.modules.items()]}
+    raise TypeError(f"{type(value).__name__} can not be kept in the state backend")
+
+
+def _untag(value):
+    if isinstance(value, list):
+        return [_untag(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if len(value) == 1:
+        (tag, body), = value.items()
+        if tag == "__tuple__":
+            return tuple(_untag(item) for item in body)
+        if tag == "__set__":
+            return {_untag(item) for item in body}
+        if tag == "__bytes__":
+            return base64.b64decode(body)
+        if tag == "__dict__":
+            return {_untag(key): _untag(item) for key, item in body}
+        if tag == "__quiz__":
+            quiz_id, module_number, questions = body
+            return Quiz(quiz_id, module_number, [QuizQuestion(*question) for question in questions])
+        if tag == "__payload__":
+            return PayloadRef(*body)
+        if tag == "__scores__":
+            board = ScoreBoard()
+            for index, score in body:
+                correct, total, wrong = _untag(score)
+                board.modules[index] = (correct, total, wrong)
+                board.correct += correct
+                board.total += total
+            return board
+    return {key: _untag(item) for key, item in value.items()}
+
+
+_state_backend = None
+_state_backend_lock = threading.Lock()
+
+
+def get_state_backend():
+    """
+    The get_state_backend function returns the process-wide state backend of STATE_BACKEND:
+    "memory" (this process only), "sqlite" (every process on the host) or "resp" (a Redis protocol server).
+
+    :return: The state backend object
+    :doc-author: Yusuf
+    """
+    global _state_backend
+    with _state_backend_lock:
+        if _state_backend is None:
+            if settings.STATE_BACKEND == "sqlite":
+                _state_backend = SqliteStateBackend(settings.STATE_DB_PATH)
+            elif settings.STATE_BACKEND == "resp":
+                _state_backend = RespStateBackend(settings.STATE_URL)
+            elif settings.STATE_BACKEND == "memory":
+                _state_backend = MemoryStateBackend(
+                    settings.STATE_MEMORY_MAX_ITEMS, settings.STATE_MEMORY_MAX_BYTES
+                )
+            else:
+                raise ValueError(f"unknown STATE_BACKEND {settings.STATE_BACKEND}")
+        return _state_backend
@@ -0,0 +1,108 @@
+import time
+from collections import deque
+
+import streamlit as st
+from langchain_core.callbacks import BaseCallbackHandler
+
+import settings
+from tracing import log_info
+
+
+class TokenStreamHandler(BaseCallbackHandler):
+    """
+    The TokenStreamHandler class writes the tokens of a running chain into a Streamlit placeholder.
+    It also measures time-to-first-token and total latency of the user request it belongs to.
+
+    :doc-author: Yusuf
+    """
+
+    def __init__(self, placeholder, min_interval=0.05):
+        self.placeholder = placeholder
+        self.min_interval = min_interval
+        self.text = ""
+        self.started = time.perf_counter()
+        self.first_token_at = None
+        self._last_render = 0.0
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.text = ""
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.text = ""
+
+    def on_llm_new_token(self, token, **kwargs):
+        now = time.perf_counter()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        self.text += token
+        # Re-rendering the markdown for every token floods the websocket, so we throttle the updates
+        if now - self._last_render >= self.min_interval:
+            self.placeholder.markdown(self.text + "▌")
+            self._last_render = now
+
+    def on_llm_end(self, response, **kwargs):
+        if self.text:
+            self.placeholder.markdown(self.text)
+
+    def metrics(self):
+        """
+        The metrics function returns the latency of the request measured so far.
+
+        :return: A dictionary with time_to_first_token (None if nothing was streamed) and total_latency in seconds
+        :doc-author: Yusuf
+        """
+        return {
+            "time_to_first_token": (
+                self.first_token_at - self.started
+                if self.first_token_at is not None
+                else None
+            ),
+            "total_latency": time.perf_counter() - self.started,
+        }
+
+
+def start_stream(placeholder):
+    """
+    The start_stream function creates the TokenStreamHandler of the current user request and keeps it in session state,
+    so that tools with return_direct=True can stream their output into the chat container.
+
+    :param placeholder: The st.empty placeholder of the assistant message
+    :return: The TokenStreamHandler object
+    :doc-author: Yusuf
+    """
+    handler = TokenStreamHandler(placeholder)
+    st.session_state["token_stream"] = handler
+    return handler
+
+
+def stop_stream():
+    """
+    The stop_stream function detaches the TokenStreamHandler of the current request, reports its latency and
+    clears the streamed preview, so that the final response can be rendered in its place.
+
+    :return: The latency metrics of the request, or None if no stream was running
+    :doc-author: Yusuf
+    """
+    handler = st.session_state.pop("token_stream", None)
+    if handler is None:
+        return None
+    handler.placeholder.empty()
+    metrics = handler.metrics()
+    st.session_state.setdefault(
+        "latency_metrics", deque(maxlen=settings.SESSION_METRICS_ITEMS)
+    ).append(metrics)
+    log_info(f"Request latency: {metrics}")
+    return metrics
+
+
+def stream_callbacks():
+    """
+    The stream_callbacks function returns the callbacks that a streamed chain should be run with.
+
+    :return: A list with the TokenStreamHandler of the current request, or an empty list if streaming is disabled
+    :doc-author: Yusuf
+    """
+    if not settings.STREAMING_ENABLED:
+        return []
+    handler = st.session_state.get("token_stream")
+    return [handler] if handler is not None else []
@@ -0,0 +1,86 @@
+import threading
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    with _encoding_lock:
+        if not _encoding_loaded:
+            _encoding_loaded = True
+            try:
+                import tiktoken
+
+                _encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                # tiktoken is optional, without it (or its encoding files) we estimate
+                print(f"INFO: tiktoken is not available, token counts are estimated ({e})")
+        return _encoding
+
+
+def count_tokens(text):
+    """
+    The count_tokens function counts the GPT-4 tokens of a text with the local tiktoken tokenizer.
+    If tiktoken is not available, it estimates about 4 characters per token.
+
+    :param text: Any text sent to or returned by the model
+    :return: An integer
+    :doc-author: Yusuf
+    """
+    encoding = _get_encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text, budget, keep="head"):
+    """
+    The truncate_tokens function shortens a text to a token budget.
+
+    :param text: The text
+    :param budget: Maximum number of tokens
+    :param keep: "head" keeps the beginning of the text, "tail" keeps the end (e.g. the latest conversation)
+    :return: The text, shortened if it was over budget
+    :doc-author: Yusuf
+    """
+    encoding = _get_encoding()
+    if encoding is None:
+        limit = budget * 4
+        if len(text) <= limit:
+            return text
+        return text[:limit] if keep == "head" else text[-limit:]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= budget:
+        return text
+    return encoding.decode(tokens[:budget] if keep == "head" else tokens[-budget:])
+
+
+def compact_markdown(text, budget):
+    """
+    The compact_markdown function shortens a markdown text (e.g. module content) to a token budget without
+    losing its outline: every heading is kept, and the body lines are kept in order until the budget is used up.
+
+    :param text: The markdown text
+    :param budget: Maximum number of tokens
+    :return: The text, compacted if it was over budget
+    :doc-author: Yusuf
+    """
+    if count_tokens(text) <= budget:
+        return text
+    lines = text.splitlines()
+    headings = [index for index, line in enumerate(lines) if line.lstrip().startswith("#")]
+    used = sum(count_tokens(lines[index]) + 1 for index in headings)
+    if used >= budget:
+        return truncate_tokens(text, budget)
+    kept = set(headings)
+    for index, line in enumerate(lines):
+        if index in kept or not line.strip():
+            continue
+        cost = count_tokens(line) + 1
+        if used + cost > budget:
+            break
+        kept.add(index)
+        used += cost
+    return "\n".join(line for index, line in enumerate(lines) if index in kept)
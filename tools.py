@@ -1,22 +1,63 @@
 import os
-
-import openai
-
-print(f"OpenAI VERSION: {openai.__version__}")
-import threading
+import time
+import uuid
+from collections import deque
 
 import streamlit as st
-from dotenv import find_dotenv, load_dotenv
 from langchain.agents import Tool
 from langchain.chains import LLMChain
-from streamlit.runtime.scriptrunner import add_script_run_ctx
 
-from chains import get_chains
+import settings
+from curriculum import build_curriculum_tree
+from curriculum_store import get_curriculum_store
+from image_store import get_image_store, transcode_image
+from backends import get_image_model
+from bundle import BundleError, parse_bundle, response_format
+from pipeline import StageResult, get_pipeline
+from prefetch import get_prefetcher
+from quiz import Quiz, format_quiz, make_quiz_id, parse_quiz
+from scores import get_module_titles, get_scoreboard
+from semantic import find_similar_topic, get_topic_index
+from session_store import current_session_id, mark_changed
+from streaming import stream_callbacks
+from tracing import get_tracer, log_info
+
+
+def parse_curriculum(curriculum):
+    """
+    The parse_curriculum function takes a string of curriculum and splits it into a list of strings.
+        The split is done on the delimiter '$$$'.
+        It then strips each element in the list to remove any leading or trailing whitespace.
+        Finally, it removes any empty elements from the list.
+
+    :param curriculum: Split the curriculum into a list of strings
+    :return: A list of strings
+    :doc-author: Yusuf
+    """
+    curriculum = curriculum.split("$$$")
+    curriculum = [
+        c.strip() for c in curriculum if c.strip() != "" and c.strip() != "\n"
+    ]
+    return curriculum
 
-_ = load_dotenv(find_dotenv())  # read local .env file
-openai.api_key = os.environ["OPENAI_API_KEY"]
 
-import pickle
+def set_curriculum(curriculum):
+    """
+    The set_curriculum function puts a curriculum into session state together with its module tree,
+    so the sidebar and the score reports use titles and sections parsed once.
+    The modules of the previous curriculum are dropped, and the new curriculum gets an id that the background
+    stages of its modules are tagged with (see collect_module_stages).
+
+    :param curriculum: The raw curriculum string
+    :doc-author: Yusuf
+    """
+    modules = parse_curriculum(curriculum)
+    st.session_state["curriculum"] = modules
+    st.session_state["curriculum_tree"] = build_curriculum_tree(modules)
+    st.session_state["curriculum_id"] = uuid.uuid4().hex
+    for key in ("module_contents", "flashcard", "image_ids"):
+        st.session_state[key] = [None] * len(modules)
+    st.session_state["prepared_quizzes"] = {}
 
 
 def generate_curriculum(input, curriculum_chain):
@@ -24,87 +65,298 @@ def generate_curriculum(input, curriculum_chain):
     The generate_curriculum function is used to generate a curriculum for the user.
     It takes in an input string and a curriculum chain, which is then run on the input string.
     The resulting output of this function is stored in session state as well as returned to be displayed.
+    Curricula are looked up in the shared library first, by exact topic and then by the most similar stored topic
+    of the same config (see semantic.py), and the request is counted for pre-warming.
     
     :param input: Generate the curriculum
     :param curriculum_chain: Generate the curriculum
     :return: A string of the curriculum
     :doc-author: Yusuf
     """
-    def parse_curriculum(curriculum):
-        """
-        The parse_curriculum function takes a string of curriculum and splits it into a list of strings.
-            The split is done on the delimiter '$$$'.
-            It then strips each element in the list to remove any leading or trailing whitespace.
-            Finally, it removes any empty elements from the list.
-        
-        :param curriculum: Split the curriculum into a list of strings
-        :return: A list of strings
-        :doc-author: Yusuf
-        """
-        curriculum = curriculum.split("$$$")
-        curriculum = [
-            c.strip() for c in curriculum if c.strip() != "" and c.strip() != "\n"
-        ]
-        return curriculum
-
-    path = f'{input.replace(" ", "-")}_{"-".join(st.session_state["configs"])}.pkl'
-    os.makedirs(".cache", exist_ok=True)
-    path = os.path.join(".cache", path)
-    if os.path.exists(path):
-        print("INFO: load curriculum from cache")
-        with open(path, "rb") as f:
-            curriculum = pickle.load(f)
-        st.session_state["curriculum"] = parse_curriculum(curriculum)
+    store = get_curriculum_store()
+    configs = st.session_state["configs"]
+    topic = input
+    curriculum = store.get(topic, configs)
+    if curriculum is None:
+        # Another wording of a stored topic ("Steak cooking" for "how to cook a steak") reuses its curriculum
+        similar_topic = find_similar_topic(topic, configs)
+        if similar_topic is not None:
+            curriculum = store.get(similar_topic, configs)
+            if curriculum is not None:
+                get_tracer().count("semantic_hits")
+                topic = similar_topic
+    store.record_request(topic, configs)
+    # Modules of this curriculum are shared in the library under the same key
+    st.session_state["library_key"] = (topic, list(configs))
+    st.session_state["custom_modules"] = set()
+    if curriculum is not None:
+        log_info("load curriculum from cache")
+        set_curriculum(curriculum)
+        # Put curriculum to memory as llm answer, the memory keeps it as an artifact and references it by id
         st.session_state["memory"].save_context(
-            {"input": input}, {"chat": st.session_state["curriculum"]}
+            {"input": input}, {"chat": "\n\n".join(st.session_state["curriculum"])}
         )
-        # Put curriculum to memory as llm answer
         return curriculum.replace("$$$", "")
     else:
-        print("INFO: Generating curriculum")
+        log_info("Generating curriculum")
         curriculum = curriculum_chain.run(input)
-        st.session_state["curriculum"] = parse_curriculum(curriculum)
-        with open(path, "wb") as f:
-            pickle.dump(curriculum, f)
+        set_curriculum(curriculum)
+        store.put(input, configs, curriculum)
+        get_topic_index().add([(input, configs)])
         return curriculum.replace("$$$", "")
 
 
-def image_generator(extract_prompt, module_content):
+def image_generator(llm, extract_prompt, module_content, request_limiter=None):
     """
     The image_generator function takes in a prompt and module content, extracts the key content from the module using an extract_prompt, then generates an image that represents the key content.
     
+    :param llm: The language model used to extract the key content
     :param extract_prompt: Extract the key content from the module_content parameter
     :param module_content: Pass the content of the module to be used as a prompt for generating an image
-    :return: image url
+    :param request_limiter: Object with an acquire() function, called right before the image request is sent
+    :return: The image id in the ImageStore
     :doc-author: Yusuf
     """
     extract_chain = LLMChain(
-        llm=st.session_state["llm"],
+        llm=llm,
         prompt=extract_prompt,
-        verbose=True,
+        verbose=settings.VERBOSE,
         output_key="key_content",
     )
     key_content = extract_chain.run({"module_content": module_content})
+    return key_content_image(key_content, request_limiter)
 
+
+def key_content_image(key_content, request_limiter=None):
+    """
+    The key_content_image function generates an image that represents the key content of a module.
+    The image is transcoded to WebP at display resolution and kept in the ImageStore. An image that was generated
+    for the same key content before is reused without calling the image model.
+
+    :param key_content: The key content of the module
+    :param request_limiter: Object with an acquire() function, called right before the image request is sent
+    :return: The image id in the ImageStore
+    :doc-author: Yusuf
+    """
+    store = get_image_store()
+    image_id = store.lookup(key_content)
+    if image_id is not None:
+        get_tracer().count("image_cache_hits")
+        return image_id
+
+    if request_limiter is not None:
+        request_limiter.acquire()
     extra_prompt = f"Generate an image that represents the following content , Ensure that the text stands out with sufficient contrast and avoid complex backgrounds that could detract from the text's readability.: {key_content}"
-    image_url = openai.Image.create(
-        model="dall-e-3",
-        prompt=extra_prompt,
-        size="1024x1024",
-        quality="standard",
-        n=1,
-        response_format="url",
+    with get_tracer().span("generate_image", "image", prompt_chars=len(extra_prompt)):
+        data = get_image_model().generate_image(
+            extra_prompt, size="1024x1024", quality="standard"
+        )
+    image_id = store.put(
+        transcode_image(data, settings.IMAGE_DISPLAY_PX, settings.IMAGE_WEBP_QUALITY)
     )
+    store.remember(key_content, image_id)
+    return image_id
 
-    return image_url
+
+def teach_module(llm, module_prompt, module, extra_config, callbacks=None):
+    """
+    The teach_module function generates the content of a module.
+
+    :param llm: The language model
+    :param module_prompt: The prompt used to teach the module
+    :param module: Curriculum text of the module
+    :param extra_config: Extra information that needs to be added to the module in speech
+    :param callbacks: Callbacks of the chain run, e.g. for streaming
+    :return: The module content
+    :doc-author: Yusuf
+    """
+    teach_chain = LLMChain(
+        llm=llm,
+        prompt=module_prompt,
+        verbose=settings.VERBOSE,
+    )
+    return teach_chain.run(
+        {"module": module, "extra_config": extra_config}, callbacks=callbacks
+    )
+
+
+def create_flashcards(llm, flashcard_prompt, module_content):
+    """
+    The create_flashcards function generates the flashcards of a module.
+
+    :param llm: The language model
+    :param flashcard_prompt: The prompt used to create flashcards
+    :param module_content: The generated module content
+    :return: Flashcards separated by '####'
+    :doc-author: Yusuf
+    """
+    flashcard_chain = LLMChain(
+        llm=llm,
+        prompt=flashcard_prompt,
+        verbose=settings.VERBOSE,
+    )
+    return flashcard_chain.run({"module_content": module_content})
+
+
+def create_quiz(llm, evaluation_prompt, module_content):
+    """
+    The create_quiz function generates a quiz without touching the conversation memory.
+    The rendered prompt is the same as the one of the evaluation chain, so its result is a response cache hit for quiz_generator.
+
+    :param llm: The language model
+    :param evaluation_prompt: The prompt of the evaluation chain
+    :param module_content: The generated module content
+    :return: The raw quiz string
+    :doc-author: Yusuf
+    """
+    quiz_chain = LLMChain(
+        llm=llm,
+        prompt=evaluation_prompt,
+        verbose=settings.VERBOSE,
+    )
+    return quiz_chain.run({"module_content": module_content})
+
+
+def create_bundle(llm, bundle_prompt, module, extra_config, callbacks=None):
+    """
+    The create_bundle function generates module content, flashcards, quiz and image key content of a module in one call.
+    The answer is constrained to JSON with the response_format of TEACHER_BUNDLE and validated by bundle.parse_bundle.
+
+    :param llm: The language model
+    :param bundle_prompt: The bundle prompt
+    :param module: Curriculum text of the module
+    :param extra_config: Extra information that needs to be added to the module in speech
+    :param callbacks: Callbacks of the chain run
+    :return: The raw bundle string
+    :doc-author: Yusuf
+    """
+    bundle_chain = LLMChain(
+        llm=llm,
+        prompt=bundle_prompt,
+        verbose=settings.VERBOSE,
+        llm_kwargs={"response_format": response_format()},
+    )
+    return bundle_chain.run(
+        {"module": module, "extra_config": extra_config}, callbacks=callbacks
+    )
+
+
+def schedule_prefetch(module_index, chains):
+    """
+    The schedule_prefetch function asks the PrefetchScheduler to generate module content, flashcards and quiz
+    of the given module in the background, if prefetching is enabled and the module exists.
+
+    :param module_index: Index of the module in the curriculum
+    :param chains: The ChainSet of the session
+    :doc-author: Yusuf
+    """
+    prefetcher = get_prefetcher()
+    curriculum = st.session_state.get("curriculum")
+    if prefetcher is None or not curriculum or module_index >= len(curriculum):
+        return
+    # Prompts are captured now, the worker threads must not read session state
+    llm = st.session_state["llm"]
+    module_prompt = chains.module_prompt
+    flashcard_prompt = chains.flashcard_prompt
+    evaluation_prompt = chains.evaluation_chain.prompt
+    if settings.BUNDLE_MODE != "off":
+        # One call produces everything, the flashcard and quiz stages have nothing left to do
+        bundle_prompt = chains.bundle_prompt
+        stages = (
+            lambda module: create_bundle(llm, bundle_prompt, module, ""),
+            lambda content: "",
+            lambda content: "",
+        )
+    else:
+        stages = (
+            lambda module: teach_module(llm, module_prompt, module, ""),
+            lambda content: create_flashcards(llm, flashcard_prompt, content),
+            lambda content: create_quiz(llm, evaluation_prompt, content),
+        )
+    prefetcher.schedule(
+        current_session_id(), module_index, curriculum[module_index], stages
+    )
+
+
+def cancel_prefetch():
+    """
+    The cancel_prefetch function drops the prefetches of the current session, e.g. when the topic or config changes.
+
+    :doc-author: Yusuf
+    """
+    prefetcher = get_prefetcher()
+    if prefetcher is not None:
+        prefetcher.cancel(current_session_id())
+
+
+def library_get(module_index, kind):
+    """
+    The library_get function looks up a part of a module of the current curriculum in the shared library.
+    Modules that were generated with extra wishes of the user, or after a config change, are not shared.
+
+    :param module_index: Index of the module in the curriculum
+    :param kind: "module" for the content, "flashcard" or "quiz"
+    :return: The text, or None if it is not in the library
+    :doc-author: Yusuf
+    """
+    key = st.session_state.get("library_key")
+    if (
+        key is None
+        or key[1] != list(st.session_state["configs"])
+        or module_index in st.session_state.get("custom_modules", ())
+    ):
+        return None
+    return get_curriculum_store().get_module(key[0], key[1], module_index, kind)
+
+
+def library_put(module_index, kind, content):
+    """
+    The library_put function shares a generated part of a module of the current curriculum in the library.
+
+    :param module_index: Index of the module in the curriculum
+    :param kind: "module" for the content, "flashcard" or "quiz"
+    :param content: The text as generated by its chain
+    :doc-author: Yusuf
+    """
+    key = st.session_state.get("library_key")
+    if (
+        key is None
+        or key[1] != list(st.session_state["configs"])
+        or module_index in st.session_state.get("custom_modules", ())
+    ):
+        return
+    get_curriculum_store().put_module(key[0], key[1], module_index, kind, content)
+
+
+def parse_module_input(input):
+    """
+    The parse_module_input function splits the input of the module_content tool into the module number and the extra information.
+
+    :param input: Input in this format 'Module X##Extra information'
+    :return: A tuple of the module number (starting from 1) and the extra information
+    :doc-author: Yusuf
+    """
+    module_number, extra_config = input.split("##", 1)
+    module_number = int(module_number.replace("Module", "").strip())
+    return module_number, extra_config
 
 
 def learn_module(
-    input, curriculum, module_prompt, flashcard_prompt, user_config, extract_prompt
+    input,
+    curriculum,
+    module_prompt,
+    flashcard_prompt,
+    user_config,
+    extract_prompt,
+    bundle_prompt=None,
 ):
     """
     The learn_module function is used to geneate content for given module. It generates content and flashcards for the module. Then, it generates an image if the user configuration contains "Image-Containing".
-    It stores flashcards and module content in session state and returns the output of the teach_chain.run function.
+    It stores module content in session state and returns the output of the teach_chain.run function as soon as it is ready.
+    Flashcards and image are generated on the ModulePipeline and put into session state by collect_module_stages on a later rerun.
+    Modules without extra wishes are served from and shared in the library (see library_get).
+    In bundle mode (TEACHER_BUNDLE) content, flashcards, quiz and image key content come from one call: flashcards are stored at once,
+    the quiz is kept for quiz_generator and only the image is left to the ModulePipeline. A bundle that fails validation falls back to the separate calls.
     It takes in the following arguments:
     - input: The user's input, which should be of the form Module X##Extra information that needs to be added to the module in speech if exists where X is an integer representing a module number.
     - curriculum: A list of modules, each containing a title and content (a string). This function will use this list as its source for learning modules.
@@ -117,88 +369,184 @@ def learn_module(
     :param flashcard_prompt: Generate flashcards for the module
     :param user_config: Determine if the user wants to generate an image or not
     :param extract_prompt: Extract the image from the module content
+    :param bundle_prompt: The bundle prompt, used if TEACHER_BUNDLE is on
     :return: The output of the teach_chain.run function, with Image generated prepended to it if the user_config contains "Image-Containing"
     :doc-author: Yusuf
     """
     if "##" not in input:
         return "Input need to have in this format 'IntegerNumber##Extra information that needs to be added to the module in speech if exists' Where IntegerNumber refers Module Number"
-    module_number, extra_config = input.split("##")
-    module_number = module_number.replace("Module", "").strip()
-    if type(module_number) == str:
-        module_number = int(module_number)
+    module_number, extra_config = parse_module_input(input)
     module = curriculum[module_number - 1]
 
-    teach_chain = LLMChain(
-        llm=st.session_state["llm"],
-        prompt=module_prompt,
-        verbose=True,
-    )
-
     if st.session_state.get("module_contents", None) is None:
         st.session_state["module_contents"] = [None] * len(curriculum)
 
-    print("INFO: teach_chain.run")
-    output = teach_chain.run({"module": module, "extra_config": extra_config})
-    print("INFO: teach_chain.run done")
+    index = module_number - 1
+    custom_modules = st.session_state.setdefault("custom_modules", set())
+    if extra_config.strip():
+        custom_modules.add(index)
+    else:
+        custom_modules.discard(index)
+    mark_changed("custom_modules")
+
+    started = time.perf_counter()
+    bundle = None
+    output = library_get(index, "module")
+    flashcards = library_get(index, "flashcard") if output is not None else None
+    if output is not None:
+        log_info(f"load module {module_number} from the library")
+    elif settings.BUNDLE_MODE != "off" and bundle_prompt is not None:
+        log_info("bundle_chain.run")
+        try:
+            bundle = parse_bundle(
+                module_number,
+                create_bundle(st.session_state["llm"], bundle_prompt, module, extra_config),
+            )
+        except BundleError as e:
+            get_tracer().count("bundle_rejected")
+            log_info(f"bundle of module {module_number} rejected, generating it step by step: {e}")
+    if output is not None:
+        pass
+    elif bundle is not None:
+        output = bundle.module_content
+        library_put(index, "module", output)
+        library_put(index, "flashcard", " #### ".join(bundle.flashcards))
+        library_put(index, "quiz", format_quiz(bundle.quiz))
+    else:
+        log_info("teach_chain.run")
+        output = teach_module(
+            st.session_state["llm"],
+            module_prompt,
+            module,
+            extra_config,
+            callbacks=stream_callbacks(),
+        )
+        log_info("teach_chain.run done")
+        library_put(index, "module", output)
     st.session_state["module_contents"][module_number - 1] = output
+    mark_changed("module_contents")
+    record_stage_metric(
+        StageResult("module", module_number - 1, duration=time.perf_counter() - started)
+    )
 
-    def run_flashcard_chain():
-        """
-        The run_flashcard_chain function generates flashcards for the module.
-        :doc-author: Yusuf
-        """
-        flashcard_chain = LLMChain(
-            llm=st.session_state["llm"],
-            prompt=flashcard_prompt,
-            verbose=True,
-        )
-        if st.session_state.get("flashcard", None) is None:
-            st.session_state["flashcard"] = [None] * len(curriculum)
-        print("INFO: flashcard_chain.run")
-        st.session_state["flashcard"][module_number - 1] = flashcard_chain.run(
-            {"module_content": output}
-        )
-        print(
-            f"INFO: flashcard_chain.run done Content: {st.session_state['flashcard'][module_number - 1]}"
+    # Flashcards and image are generated in the background and shown on a later rerun
+    pipeline = get_pipeline()
+    session_id = current_session_id()
+    curriculum_id = st.session_state.get("curriculum_id")
+    llm = st.session_state["llm"]
+    for key in ("flashcard", "image_ids"):
+        if st.session_state.get(key, None) is None:
+            st.session_state[key] = [None] * len(curriculum)
+    if bundle is not None:
+        st.session_state["flashcard"][module_number - 1] = " #### ".join(bundle.flashcards)
+        st.session_state.setdefault("prepared_quizzes", {})[module_number] = bundle.quiz
+        mark_changed("flashcard", "prepared_quizzes")
+    elif flashcards is not None:
+        st.session_state["flashcard"][index] = flashcards
+        mark_changed("flashcard")
+    else:
+        pipeline.submit(
+            session_id,
+            "flashcard",
+            module_number - 1,
+            create_flashcards,
+            llm,
+            flashcard_prompt,
+            output,
+            curriculum_id=curriculum_id,
         )
-
-    def generate_image():
-        """
-        The generate_image function is called when the user selects "Image-Containing" in their configuration.
-        It calls image_generator, which takes in a prompt and an output, and returns a url to an image.
-        The generate_image function then stores this url in session state so that it can be displayed later.
-        
-        :return: The image url, which is then displayed in the streamlit app
-        :doc-author: Trelent
-        """
-        if st.session_state.get("image_url", None) is None:
-            st.session_state["image_url"] = [None] * len(curriculum)
-        image_url = image_generator(extract_prompt, output)
-        print("INFO: image_generator done")
-        st.session_state["image_url"][module_number - 1] = image_url.data[
-            0
-        ].url  # Fixed indexing issue
-        st.session_state["last_module_number"] = module_number - 1
-        print(f"INFO: url is: {st.session_state['image_url'][module_number - 1]}")
-
-    flashcard_thread = threading.Thread(target=run_flashcard_chain)
-    add_script_run_ctx(flashcard_thread)
-    flashcard_thread.start()
-    image_thread = None
     if "Image-Containing" in user_config:
-        image_thread = threading.Thread(target=generate_image)
-        add_script_run_ctx(image_thread)
-        image_thread.start()
+        st.session_state["last_module_number"] = module_number - 1
+        # The chat message of this module gets the image (or the failure) of this stage, see collect_module_stages
+        image_key = uuid.uuid4().hex
+        st.session_state["last_image_key"] = image_key
+        if bundle is not None:
+            pipeline.submit(
+                session_id,
+                "image",
+                module_number - 1,
+                key_content_image,
+                bundle.key_content,
+                key=image_key,
+                curriculum_id=curriculum_id,
+            )
+        else:
+            pipeline.submit(
+                session_id,
+                "image",
+                module_number - 1,
+                image_generator,
+                llm,
+                extract_prompt,
+                output,
+                key=image_key,
+                curriculum_id=curriculum_id,
+            )
         output = "Image generated " + output
 
-    # Wait for threads to complete
-    flashcard_thread.join()
-    if "Image-Containing" in user_config:
-        image_thread.join()
-
     return output
 
 
+def record_stage_metric(result):
+    """
+    The record_stage_metric function keeps the timing of a pipeline stage in session state,
+    the latest SESSION_METRICS_ITEMS of them.
+
+    :param result: The StageResult of the stage
+    :doc-author: Yusuf
+    """
+    metric = result.as_metric()
+    st.session_state.setdefault(
+        "stage_metrics", deque(maxlen=settings.SESSION_METRICS_ITEMS)
+    ).append(metric)
+    log_info(f"stage metric: {metric}")
+
+
+def attach_image(result):
+    """
+    The attach_image function puts the image id of a finished image stage, or its failure, into the chat message
+    the stage was started for, so the message keeps its own image whatever the module shows later.
+
+    :param result: The StageResult of the image stage
+    :doc-author: Yusuf
+    """
+    for message in reversed(st.session_state.get("messages", [])):
+        if message.get("image_key") == result.key:
+            if result.error is None:
+                message["image_id"] = result.value
+            else:
+                message["image_error"] = repr(result.error)
+            mark_changed("messages")
+            return
+
+
+def collect_module_stages():
+    """
+    The collect_module_stages function puts the flashcards and images that were generated in the background
+    since the last rerun into session state. Failed stages are recorded but leave the other stages untouched.
+    Results of a curriculum that was replaced in the meantime only reach the chat message they were started for.
+
+    :doc-author: Yusuf
+    """
+    curriculum_id = st.session_state.get("curriculum_id")
+    for result in get_pipeline().collect(current_session_id()):
+        record_stage_metric(result)
+        if result.stage == "image":
+            attach_image(result)
+        if result.error is not None:
+            continue
+        if result.curriculum_id != curriculum_id:
+            log_info(f"{result.stage} of module {result.module_index + 1} dropped, its curriculum was replaced")
+            continue
+        if result.stage == "flashcard":
+            st.session_state["flashcard"][result.module_index] = result.value
+            mark_changed("flashcard")
+            library_put(result.module_index, "flashcard", result.value)
+        elif result.stage == "image":
+            st.session_state["image_ids"][result.module_index] = result.value
+            mark_changed("image_ids")
+
+
 def chat(input):
     """
     The chat function takes in a string and returns it without any modifications since we are only using it to chat with the user.
@@ -215,98 +563,61 @@ def quiz_generator(input, evaluation_chain):
     """
     The quiz_generator function takes in a module number and an evaluation chain.
     It then uses the evaluation chain to generate a quiz based on the content of that module.
+    The quiz is parsed once and kept in the quiz index of session state under its make_quiz_id id.
+    A quiz that came with the module bundle is used once instead of running the evaluation chain,
+    and quizzes of shared modules are served from and shared in the library.
     
     :param input: Pass in the module number that is selected by the user
     :param evaluation_chain: Run the evaluation chain
-    :return: A string
+    :return: A string with the quiz id on its first line
     :doc-author: Yusuf
     """
-    if type(input) == str:
-        module_number = int(input)
+    module_number = int(input)
 
     if st.session_state.get("module_contents", None) is None:
         content = st.session_state["curriculum"][module_number - 1]
     else:
         content = st.session_state["module_contents"][module_number - 1]
 
-    test_quiz = evaluation_chain.run({"module_content": content})
-    print(f"INFO: quiz_generator done Content: {test_quiz}")
-    return "Quiz generated " + test_quiz
+    quiz_id = make_quiz_id(st.session_state.get("curriculum_id"), module_number)
+    quiz = st.session_state.get("prepared_quizzes", {}).pop(module_number, None)
+    if quiz is not None:
+        test_quiz = format_quiz(quiz)
+        quiz = Quiz(quiz_id, module_number, quiz.questions)
+        log_info("quiz_generator: quiz of the module bundle")
+    else:
+        test_quiz = library_get(module_number - 1, "quiz")
+        if test_quiz is None:
+            test_quiz = evaluation_chain.run({"module_content": content})
+            library_put(module_number - 1, "quiz", test_quiz)
+        quiz = parse_quiz(quiz_id, module_number, test_quiz)
+    log_info(f"quiz_generator done Content: {test_quiz}")
+    st.session_state.setdefault("quizzes", {})[quiz_id] = quiz
+    mark_changed("quizzes", "prepared_quizzes")
+    return f"Quiz generated {quiz_id}\n{test_quiz}"
 
 
 def calculate_score(return_string=False):
     """
-    The calculate_score function is used to calculate the user's score for each module and overall.
-    It returns a list of dictionaries containing the following keys:
+    The calculate_score function returns the user's score for each module and overall.
+    Scores come from the ScoreBoard that display_quiz updates on every submission, and module titles from the
+    module tree of the curriculum, so nothing is recounted. The text and the chart data are two views of the same scores.
+    As dictionaries, every module has the following keys:
         - correct_answer_count: The number of questions in this module that were answered correctly by the user.
         - total_questions: The total number of questions in this module.
         - module_title: The title of this particular quiz/module.
-    
+
     :param return_string: Return the results as a string or as a dictionary
-    :return: A tuple of two elements
+    :return: A tuple of the score text and the wrong answers, or of the module scores and the total; (None, None) without quiz results
     :doc-author: Yusuf
     """
-    results = st.session_state.get("quiz_results")
-    if results is None:
+    if st.session_state.get("quiz_results") is None:
         return None, None
-    else:
-        total_questions = 0
-        total_correct_answers = 0
-        if return_string:
-            scores, user_wrong_content = "", ""
-            for c in range(len(st.session_state.get("curriculum"))):
-                if results.get(f"quiz_{c + 1}") is not None:
-                    module_markdown = st.session_state["curriculum"][c]
-                    module_parts = module_markdown.split("##")
-                    module_title = (
-                        ":".join(module_parts[0].split(":")[:2])
-                        .replace("#", "")
-                        .strip()
-                    )
-
-                    correct_answer_count = len(
-                        [r for r in results[f"quiz_{c + 1}"] if r["is_correct"]]
-                    )
-                    total_questions += len(results[f"quiz_{c + 1}"])
-                    if correct_answer_count != len(results[f"quiz_{c + 1}"]):
-
-                        user_wrong_content += f"{module_title}"
-                        for r in results[f"quiz_{c + 1}"]:
-                            if not r["is_correct"]:
-                                user_wrong_content += f"\nQuestion: {r['question']}\nUser Answer: {r['user_answer']}\nCorrect Answer: {r['correct_answer']}\n"
-
-                    scores += f"Module {module_title}: User correct answer accuracy {correct_answer_count}/{len(results[f'quiz_{c + 1}'])}\n"
-                    total_correct_answers += correct_answer_count
-            scores += f"\n\nTotal All modules user correct answer accuracy: {total_correct_answers}/{total_questions}"
-            return scores, user_wrong_content
-        else:
-            scores = [None] * len(st.session_state.get("curriculum"))
-            for c in range(len(st.session_state.get("curriculum"))):
-                if results.get(f"quiz_{c + 1}") is not None:
-                    module_markdown = st.session_state["curriculum"][c]
-                    module_parts = module_markdown.split("##")
-                    module_title = (
-                        ":".join(module_parts[0].split(":")[:2])
-                        .replace("#", "")
-                        .strip()
-                    )
-
-                    correct_answer_count = len(
-                        [r for r in results[f"quiz_{c + 1}"] if r["is_correct"]]
-                    )
-                    total_questions += len(results[f"quiz_{c + 1}"])
-                    scores[c] = {
-                        "correct_answer_count": correct_answer_count,
-                        "total_questions": len(results[f"quiz_{c + 1}"]),
-                        "module_title": module_title,
-                    }
-                    total_correct_answers += correct_answer_count
-
-            total = {
-                "correct_answer_count": total_correct_answers,
-                "total_questions": total_questions,
-            }
-            return scores, total
+    board = get_scoreboard()
+    titles = get_module_titles()
+    if return_string:
+        return board.report(titles)
+    return board.chart_data(titles)
 
 
 def analyze(_, analysis_module_prompt):
@@ -328,76 +639,120 @@ def analyze(_, analysis_module_prompt):
     analysis_chain = LLMChain(
         llm=st.session_state["llm"],
         prompt=analysis_module_prompt,
-        verbose=True,
+        verbose=settings.VERBOSE,
     )
     output = analysis_chain.run(
-        {"statistics": scores, "user_wrong_content": user_wrong_content}
+        {"statistics": scores, "user_wrong_content": user_wrong_content},
+        callbacks=stream_callbacks(),
     )
 
     return "ANALYSIS:" + output.replace("[Your Name]", "")
 
 
-def get_tools():
+def timed_tool(name, func):
+    """
+    The timed_tool function wraps a tool function in a tool span and keeps the duration of the latest
+    SESSION_METRICS_ITEMS calls in session state.
+
+    :param name: Name of the tool
+    :param func: The tool function
+    :return: The wrapped tool function
+    :doc-author: Yusuf
+    """
+
+    def run(input):
+        with get_tracer().span(name, "tool", input_chars=len(input)) as span:
+            output = func(input)
+            span.set(output_chars=len(output))
+        st.session_state.setdefault(
+            "tool_metrics", deque(maxlen=settings.SESSION_METRICS_ITEMS)
+        ).append({"tool": name, "duration": span.duration})
+        return output
+
+    return run
+
+
+def get_tools(chains):
     """
     The get_tools function is used to return a list of Tool objects.
     Each Tool object has the following attributes:
         name (str): The name of the tool, which will be displayed in the UI.
         func (func): A function that takes an input string and returns a string output. This function should be able to handle any user input, but it's recommended that you use tools for specific purposes when possible so users can get more consistent results from your bot!
         description (str): A short description explaining what this tool does and how it works. This will also be displayed in the UI.
-    
+    The tools read chains and prompts from the ChainSet when they are called, so a config change only needs to update the ChainSet.
+
+    :param chains: The ChainSet of the session
     :return: A list of tool objects
     :doc-author: Yusuf
     """
-    (
-        answer_question_chain,
-        generate_curriculum_chain,
-        module_prompt,
-        evaluation_chain,
-        flashcard_prompt,
-        analysis_module_prompt,
-        extract_prompt,
-    ) = get_chains(st.session_state["llm"], st.session_state["memory"])
+
+    def generate_curriculum_tool(input):
+        # A new topic makes the prefetched modules of the old one useless
+        cancel_prefetch()
+        output = generate_curriculum(input, chains.generate_curriculum_chain)
+        schedule_prefetch(0, chains)
+        return output
+
+    def module_content_tool(input):
+        output = learn_module(
+            input,
+            st.session_state["curriculum"],
+            chains.module_prompt,
+            chains.flashcard_prompt,
+            st.session_state["configs"],
+            chains.extract_prompt,
+            chains.bundle_prompt,
+        )
+        # While the user reads module N, module N+1 is generated in the background
+        if "##" in input:
+            module_number, _ = parse_module_input(input)
+            schedule_prefetch(module_number, chains)
+        return output
+
     tools = [
         Tool(
             name="answer_user_question",
-            func=answer_question_chain.run,
+            func=timed_tool(
+                "answer_user_question",
+                lambda input: chains.answer_question_chain.run(
+                    input, callbacks=stream_callbacks()
+                ),
+            ),
             description="Useful when user ask a question about content generated, and you need to generate answer. Never use this tool to switch to next module. Input of this tool is the question that user ask",
             return_direct=True,
         ),
         Tool(
             name="generate_curriculum",
-            func=lambda input: generate_curriculum(input, generate_curriculum_chain),
+            func=timed_tool("generate_curriculum", generate_curriculum_tool),
             description="Useful when the user want to learn how to cook something. Input of this tool is the topic that user want to learn. Wait user message use other tools after run this tool.  ",
             return_direct=True,
         ),
         Tool(
             name="module_content",
-            func=lambda input: learn_module(
-                input,
-                st.session_state["curriculum"],
-                module_prompt,
-                flashcard_prompt,
-                st.session_state["configs"],
-                extract_prompt,
-            ),
+            func=timed_tool("module_content", module_content_tool),
             description="If the user wants to proceed to module and curriculum is generated before, use this tool generate content of the module. Input of this tool in this format 'int##str' where int refers to Module number and str refers that needs to be added to the module in speech if exists otherwise put empty string",
             return_direct=True,
         ),
         Tool(
             name="evaluation",
-            func=lambda input: quiz_generator(input, evaluation_chain),
+            func=timed_tool(
+                "evaluation",
+                lambda input: quiz_generator(input, chains.evaluation_chain),
+            ),
             description="Useful when users need some tests or exercises to test their knowledge. Return directly the output, don't add anything. Input of this tool in this format 'int' where int refers to Module number",
             return_direct=True,
         ),
         Tool(
             name="analyze",
-            func=lambda x: analyze(x, analysis_module_prompt),
+            func=timed_tool(
+                "analyze", lambda x: analyze(x, chains.analysis_module_prompt)
+            ),
             description="Useful when user wants to be analyzed after quizes. Input of this tool is empty.",
             return_direct=True,
         ),
         Tool(
             name="chat",
-            func=chat,
+            func=timed_tool("chat", chat),
             description="Only use this if user input is not suitable for any other tool and you want to chat with user. Input of this tool is the user message.",
             return_direct=True,
         ),
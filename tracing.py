@@ -0,0 +1,407 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+import urllib.request
+import uuid
+from contextvars import ContextVar
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+
+import settings
+from session_store import current_session_id
+from tokens import count_tokens
+
+
+def log_info(message):
+    """
+    The log_info function prints an INFO line unless verbose logging is switched off with TEACHER_VERBOSE=0.
+
+    :param message: The message
+    :doc-author: Yusuf
+    """
+    if settings.VERBOSE:
+        print(f"INFO: {message}")
+
+
+class Span:
+    """
+    The Span class is one timed unit of work (a rerun, an agent run, a tool, chain, LLM or image call).
+    Spans of one user request share a trace id and point to their parent span.
+
+    :doc-author: Yusuf
+    """
+
+    __slots__ = (
+        "name",
+        "kind",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "session_id",
+        "start_time",
+        "duration",
+        "attributes",
+        "error",
+        "_started",
+    )
+
+    def __init__(self, name, kind, parent=None, **attributes):
+        self.name = name
+        self.kind = kind
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.session_id = current_session_id()
+        self.start_time = time.time()
+        self.duration = None
+        self.attributes = attributes
+        self.error = None
+        self._started = time.perf_counter()
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, name, amount=1):
+        self.attributes[name] = self.attributes.get(name, 0) + amount
+
+    def finish(self, error=None):
+        self.duration = time.perf_counter() - self._started
+        if error is not None:
+            self.error = repr(error)
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "session_id": self.session_id,
+            "start_time": self.start_time,
+            "duration": self.duration,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class JsonlSpanExporter:
+    """
+    The JsonlSpanExporter class appends finished spans to a local JSON-lines file.
+
+    :doc-author: Yusuf
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def export(self, spans):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(span.as_dict(), default=str) + "\n")
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OtlpSpanExporter:
+    """
+    The OtlpSpanExporter class posts finished spans as OTLP/HTTP JSON to an OpenTelemetry collector,
+    e.g. the stand-in in benchmarks/trace_collector.py.
+
+    :doc-author: Yusuf
+    """
+
+    def __init__(self, endpoint, timeout=5):
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    def _span(self, span):
+        attributes = dict(span.attributes, **{"session.id": span.session_id, "span.kind": span.kind})
+        start = int(span.start_time * 1e9)
+        otlp_span = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": str(start),
+            "endTimeUnixNano": str(start + int(span.duration * 1e9)),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in attributes.items()
+            ],
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+        }
+        if span.parent_id:
+            otlp_span["parentSpanId"] = span.parent_id
+        return otlp_span
+
+    def export(self, spans):
+        payload = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {"key": "service.name", "value": {"stringValue": "the-chef"}}
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "tracing"},
+                            "spans": [self._span(span) for span in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        urllib.request.urlopen(request, timeout=self.timeout).close()
+
+
+class Tracer:
+    """
+    The Tracer class creates spans and keeps the open spans of every thread on a stack, so new spans find their parent.
+    Finished spans are handed to a background thread that exports them in batches, so a request never waits for the exporter.
+    Without an exporter spans are still measured (e.g. for tool metrics) but not kept.
+
+    :doc-author: Yusuf
+    """
+
+    def __init__(self, exporter=None, flush_interval=2.0, max_queue=10000):
+        self.exporter = exporter
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._local = threading.local()
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def current_span(self):
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    def start_span(self, name, kind, parent=None, root=False, **attributes):
+        """
+        The start_span function opens a span and makes it the current span of the thread.
+
+        :param name: Name of the span, e.g. the tool name
+        :param kind: Kind of the span: rerun, agent, tool, chain, llm, image, stage or prefetch
+        :param parent: Parent span, by default the current span of the thread
+        :param root: Start a new trace and forget the spans left open by an interrupted rerun
+        :param attributes: Attributes of the span
+        :return: The Span object
+        :doc-author: Yusuf
+        """
+        stack = self._stack()
+        if root:
+            stack.clear()
+        elif parent is None:
+            parent = stack[-1] if stack else None
+        span = Span(name, kind, parent, **attributes)
+        stack.append(span)
+        return span
+
+    def end_span(self, span, error=None):
+        """
+        The end_span function closes a span and queues it for export.
+
+        :param span: The Span object
+        :param error: The exception that ended the span, if any
+        :doc-author: Yusuf
+        """
+        span.finish(error)
+        stack = self._stack()
+        if span in stack:
+            stack.remove(span)
+        if self.exporter is None:
+            return
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def span(self, name, kind, parent=None, **attributes):
+        return _SpanContext(self, name, kind, parent, attributes)
+
+    def annotate(self, **attributes):
+        span = self.current_span()
+        if span is not None:
+            span.set(**attributes)
+
+    def count(self, name, amount=1):
+        span = self.current_span()
+        if span is not None:
+            span.add(name, amount)
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._export_loop, name="trace-exporter", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _drain(self):
+        spans = []
+        while True:
+            try:
+                spans.append(self._queue.get_nowait())
+            except queue.Empty:
+                return spans
+
+    def _export(self, spans):
+        if not spans:
+            return
+        try:
+            self.exporter.export(spans)
+        except Exception as e:
+            self.dropped += len(spans)
+            log_info(f"span export failed: {e}")
+
+    def _export_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self._export(self._drain())
+
+    def flush(self):
+        """
+        The flush function exports the queued spans right away, it is called when the process exits.
+
+        :doc-author: Yusuf
+        """
+        if self.exporter is not None:
+            self._export(self._drain())
+
+
+class _SpanContext:
+    def __init__(self, tracer, name, kind, parent, attributes):
+        self.tracer = tracer
+        self.args = (name, kind, parent)
+        self.attributes = attributes
+        self.span = None
+
+    def __enter__(self):
+        self.span = self.tracer.start_span(*self.args, **self.attributes)
+        return self.span
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.tracer.end_span(self.span, exc)
+
+
+def _message_text(messages):
+    return "\n".join(str(message.content) for batch in messages for message in batch)
+
+
+class TraceCallbackHandler(BaseCallbackHandler):
+    """
+    The TraceCallbackHandler class turns LangChain chain and LLM runs into spans.
+    LLM spans carry the prompt size, the token counts and the response cache hits and misses of the call.
+
+    :doc-author: Yusuf
+    """
+
+    def __init__(self, tracer):
+        self.tracer = tracer
+        self._spans = {}
+
+    def _start(self, run_id, parent_run_id, name, kind, **attributes):
+        parent = self._spans.get(parent_run_id)
+        self._spans[run_id] = self.tracer.start_span(name, kind, parent, **attributes)
+
+    def _end(self, run_id, error=None, **attributes):
+        span = self._spans.pop(run_id, None)
+        if span is not None:
+            span.set(**attributes)
+            self.tracer.end_span(span, error)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        name = ((serialized or {}).get("id") or ["chain"])[-1]
+        self._start(run_id, parent_run_id, name, "chain")
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def _start_llm(self, serialized, text, run_id, parent_run_id):
+        name = ((serialized or {}).get("id") or ["llm"])[-1]
+        self._start(
+            run_id,
+            parent_run_id,
+            name,
+            "llm",
+            prompt_chars=len(text),
+            prompt_tokens=count_tokens(text),
+        )
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._start_llm(serialized, "\n".join(prompts), run_id, parent_run_id)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self._start_llm(serialized, _message_text(messages), run_id, parent_run_id)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        completion_tokens = usage.get("completion_tokens")
+        if completion_tokens is None:
+            completion_tokens = sum(
+                count_tokens(generation.text)
+                for generations in response.generations
+                for generation in generations
+            )
+        self._end(run_id, completion_tokens=completion_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+
+def _create_exporter():
+    if settings.TRACE_EXPORTER == "jsonl":
+        return JsonlSpanExporter(settings.TRACE_FILE)
+    if settings.TRACE_EXPORTER == "otlp":
+        return OtlpSpanExporter(settings.TRACE_OTLP_ENDPOINT)
+    return None
+
+
+_tracer = Tracer(_create_exporter(), settings.TRACE_FLUSH_SECONDS)
+
+# The default value makes LangChain add the handler to every callback manager in every thread
+_trace_callback_var = ContextVar(
+    "trace_callback", default=TraceCallbackHandler(_tracer)
+)
+if _tracer.exporter is not None:
+    register_configure_hook(_trace_callback_var, inheritable=True)
+
+
+def get_tracer():
+    """
+    The get_tracer function returns the process-wide Tracer.
+
+    :return: The Tracer object
+    :doc-author: Yusuf
+    """
+    return _tracer
@@ -1,12 +1,20 @@
+import io
 import os
 import textwrap
+import time
+import uuid
 
-import matplotlib.pyplot as plt
-import openai
 import streamlit as st
-from dotenv import find_dotenv, load_dotenv
-from langchain.chat_models import ChatOpenAI
-from langchain.memory import ConversationSummaryBufferMemory, ReadOnlySharedMemory
+
+import settings
+from history import get_payloads, message_payload_ids, offload_payloads, resident_payload_ids
+from image_store import get_image_store
+from prompts import build_config_prompt
+from scores import get_scoreboard
+from session_store import current_session_id, get_session_store, mark_changed
+from state_store import decode_value, encode_value, get_state_backend
+from tracing import log_info
+from warmup import wait_warmup
 
 wrapper = textwrap.TextWrapper(width=25)
 
@@ -33,6 +41,10 @@ def initialize_ui():
     .top-bar:hover .config-option {
         display: block; /* Show config on hover */
     }
+    /* Rounded module images */
+    [data-testid="stImage"] img {
+        border-radius: 15px;
+    }
     /* Other styles */
     </style>
     """
@@ -44,67 +56,226 @@ def initialize_ui():
 def initialize_llm():
     """
     The initialize_llm function is called by the main function to initialize the
-       OpenAI GPT-4 language model, a ConversationSummaryBufferMemory object, and a
-       ReadOnlySharedMemory object to use for the project.
+       language model of the configured backend (OpenAI GPT-4 or the offline fake). The model client is shared by every session of the server process.
+       It also installs the response cache, so every chain of the app is cached from here on.
+       LangChain is imported here and not with this module, so a first page load is painted without it.
 
-    :return: A tuple of three objects
+    :return: The language model
     :doc-author: Yusuf
     """
-    print("INFO: initialize_llm")
-    _ = load_dotenv(find_dotenv())  # read local .env file
-    openai.api_key = os.environ["OPENAI_API_KEY"]
-    llm = ChatOpenAI(model_name="gpt-4-1106-preview", temperature=0, verbose=True)
-    memory = ConversationSummaryBufferMemory(llm=llm, memory_key="chat_history")
-    readonlymemory = ReadOnlySharedMemory(memory=memory, memory_key="chat_history")
-    print("INFO: initialize_llm done")
-    return llm, memory, readonlymemory
+    wait_warmup("agent")
+    from backends import get_chat_model
+    from cache import install_response_cache
+
+    log_info("initialize_llm")
+    install_response_cache()
+    # With the openai backend every model call goes through the pooled, rate-limited ModelGateway
+    llm = get_chat_model(
+        model_name="gpt-4-1106-preview",
+        temperature=0,
+        streaming=settings.STREAMING_ENABLED,
+    )
+    log_info("initialize_llm done")
+    return llm
 
 
-def parse_quiz_output(quiz_output):
-    # Split the output into individual questions based on '####'
+def initialize_memory(llm):
     """
-    The parse_quiz_output function takes the output of the quiz and parses it into a list of tuples.
-    Each tuple contains:
-        - The question text (string)
-        - A list of options (list)
-        - The answer to the question (string)
-        - An explanation for why that's correct/incorrect
-
-    :param quiz_output: Pass the quiz output to the function
-    :return: A list of tuples, where each tuple contains the following:
+    The initialize_memory function returns the BackgroundSummaryMemory object and the
+       ReadOnlySharedMemory object of the current browser session.
+       Memories are kept in the bounded SessionStore, so chat histories of different users never mix
+       and memories of idle sessions are released. The conversation is summarized in the background,
+       so saving a message never waits for the model.
+       A conversation that restore_session_state loaded before the memory existed is put into it here.
+
+    :param llm: The language model used to summarize the conversation
+    :return: A tuple of two objects
     :doc-author: Yusuf
     """
-    raw_questions = quiz_output.split("####")
-
-    # Initialize an empty list to hold the parsed questions
-    parsed_questions = []
-
-    # Iterate through the raw questions
-    for raw_question in raw_questions:
-        if raw_question.strip():  # Make sure there's content here to parse
-            # Each question component is on a new line, so we split by lines
-            parts = raw_question.strip().split("\n")
+    wait_warmup("memory")
+    from langchain.memory import ReadOnlySharedMemory
+
+    from memory import BackgroundSummaryMemory
+
+    def create_memory():
+        memory = BackgroundSummaryMemory(
+            llm=llm,
+            memory_key="chat_history",
+            max_token_limit=settings.MEMORY_BUFFER_TOKENS,
+            artifact_chars=settings.MEMORY_ARTIFACT_CHARS,
+            max_artifacts=settings.MEMORY_ARTIFACT_ITEMS,
+        )
+        readonlymemory = ReadOnlySharedMemory(memory=memory, memory_key="chat_history")
+        return memory, readonlymemory
+
+    memory, readonlymemory = get_session_store().get(current_session_id(), "memory", create_memory)
+    state = st.session_state.pop("memory_state", None)
+    if state is not None:
+        memory.load_state(state)
+    return memory, readonlymemory
+
+
+# Session state that is kept in the state backend, so a session can move to another server process
+SESSION_STATE_KEYS = (
+    "messages",
+    "curriculum",
+    "curriculum_id",
+    "module_contents",
+    "flashcard",
+    "image_ids",
+    "quizzes",
+    "quiz_results",
+    "scoreboard",
+    "prepared_quizzes",
+    "library_key",
+    "custom_modules",
+    "configs",
+    "last_config",
+    "config_prompt",
+    "last_module",
+    "last_module_number",
+    "history_expanded",
+    "history_stub_messages",
+)
+
+
+def restore_session_state():
+    """
+    The restore_session_state function loads the artifacts of the session from the state backend on the first run
+    of a Streamlit session. A session is identified by the sid query parameter, so a reloaded page, or a reconnect
+    that a load balancer sends to another server process, continues where the user was.
+    The sid is the only credential of a session: whoever opens a URL with it continues that session,
+    so links that contain it must not be shared.
+    The conversation memory is only created when the agent is first needed, its state waits in "memory_state" until then.
+
+    :return: Number of restored values
+    :doc-author: Yusuf
+    """
+    if "state_id" in st.session_state:
+        return 0
+    started = time.perf_counter()
+    state_id = st.query_params.get("sid")
+    if not state_id:
+        state_id = uuid.uuid4().hex
+        st.query_params["sid"] = state_id
+    st.session_state["state_id"] = state_id
+    # The values as last written, save_session_state writes the ones that were replaced or marked changed since
+    st.session_state["state_saved"] = saved = {}
+    st.session_state["state_changed"] = set()
+    st.session_state["state_payloads"] = saved_payloads = set()
+    st.session_state["state_artifacts"] = saved_artifacts = set()
+    st.session_state["state_saved_at"] = time.time()
+    backend = get_state_backend()
+    names = SESSION_STATE_KEYS + ("memory",)
+    values = backend.get_many([f"session:{state_id}:{name}" for name in names])
+    restored = 0
+    for name in names:
+        data = values.get(f"session:{state_id}:{name}")
+        if data is None:
+            continue
+        restored += 1
+        if name == "memory":
+            st.session_state["memory_state"] = decode_value(data)
+        else:
+            st.session_state[name] = saved[name] = decode_value(data)
+    # Long message texts and memory artifacts are stored once under their hash, the messages and memory reference them.
+    # Texts of messages before the stub window are loaded when they are expanded.
+    payload_ids = resident_payload_ids()
+    memory_state = st.session_state.get("memory_state")
+    artifact_ids = memory_state.pop("artifact_ids", []) if memory_state else []
+    payloads = get_payloads()
+    artifacts = {}
+    for key, data in backend.get_many(
+        [f"payload:{payload_id}" for payload_id in payload_ids]
+        + [f"artifact:{artifact_id}" for artifact_id in artifact_ids]
+    ).items():
+        kind, item_id = key.split(":", 1)
+        if kind == "payload":
+            payloads[item_id] = data
+            saved_payloads.add(item_id)
+        else:
+            artifacts[item_id] = data.decode("utf-8")
+            saved_artifacts.add(item_id)
+    if memory_state:
+        # In the order of the memory, dropped ones are gone
+        memory_state["artifacts"] = {
+            artifact_id: artifacts[artifact_id] for artifact_id in artifact_ids if artifact_id in artifacts
+        }
+    log_info(
+        f"session {state_id}: {restored} values restored in {(time.perf_counter() - started) * 1000:.1f}ms"
+    )
+    return restored
 
-            # Extracting individual components
-            question_text = parts[0].strip('" ').lstrip("- ")
-            options = eval(
-                parts[1].lstrip("- ").strip()
-            )  # Using eval to convert string list to actual list
-            answer = (
-                parts[2].lstrip("- ").strip().replace("Answer: ", "").replace('"', "")
-            )
-            explanation = parts[3].lstrip("- ").strip('" ')
 
-            # Append the parsed question as a tuple to the list
-            parsed_questions.append((question_text, options, answer, explanation))
+def save_session_state():
+    """
+    The save_session_state function writes the artifacts of the session that changed in this run to the state backend.
+    A value changed if it was assigned anew or marked with mark_changed, the other values are not even encoded.
+    The conversation memory is written when its version changed, its artifacts once each, like history payloads.
+    Written payloads of messages before the stub window are then dropped from session state.
 
-    return parsed_questions
+    :return: Number of written values
+    :doc-author: Yusuf
+    """
+    state_id = st.session_state.get("state_id")
+    if state_id is None:
+        return 0
+    saved = st.session_state["state_saved"]
+    changed = st.session_state["state_changed"]
+    saved_payloads = st.session_state["state_payloads"]
+    saved_artifacts = st.session_state["state_artifacts"]
+    ttl = settings.STATE_TTL_SECONDS
+    items = {}
+    # Unchanged values would expire while the session is used, so they are written again now and then
+    if time.time() - st.session_state["state_saved_at"] > ttl / 4:
+        saved.clear()
+        saved_payloads.clear()
+        saved_artifacts.clear()
+        st.session_state["state_saved_at"] = time.time()
+        # Payloads that are only in the state backend are read to be written again
+        payloads = get_payloads()
+        offloaded = [
+            f"payload:{payload_id}"
+            for payload_id in message_payload_ids(st.session_state.get("messages", []))
+            if payload_id not in payloads
+        ]
+        for key, data in get_state_backend().get_many(offloaded).items():
+            items[key] = data
+            saved_payloads.add(key.split(":", 1)[1])
+    for name in SESSION_STATE_KEYS:
+        if name not in st.session_state:
+            continue
+        value = st.session_state[name]
+        if name in changed or name not in saved or saved[name] is not value:
+            items[f"session:{state_id}:{name}"] = encode_value(value)
+            saved[name] = value
+    changed.clear()
+    memory = st.session_state.get("memory")
+    # Without "memory" the agent has not run in this process, a restored conversation is unchanged
+    if memory is not None and saved.get("memory") != (id(memory), memory.version):
+        state = memory.dump_state()
+        artifacts = state.pop("artifacts")
+        state["artifact_ids"] = list(artifacts)
+        items[f"session:{state_id}:memory"] = encode_value(state)
+        saved["memory"] = (id(memory), memory.version)
+        for artifact_id, text in artifacts.items():
+            if artifact_id not in saved_artifacts:
+                items[f"artifact:{artifact_id}"] = text.encode("utf-8")
+                saved_artifacts.add(artifact_id)
+    for payload_id, data in get_payloads().items():
+        if payload_id not in saved_payloads:
+            items[f"payload:{payload_id}"] = data
+            saved_payloads.add(payload_id)
+    if items:
+        get_state_backend().set_many(items, ttl)
+    offload_payloads(saved_payloads)
+    return len(items)
 
 
 def display_quiz(quiz_id):
-    # Retrieve the quiz from messages
     """
     The display_quiz function takes a quiz_id as input and displays the quiz with that id.
+    The quiz is looked up in the quiz index, it was parsed when it was generated.
     The function also stores the user's answers in session state, so that they can be retrieved later.
 
 
@@ -112,40 +283,36 @@ def display_quiz(quiz_id):
     :return: The quiz_results dictionary, which contains the results of each question
     :doc-author: Yusuf
     """
-    quiz = next(
-        (
-            msg
-            for msg in st.session_state.messages
-            if msg.get("id") == quiz_id and msg.get("content_quiz")
-        ),
-        None,
-    )
-    if not quiz:
+    quiz = st.session_state.get("quizzes", {}).get(quiz_id)
+    if quiz is None or not quiz.questions:
         st.error("Quiz not found.")
         return
-    quiz_content = quiz["content_quiz"]
-    quiz_parsed = parse_quiz_output(quiz_content)
+    questions = quiz.questions
 
     # Initialize user_answers if not already present
     if "user_answers" not in st.session_state:
         st.session_state.user_answers = {}
 
     if quiz_id not in st.session_state.user_answers:
-        st.session_state.user_answers[quiz_id] = [None] * len(quiz_parsed)
+        st.session_state.user_answers[quiz_id] = [None] * len(questions)
 
     total_correct = 0
     quiz_results = []
 
-    for idx, (question, options, correct_answer, explanation) in enumerate(quiz_parsed):
-        st.markdown(f"**Q{idx + 1}: {question}**")
+    for idx, question in enumerate(questions):
+        st.markdown(f"**Q{idx + 1}: {question.question}**")
 
         # Use the stored answer as the default, if available
         default_answer = st.session_state.user_answers[quiz_id][idx]
         selected_answer = st.radio(
             f"Select an option for Q{idx + 1}:",
-            options,
+            question.options,
             key=f"{quiz_id}_q_{idx}",
-            index=options.index(default_answer) if default_answer in options else 0,
+            index=(
+                question.options.index(default_answer)
+                if default_answer in question.options
+                else 0
+            ),
         )
 
         # Store the selected answer in session state
@@ -154,25 +321,23 @@ def display_quiz(quiz_id):
     if st.button("Submit Answers", key=f"submit_{quiz_id}"):
         user_answers = st.session_state.user_answers[quiz_id]
         # Display results and store them
-        for idx, (user_answer, correct_answer, explanation) in enumerate(
-            zip(user_answers, [q[2] for q in quiz_parsed], [q[3] for q in quiz_parsed])
-        ):
-            is_correct = user_answer.strip() == correct_answer.strip()
+        for idx, (user_answer, question) in enumerate(zip(user_answers, questions)):
+            is_correct = user_answer.strip() == question.answer.strip()
             if is_correct:
                 total_correct += 1
 
             quiz_results.append(
                 {
-                    "question": quiz_parsed[idx][0],
+                    "question": question.question,
                     "user_answer": user_answer,
-                    "correct_answer": correct_answer,
+                    "correct_answer": question.answer,
                     "is_correct": is_correct,
                 }
             )
 
             color = "#2ECC71" if is_correct else "#E74C3C"
             st.markdown(
-                f"<h4 style='color:{color}'>Q{idx + 1}: Your answer: {user_answer} - Correct answer: {correct_answer} - {explanation}</h4> ",
+                f"<h4 style='color:{color}'>Q{idx + 1}: Your answer: {user_answer} - Correct answer: {question.answer} - {question.explanation}</h4> ",
                 unsafe_allow_html=True,
             )
 
@@ -186,6 +351,8 @@ def display_quiz(quiz_id):
             st.balloons()
 
         st.session_state.quiz_results[quiz_id] = quiz_results
+        get_scoreboard().record(quiz.module_number - 1, quiz_results)
+        mark_changed("quiz_results", "scoreboard")
         st.markdown(f"You got {total_correct} out of {len(user_answers)} correct.")
 
 
@@ -216,21 +383,36 @@ def get_flashcard_color(index):
     return colors[index % len(colors)]
 
 
-def visualize_quiz_results(scores, total):
-    # Check if scores and total are provided
+@st.cache_data(max_entries=settings.SIDEBAR_CACHE_ITEMS, show_spinner=False)
+def flashcards_html(flashcards):
     """
-    The visualize_quiz_results function takes in the scores and total from the quiz results,
-    and displays a bar chart for module-wise quiz results and a pie chart for overall quiz results.
-    
-    
-    :param scores: Pass in the scores of each module
-    :param total: Store the total number of correct answers and total questions
+    The flashcards_html function renders the flashcards of a module into the HTML the sidebar shows, one colored
+    button per card. The result is memoized on the flashcard text, so a module is rendered once per version of
+    its flashcards instead of on every rerun, and the sidebar draws it as a single element.
+
+    :param flashcards: The flashcards of a module, separated by "####"
+    :return: The markdown with the HTML of the flashcard buttons
     :doc-author: Yusuf
     """
-    if scores is None or total is None:
-        st.write("No quiz results to display.")
-        return
+    buttons = [
+        f"<button style='background-color: {get_flashcard_color(card_idx)}; color: white; border: none; padding: 10px 20px; text-align: center; text-decoration: none; display: inline-block; font-size: 16px; margin: 4px 2px; cursor: pointer;'>{card}</button>"
+        for card_idx, card in enumerate(flashcards.split("####"))
+    ]
+    return "\n\n".join(["--- Flashcards ---"] + buttons)
+
 
+@st.cache_data(max_entries=settings.CHART_CACHE_ITEMS, show_spinner=False)
+def render_quiz_chart(scores, total):
+    """
+    The render_quiz_chart function draws the bar chart of the module-wise quiz results and the pie chart of the
+    overall quiz results into PNG bytes. The result is memoized on the content of scores and total, so the
+    analysis messages in history are not drawn again on every rerun, and the figure is closed right after drawing.
+
+    :param scores: The scores of each module
+    :param total: The total number of correct answers and total questions
+    :return: The PNG image as bytes
+    :doc-author: Yusuf
+    """
     # Extracting data for visualization
     modules = []
     correct_counts = []
@@ -245,42 +427,70 @@ def visualize_quiz_results(scores, total):
             correct_counts.append(score["correct_answer_count"])
             total_questions.append(score["total_questions"])
 
+    # pyplot is imported on the first chart only, it is part of the warm-up
+    wait_warmup("matplotlib.pyplot")
+    import matplotlib.pyplot as plt
+
     # Bar chart for module-wise quiz results
     fig, axs = plt.subplots(
         1, 2, figsize=(12, 6)
     )  # Adjusting for two subplots side by side
+    try:
+        # Bar chart on the first subplot
+        axs[0].bar(modules, correct_counts, color="green")
+        axs[0].bar(
+            modules,
+            [total_questions[i] - correct_counts[i] for i in range(len(correct_counts))],
+            bottom=correct_counts,
+            color="red",
+        )
+        axs[0].set_xlabel("Modules")
+        axs[0].set_ylabel("Number of Questions")
+        axs[0].set_title("Quiz Results per Module")
+        axs[0].legend(["Correct Answers", "Wrong Answers"])
+
+        # Pie chart for overall quiz results
+        total_correct = total["correct_answer_count"]
+        total_incorrect = total["total_questions"] - total_correct
+        axs[1].pie(
+            [total_correct, total_incorrect],
+            labels=["Correct Answers", "Wrong Answers"],
+            colors=["green", "red"],
+            autopct="%1.1f%%",
+            startangle=90,
+        )
+        axs[1].set_title("Overall Quiz Results")
 
-    # Bar chart on the first subplot
-    axs[0].bar(modules, correct_counts, color="green")
-    axs[0].bar(
-        modules,
-        [total_questions[i] - correct_counts[i] for i in range(len(correct_counts))],
-        bottom=correct_counts,
-        color="red",
-    )
-    axs[0].set_xlabel("Modules")
-    axs[0].set_ylabel("Number of Questions")
-    axs[0].set_title("Quiz Results per Module")
-    axs[0].legend(["Correct Answers", "Wrong Answers"])
-
-    # Pie chart for overall quiz results
-    total_correct = total["correct_answer_count"]
-    total_incorrect = total["total_questions"] - total_correct
-    axs[1].pie(
-        [total_correct, total_incorrect],
-        labels=["Correct Answers", "Wrong Answers"],
-        colors=["green", "red"],
-        autopct="%1.1f%%",
-        startangle=90,
-    )
-    axs[1].set_title("Overall Quiz Results")
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format="png", bbox_inches="tight")
+        return buffer.getvalue()
+    finally:
+        # pyplot keeps every figure alive until it is closed
+        plt.close(fig)
+
+
+def visualize_quiz_results(scores, total):
+    # Check if scores and total are provided
+    """
+    The visualize_quiz_results function takes in the scores and total from the quiz results,
+    and displays a bar chart for module-wise quiz results and a pie chart for overall quiz results.
+    The charts come from render_quiz_chart, which draws them once per distinct result.
+    
+    
+    :param scores: Pass in the scores of each module
+    :param total: Store the total number of correct answers and total questions
+    :doc-author: Yusuf
+    """
+    if scores is None or total is None:
+        st.write("No quiz results to display.")
+        return
 
     # Display the charts
-    st.pyplot(fig)
+    st.image(render_quiz_chart(scores, total), use_column_width=True)
 
     # Display overall total
     st.write(
-        f"Total correct answers across all modules: {total_correct} out of {total['total_questions']}"
+        f"Total correct answers across all modules: {total['correct_answer_count']} out of {total['total_questions']}"
     )
 
 
@@ -296,7 +506,7 @@ def handle_module_click(index, type):
     :param type: Determine what kind of button is clicked
     :doc-author: Yusuf
     """
-    print(f"INFO: Module {index} clicked")
+    log_info(f"Module {index} clicked")
     index = index + 1
 
     st.session_state["last_module"] = index
@@ -304,7 +514,6 @@ def handle_module_click(index, type):
     if type == "module":
         st.session_state["sidebar_request"] = f"Proceed to module {index}"
     elif type == "quiz":
-        st.session_state["quiz_curriculum_id"] = f"quiz_{index}"
         st.session_state["sidebar_request"] = f"Evaluate me on Module {index}"
     elif type == "analyse":
         st.session_state["sidebar_request"] = "Analyse me"
@@ -318,23 +527,35 @@ def create_conf_buttons():
     :return: A list of user configs
     :doc-author: Yusuf
     """
+    # A session restored from the state backend starts with the config it had
+    restored = st.session_state.get("configs")
+
+    def selected(position, name):
+        options = settings.CONFIG_OPTIONS[name]
+        return options.index(restored[position]) if restored and restored[position] in options else 0
+
     col1, col2, col3, col4, col5 = st.columns(5)
     with col1:
-        depth_option = st.selectbox("🎯Depth", ["Beginner", "Intermediate", "Expert"])
+        depth_option = st.selectbox(
+            "🎯Depth", settings.CONFIG_OPTIONS["depth"], index=selected(0, "depth")
+        )
     with col2:
         style_option = st.selectbox(
-            "🥘Dishes Style",
-            ["All World", "Asian", "European", "American", "South-American", "African"],
+            "🥘Dishes Style", settings.CONFIG_OPTIONS["style"], index=selected(1, "style")
         )
     with col3:
-        time_option = st.selectbox("⏱Time", ["Short", "Medium", "Long"])
+        time_option = st.selectbox(
+            "⏱Time", settings.CONFIG_OPTIONS["time"], index=selected(2, "time")
+        )
     with col4:
         communication_option = st.selectbox(
-            "🗣️Communication", ["Image-Containing", "Text-Only"]
+            "🗣️Communication",
+            settings.CONFIG_OPTIONS["communication"],
+            index=selected(3, "communication"),
         )
     with col5:
         language_option = st.selectbox(
-            "🌐Language", ["English", "Chinese", "Turkish", "German"]
+            "🌐Language", settings.CONFIG_OPTIONS["language"], index=selected(4, "language")
         )
     # user_config = depth_option + ' ' + style_option + ' ' + time_option + ' ' + dish_option + ' ' + communication_option + ' ' + language_option
     user_config = [
@@ -347,18 +568,8 @@ def create_conf_buttons():
 
     if st.session_state.get("last_config") != user_config:
         st.session_state["config_changed"] = True
-        print("USER CONFIG is changed")
-        (
-            depth_option,
-            style_option,
-            time_option,
-            communication_option,
-            language_option,
-        ) = user_config
-        st.session_state.config_prompt = f"""
-            Here is the user configuration: Make sure that the user your generated content is suitable for the following configs:
-                The user is {depth_option} at cooking, user prefers a  dish from {style_option if style_option != 'All World' else 'everywhere so it does not matter'}, user wants to spend a {time_option} time on cooking, and your answer MUST be in {language_option} language.
-        """
+        log_info("USER CONFIG is changed")
+        st.session_state.config_prompt = build_config_prompt(user_config)
         st.session_state["configs"] = user_config
         st.session_state["last_config"] = user_config
     else:
@@ -398,34 +609,39 @@ def on_prompt_button_clicked(prompt):
     # st.chat_input(prompt)
 
 
-def display_images(image_url):
+def display_images(image_id):
     """
-    The display_images function takes a URL to an image and displays it in the Streamlit app.
+    The display_images function takes the id of a stored image and displays it in the Streamlit app.
+    The image is served from the local ImageStore, so it does not expire and is not downloaded from the image API again.
     
     
-    :param image_url: Display the image in the streamlit app
-    :return: An image url
+    :param image_id: Id of the image in the ImageStore
     :doc-author: Yusuf
     """
-    if image_url is None:
+    data = get_image_store().read(image_id) if image_id is not None else None
+    if data is None:
         st.write("No images to display.")
         return
-    print("INFO: Image URL: ", image_url)
-    st.markdown(
-        f"""
-        <style>
-        .img-container {{
-            border-radius: 15px;  # Adjust the radius as needed
-            overflow: hidden;
-        }}
-        .img-container img {{
-            display: block;
-            width: 100%;
-        }}
-        </style>
-        <div class="img-container">
-            <img src="{image_url}" alt="image">
-        </div>
-        """,
-        unsafe_allow_html=True,
-    )
+    st.image(data, use_column_width=True)
+
+
+def display_module_image(message):
+    """
+    The display_module_image function displays the image of a module message, a note while it is still being generated
+    or a note that it could not be generated. Messages from before images were kept in the message look it up by module.
+
+    :param message: The message dictionary with image_module and image_key
+    :doc-author: Yusuf
+    """
+    if "image_key" in message:
+        image_id = message.get("image_id")
+    else:
+        image_ids = st.session_state.get("image_ids") or []
+        module_index = message["image_module"]
+        image_id = image_ids[module_index] if module_index < len(image_ids) else None
+    if message.get("image_error") is not None:
+        st.caption("🖼️ The image of this module could not be generated.")
+    elif image_id is None:
+        st.caption("🖼️ The image of this module is being generated ...")
+    else:
+        display_images(image_id)
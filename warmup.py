@@ -0,0 +1,60 @@
+import importlib
+import threading
+import time
+
+import settings
+from tracing import log_info
+
+# Modules the first page load does not need, in the order a first request needs them
+WARMUP_MODULES = ("memory", "tools", "agent", "langchain.callbacks", "matplotlib.pyplot")
+
+_warmup_thread = None
+_warmup_lock = threading.Lock()
+_warmed = set()
+_warmed_changed = threading.Condition()
+
+
+def _warm_up():
+    started = time.perf_counter()
+    for name in WARMUP_MODULES:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            # The request that needs the module imports it again and reports the error there
+            log_info(f"warm-up of {name} failed: {e}")
+        with _warmed_changed:
+            _warmed.add(name)
+            _warmed_changed.notify_all()
+    log_info(f"warm-up done in {time.perf_counter() - started:.2f}s")
+
+
+def start_warmup():
+    """
+    The start_warmup function imports the modules of the agent stack in a background thread, once per process.
+    The first page load of a session does not need LangChain, so it is painted without it; the warm-up
+    uses the time the user reads the page, and the first request finds the modules imported.
+
+    :doc-author: Yusuf
+    """
+    global _warmup_thread
+    if not settings.WARMUP_ENABLED:
+        return
+    with _warmup_lock:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(target=_warm_up, name="warmup", daemon=True)
+            _warmup_thread.start()
+
+
+def wait_warmup(name):
+    """
+    The wait_warmup function waits until a running warm-up has imported a module (and the ones before it).
+    Code that imports a module of the warm-up calls it first, so a module is never imported by two threads
+    at the same time, and a request does not wait for the modules it does not need.
+
+    :param name: A name of WARMUP_MODULES
+    :doc-author: Yusuf
+    """
+    thread = _warmup_thread
+    if thread is not None:
+        with _warmed_changed:
+            _warmed_changed.wait_for(lambda: name in _warmed or not thread.is_alive())